@@ -1,71 +1,244 @@
+import functools
 import json
 import os
 import re
-import tempfile
-from datetime import datetime
+import time
+import uuid
+from concurrent.futures import CancelledError, as_completed
 
 import streamlit as st
-import dropbox
-from unidecode import unidecode
-
-from prompts import V6_SYSTEM_PROMPT
-try:
-    import pypandoc
-except Exception:
-    pypandoc = None
-
-try:
-    from fpdf import FPDF
-except Exception:
-    FPDF = None
-
-try:
-    from openai import OpenAI
-except Exception:
-    OpenAI = None
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import StopException, get_script_run_ctx
+
+from batch_mode import (
+    BATCH_TERMINAL_STATUSES,
+    batch_status,
+    fetch_batch_results,
+    local_batch_client,
+    submit_batch,
+    write_batch_file,
+)
+from cancellation import (
+    cancel,
+    cancel_session,
+    cancel_stats,
+    collect_stream,
+    current_token,
+    is_cancelled,
+    raise_if_cancelled,
+    release_run,
+    run_token,
+    start_run,
+)
+from cassette import cassette_stats, load_cassette, recording_client, replay_client, request_key
+from digest import DIGEST_TOKEN_BUDGET, rolling_digest, summary_stats
+from document import (
+    build_document,
+    extract_paragraphs,
+    get_analysis_text,
+    markdown_chapters,
+    render_markdown,
+    render_pdf,
+)
+from epub_book import assemble_epub, markdown_to_xhtml
+from export_cache import cache_stats, cached_export, cached_fragments, export_key
+from hedging import hedge_stats, hedged_call, latency_summary
+from instrumentation import connection_metrics, record_stage_call, stage_report, trace_openai_request
+from json_repair import repair_truncated_json
+from pdf_chapters import render_pdf_chapters
+from pipeline import context_executor, detach_script_context, gate, keep_abandoned, run_graph, take_abandoned, task
+from prompts import SUMMARY_SYSTEM_PROMPT, V6_SYSTEM_PROMPT
+from scheduler import model_lane, model_slot, scheduler_stats
+from singleflight import flight_stats, singleflight
+from snapshot import SNAPSHOT_EXTENSION, SNAPSHOT_FIELDS, dump_snapshot, load_snapshot
+from spool import spool_drop_session, spool_exists, spool_open, spool_put, spool_read, spool_usage
+from tracing import chrome_trace, span, start_trace, stop_trace, timeline_rows, traced, write_chrome_trace
 
 
 APP_TITLE = "Pattern Language Machine"
 MODEL_NAME = "gpt-4o"
-
-PDF_CHAR_REPLACEMENTS = {
-    "—": "-",
-    "–": "-",
-    "“": '"',
-    "”": '"',
-    "‘": "'",
-    "’": "'",
-    "…": "...",
-    "•": "-",
+LIGHT_MODEL_NAME = "gpt-4o-mini"
+STAGE_CONFIG = {
+    "subject_scan": {"model": LIGHT_MODEL_NAME, "max_tokens": 800, "timeout": 30, "temperature": 0.4},
+    "short_title": {"model": LIGHT_MODEL_NAME, "max_tokens": 30, "timeout": 15, "temperature": 0.4},
+    "storyline": {"model": LIGHT_MODEL_NAME, "max_tokens": 600, "timeout": 30, "temperature": 0.4},
+    "index": {"model": MODEL_NAME, "max_tokens": 3000, "timeout": 90, "temperature": 0.3},
+    "index_outline": {"model": MODEL_NAME, "max_tokens": 1200, "timeout": 45, "temperature": 0.3},
+    "index_section": {"model": MODEL_NAME, "max_tokens": 900, "timeout": 60, "temperature": 0.3},
+    "sources": {"model": MODEL_NAME, "max_tokens": 1200, "timeout": 60, "temperature": 0.3},
+    "pattern": {"model": MODEL_NAME, "max_tokens": 2500, "timeout": 180, "temperature": 0.4},
+    "batch": {"model": MODEL_NAME, "max_tokens": 12000, "timeout": 420, "temperature": 0.5},
+    "front_matter": {"model": MODEL_NAME, "max_tokens": 1200, "timeout": 60, "temperature": 0.4},
+    "foreword": {"model": MODEL_NAME, "max_tokens": 800, "timeout": 60, "temperature": 0.4},
+    "repair": {"model": LIGHT_MODEL_NAME, "max_tokens": 250, "timeout": 30, "temperature": 0.3},
+    "digest": {"model": LIGHT_MODEL_NAME, "max_tokens": 90, "timeout": 20, "temperature": 0.2},
 }
-
+FIELD_REPAIRS = {
+    "title": ("Geef een evocatieve, tijdloze titel zonder dubbele punt.", 40),
+    "conflict": (
+        "Formuleer The Conflict als één probleemstelling, volledig vetgedrukt tussen ** en ** "
+        "(X wil Y, maar Z maakt Y onmogelijk).",
+        150,
+    ),
+    "resolution": (
+        'Schrijf The Resolution opnieuw: een subtiel, richtinggevend gebod dat letterlijk begint met "Therefore,".',
+        250,
+    ),
+    "sources": ("Geef exact 3 echte, relevante bronnen, elk in het formaat 'Auteur — Titel'.", 120),
+}
+OPENAI_POOL_LIMITS = {"max_connections": 32, "max_keepalive_connections": 16, "keepalive_expiry": 90.0}
+OPENAI_TIMEOUTS = {"connect": 10.0, "read": 180.0, "write": 30.0, "pool": 30.0}
+SOURCES_SHARD_SIZE = 5
+SOURCES_SHARD_RETRIES = 2
+INDEX_PATTERN_COUNT = 20
+INDEX_SECTION_SIZE = 5
+INDEX_SECTION_RETRIES = 2
+INDEX_SCALES = ("Macro", "Meso", "Micro")
+SESSION_BOOK_ID = "sessie"
 
 DROPBOX_APP_KEY = os.getenv("DROPBOX_APP_KEY", "").strip()
 DROPBOX_APP_SECRET = os.getenv("DROPBOX_APP_SECRET", "").strip()
 DROPBOX_REFRESH_TOKEN = os.getenv("DROPBOX_REFRESH_TOKEN", "").strip()
+DROPBOX_CHUNK_BYTES = 8 * 1024 * 1024
+CASSETTE_PATH = os.getenv("PATTERN_CASSETTE", "").strip()
+CASSETTE_MODE = os.getenv("PATTERN_CASSETTE_MODE", "").strip().lower()
+CASSETTE_LATENCY_SCALE = float(os.getenv("PATTERN_CASSETTE_LATENCY_SCALE", "1.0"))
+STREAM_MODEL_CALLS = CASSETTE_MODE not in {"record", "replay"}
+
+
+@functools.cache
+def load_openai():
+    try:
+        from openai import OpenAI
+    except Exception:
+        return None
+    return OpenAI
+
+
+@functools.cache
+def load_fpdf():
+    try:
+        from fpdf import FPDF
+    except Exception:
+        return None
+    return FPDF
+
+
+@functools.cache
+def load_pypandoc():
+    try:
+        import pypandoc
+    except Exception:
+        return None
+    return pypandoc
+
+
+@functools.cache
+def load_pypdf():
+    try:
+        import pypdf
+    except Exception:
+        return None
+    return pypdf
+
+
+@functools.cache
+def load_dropbox():
+    try:
+        import dropbox
+    except Exception:
+        return None
+    return dropbox
+
+
+@st.cache_resource(show_spinner=False)
+def get_shared_client(api_key):
+    OpenAI = load_openai()
+    try:
+        import httpx
+        from openai import DefaultHttpxClient
+    except Exception:
+        return OpenAI(api_key=api_key)
+    http_client = DefaultHttpxClient(
+        limits=httpx.Limits(**OPENAI_POOL_LIMITS),
+        timeout=httpx.Timeout(**OPENAI_TIMEOUTS),
+        event_hooks={"request": [trace_openai_request]},
+    )
+    return OpenAI(api_key=api_key, http_client=http_client)
+
+
+@st.cache_resource
+def get_replay_cassette(path):
+    return load_cassette(path)
 
 
 def get_client():
-    if OpenAI is None:
+    if CASSETTE_MODE == "replay":
+        return replay_client(get_replay_cassette(CASSETTE_PATH), CASSETTE_LATENCY_SCALE)
+    if load_openai() is None:
         raise RuntimeError("OpenAI SDK ontbreekt. Installeer de openai package.")
     api_key = st.secrets.get("OPENAI_API_KEY", "").strip()
     if not api_key:
         raise RuntimeError("OPENAI_API_KEY ontbreekt in Streamlit Secrets.")
-    return OpenAI(api_key=api_key)
+    if CASSETTE_MODE == "record":
+        return recording_client(get_shared_client(api_key), CASSETTE_PATH)
+    return get_shared_client(api_key)
 
 
-def call_openai_json(client, messages, temperature=0.4):
-    response = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=messages,
-        temperature=temperature,
-        response_format={"type": "json_object"},
+def model_session():
+    return st.session_state.get("spool_session") or "proces"
+
+
+def chat_completion_body(messages, stage, max_tokens=None):
+    config = STAGE_CONFIG[stage]
+    return {
+        "model": config["model"],
+        "messages": messages,
+        "temperature": config["temperature"],
+        "max_tokens": max_tokens or config["max_tokens"],
+        "response_format": {"type": "json_object"},
+    }
+
+
+def request_completion(client, body, timeout, token):
+    if token is None or not STREAM_MODEL_CALLS:
+        return client.chat.completions.create(**body, timeout=timeout)
+    stream = client.chat.completions.create(
+        **body, timeout=timeout, stream=True, stream_options={"include_usage": True}
     )
+    if hasattr(stream, "choices"):
+        return stream
+    return collect_stream(stream, token)
+
+
+def create_chat_completion(client, messages, stage, max_tokens=None):
+    config = STAGE_CONFIG[stage]
+    body = chat_completion_body(messages, stage, max_tokens)
+    token = current_token()
+    cancelled = token["event"] if token else None
+
+    session = token["session"] if token else model_session()
+
+    def call():
+        with model_slot(session, "bulk" if stage == "batch" else None, cancelled):
+            raise_if_cancelled(token)
+            started = time.perf_counter()
+            with span(f"openai:{stage}", model=config["model"]):
+                response = request_completion(client, body, config["timeout"], token)
+        record_stage_call(stage, time.perf_counter() - started, response)
+        return response
+
+    return singleflight(request_key(body), call, cancelled)
+
+
+def call_openai_json(client, messages, stage, max_tokens=None):
+    response = create_chat_completion(client, messages, stage, max_tokens=max_tokens)
     raw_content = response.choices[0].message.content
     st.session_state.last_raw_ai_output = raw_content
     return json.loads(raw_content)
 
 
+@traced
 def generate_index(client, topic: str, subject_scan=None, storyline=None):
     messages = [
         {"role": "system", "content": V6_SYSTEM_PROMPT},
@@ -92,17 +265,207 @@ def generate_index(client, topic: str, subject_scan=None, storyline=None):
             ),
         },
     ]
-    data = call_openai_json(client, messages, temperature=0.3)
+    data = call_openai_json(client, messages, "index")
     index = data.get("index", [])
     if len(index) != 20:
         raise ValueError("Index is niet precies 20 patronen.")
+    warn_short_index_descriptions(index)
+    return data
+
+
+def warn_short_index_descriptions(index):
     for item in index:
         description = (item.get("description") or "").strip()
         if not description or len(description.split()) < 6:
             st.warning("Index beschrijving is erg kort; verwacht mogelijk minder sturing.")
-    return data
 
 
+def index_scale_counts(count):
+    macro = max(1, round(count / 4))
+    return {"Macro": macro, "Meso": macro, "Micro": count - 2 * macro}
+
+
+def index_outline_plan(count, section_size=INDEX_SECTION_SIZE):
+    plan = []
+    for scale, total in index_scale_counts(count).items():
+        sections = -(-total // section_size)
+        for i in range(sections):
+            plan.append({"scale": scale, "size": total // sections + (i < total % sections)})
+    return plan
+
+
+def title_key(title):
+    return re.sub(r"\W+", " ", (title or "").casefold()).strip()
+
+
+def duplicate_index_titles(index):
+    seen = {}
+    duplicates = []
+    for item in index:
+        key = title_key(item["title"])
+        if key in seen:
+            duplicates.append((seen[key], item["number"]))
+        else:
+            seen[key] = item["number"]
+    return duplicates
+
+
+def number_index_sections(sections):
+    index = []
+    for section in sections:
+        section["numbers"] = []
+        for entry in section["entries"]:
+            number = len(index) + 1
+            section["numbers"].append(number)
+            index.append({"number": number, "title": entry["title"], "scale": section["scale"],
+                          "description": entry["description"]})
+    return index
+
+
+def validate_index_outline(data, plan):
+    items = data.get("sections")
+    if not isinstance(items, list):
+        raise ValueError("Secties ontbreken in de index-outline.")
+    by_scale = {scale: [] for scale in INDEX_SCALES}
+    for item in items:
+        if isinstance(item, dict) and item.get("scale") in by_scale and (item.get("theme") or "").strip():
+            by_scale[item["scale"]].append(item)
+    sections = []
+    for section in plan:
+        if not by_scale[section["scale"]]:
+            raise ValueError(f"Te weinig {section['scale']}-secties in de index-outline.")
+        item = by_scale[section["scale"]].pop(0)
+        sections.append(dict(section, theme=item["theme"].strip(), focus=(item.get("focus") or "").strip()))
+    return sections
+
+
+@traced
+def generate_index_outline(client, topic: str, subject_scan, storyline, plan):
+    wanted = {scale: sum(1 for section in plan if section["scale"] == scale) for scale in INDEX_SCALES}
+    messages = [
+        {"role": "system", "content": V6_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": (
+                "Stap 2a — Index-outline: verdeel de patroontaal in thematische secties per schaal.\n"
+                f"Lever exact {wanted['Macro']} Macro-, {wanted['Meso']} Meso- en "
+                f"{wanted['Micro']} Micro-secties, geordend van abstract (Macro) naar concreet (Micro).\n"
+                "Elke sectie krijgt een kort thema en één zin focus; secties overlappen niet.\n"
+                f"Gebruik deze geselecteerde spanningsassen als basis: "
+                f"{json.dumps(subject_scan or [], ensure_ascii=False)}\n"
+                f"Gebruik deze Macro/Meso/Micro verhaallijn als kader: "
+                f"{json.dumps(storyline or {}, ensure_ascii=False)}\n"
+                "Output als JSON met deze velden:\n"
+                "{"
+                '"subject_scan": "...", '
+                '"sections": ['
+                '{"scale": "Macro|Meso|Micro", "theme": "...", "focus": "..."}'
+                "]}\n"
+                f"Onderwerp: {topic}"
+            ),
+        },
+    ]
+    data = call_openai_json(client, messages, "index_outline")
+    return data.get("subject_scan", ""), validate_index_outline(data, plan)
+
+
+def validate_index_section(data, size):
+    items = data.get("index")
+    if not isinstance(items, list):
+        raise ValueError("Indexitems ontbreken in de sectie-output.")
+    entries = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        title = (item.get("title") or "").strip()
+        description = (item.get("description") or "").strip()
+        if title and description and ":" not in title:
+            entries.append({"title": title, "description": description})
+    if len(entries) < size:
+        raise ValueError(f"Sectie levert {len(entries)} van de {size} geldige patronen.")
+    return entries[:size]
+
+
+@traced
+def generate_index_section(client, topic: str, storyline, section, sections, avoid=(),
+                           retries=INDEX_SECTION_RETRIES):
+    others = [other["theme"] for other in sections if other is not section]
+    avoid_line = (
+        f"Deze titels bestaan al en mogen niet terugkomen: {json.dumps(sorted(avoid), ensure_ascii=False)}\n"
+        if avoid
+        else ""
+    )
+    messages = [
+        {"role": "system", "content": V6_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": (
+                f"Stap 2b — Werk één indexsectie uit tot exact {section['size']} patronen "
+                f"op schaal {section['scale']}.\n"
+                "Laat het schaallabel niet zichtbaar zijn in de titels of beschrijvingen.\n"
+                "Titels: kort, krachtig en beeldend. Geen dubbele punten.\n"
+                "Descriptions: korte samenvatting per patroon (1–2 zinnen).\n"
+                f"Sectiethema: {section['theme']}\n"
+                f"Focus: {section['focus']}\n"
+                f"Andere secties (vermijd overlap): {json.dumps(others, ensure_ascii=False)}\n"
+                f"{avoid_line}"
+                f"Verhaallijn: {json.dumps(storyline or {}, ensure_ascii=False)}\n"
+                "Output als JSON met schema:\n"
+                '{"index": [{"title": "...", "description": "..."}]}\n'
+                f"Onderwerp: {topic}"
+            ),
+        },
+    ]
+    last_exc = None
+    for _ in range(retries + 1):
+        try:
+            return validate_index_section(call_openai_json(client, messages, "index_section"), section["size"])
+        except (ValueError, AttributeError) as exc:
+            last_exc = exc
+    raise last_exc
+
+
+def expand_index_sections(client, topic, storyline, sections, targets, avoid=()):
+    failures = []
+    with context_executor(max_workers=len(targets) or 1) as executor:
+        futures = {
+            executor.submit(generate_index_section, client, topic, storyline, section, sections, avoid): section
+            for section in targets
+        }
+        for future in as_completed(futures):
+            try:
+                futures[future]["entries"] = future.result()
+            except Exception as exc:
+                failures.append(f"{futures[future]['theme']}: {exc}")
+    if failures:
+        raise ValueError(" ".join(failures))
+
+
+@traced
+def generate_index_hierarchical(client, topic: str, subject_scan=None, storyline=None,
+                                count=INDEX_PATTERN_COUNT, section_size=INDEX_SECTION_SIZE):
+    scan, sections = generate_index_outline(
+        client, topic, subject_scan, storyline, index_outline_plan(count, section_size)
+    )
+    expand_index_sections(client, topic, storyline, sections, sections)
+    index = number_index_sections(sections)
+    for _ in range(INDEX_SECTION_RETRIES):
+        duplicates = {number for _, number in duplicate_index_titles(index)}
+        if not duplicates:
+            break
+        targets = [section for section in sections if duplicates & set(section["numbers"])]
+        redo = {number for section in targets for number in section["numbers"]}
+        keep = {item["title"] for item in index if item["number"] not in redo}
+        expand_index_sections(client, topic, storyline, sections, targets, keep)
+        index = number_index_sections(sections)
+    duplicates = duplicate_index_titles(index)
+    if duplicates:
+        raise ValueError(f"Dubbele titels in de index: {duplicates}.")
+    warn_short_index_descriptions(index)
+    return {"subject_scan": scan, "index": index}
+
+
+@traced
 def generate_subject_scan(client, topic: str):
     messages = [
         {"role": "system", "content": V6_SYSTEM_PROMPT},
@@ -116,13 +479,14 @@ def generate_subject_scan(client, topic: str):
             ),
         },
     ]
-    data = call_openai_json(client, messages, temperature=0.4)
+    data = call_openai_json(client, messages, "subject_scan")
     scan = data.get("subject_scan", [])
     if not isinstance(scan, list) or len(scan) != 10:
         raise ValueError("Onderwerp-scan moet exact 10 observaties bevatten.")
     return scan
 
 
+@traced
 def generate_storyline(client, topic: str, subject_scan):
     messages = [
         {"role": "system", "content": V6_SYSTEM_PROMPT},
@@ -137,7 +501,7 @@ def generate_storyline(client, topic: str, subject_scan):
             ),
         },
     ]
-    data = call_openai_json(client, messages, temperature=0.4)
+    data = call_openai_json(client, messages, "storyline")
     macro = (data.get("macro") or "").strip()
     meso = (data.get("meso") or "").strip()
     micro = (data.get("micro") or "").strip()
@@ -146,13 +510,60 @@ def generate_storyline(client, topic: str, subject_scan):
     return {"macro": macro, "meso": meso, "micro": micro}
 
 
-def generate_sources_for_index(client, topic: str, index_entries, storyline):
+def scale_for_number(number):
+    if number <= 5:
+        return "Macro"
+    if number <= 10:
+        return "Meso"
+    return "Micro"
+
+
+def source_shards(numbers, shard_size=SOURCES_SHARD_SIZE):
+    numbers = sorted(numbers)
+    if not shard_size:
+        shards = []
+        for number in numbers:
+            if shards and scale_for_number(shards[-1][-1]) == scale_for_number(number):
+                shards[-1].append(number)
+            else:
+                shards.append([number])
+        return shards
+    return [numbers[i:i + shard_size] for i in range(0, len(numbers), shard_size)]
+
+
+def validate_sources_shard(data, shard_numbers):
+    items = data.get("sources", [])
+    if not isinstance(items, list):
+        raise ValueError("Bronnenlijst ontbreekt in de AI-output.")
+    sources_by_number = {}
+    for item in items:
+        if not isinstance(item, dict) or item.get("number") not in shard_numbers:
+            continue
+        sources = item.get("sources")
+        if (
+            isinstance(sources, list)
+            and len(sources) == 3
+            and all(isinstance(source, str) and source.strip() for source in sources)
+        ):
+            sources_by_number[item["number"]] = [source.strip() for source in sources]
+    missing = [number for number in shard_numbers if number not in sources_by_number]
+    if missing:
+        raise ValueError(f"Bronnen ontbreken of zijn ongeldig voor patroon {missing}.")
+    return sources_by_number
+
+
+@traced
+def generate_sources_shard(client, topic: str, index_entries, storyline, shard_numbers,
+                           retries=SOURCES_SHARD_RETRIES):
+    shard_entries = [item for item in index_entries if item["number"] in shard_numbers]
     messages = [
         {"role": "system", "content": V6_SYSTEM_PROMPT},
         {
             "role": "user",
             "content": (
                 "Stap 3 — Bronnen: kies exact 3 gezaghebbende bronnen per patroon.\n"
+                f"Lever exact {len(shard_entries)} items, voor de patroonnummers "
+                f"{[item['number'] for item in shard_entries]}.\n"
                 "Output als JSON met schema:\n"
                 "{"
                 '"sources": ['
@@ -160,19 +571,25 @@ def generate_sources_for_index(client, topic: str, index_entries, storyline):
                 "]}\n"
                 f"Onderwerp: {topic}\n"
                 f"Verhaallijn: {json.dumps(storyline or {}, ensure_ascii=False)}\n"
-                f"Index (titels + descriptions): {json.dumps(index_entries, ensure_ascii=False)}"
+                f"Index (titels + descriptions): {json.dumps(shard_entries, ensure_ascii=False)}"
             ),
         },
     ]
-    data = call_openai_json(client, messages, temperature=0.3)
-    sources = data.get("sources", [])
-    if not isinstance(sources, list) or len(sources) != 20:
-        raise ValueError("Bronnenlijst moet 20 items bevatten.")
-    return {item["number"]: item["sources"] for item in sources}
+    last_exc = None
+    for _ in range(retries + 1):
+        try:
+            data = call_openai_json(client, messages, "sources")
+            return validate_sources_shard(data, shard_numbers)
+        except (ValueError, AttributeError) as exc:
+            last_exc = exc
+    raise last_exc
 
 
-def generate_pattern_single(client, topic, index_item, sources, storyline, subject_scan):
-    messages = [
+def pattern_messages(topic, index_item, sources, storyline, subject_scan, context=None):
+    context_line = (
+        f"Eerdere patronen (digest; bouw hierop voort, herhaal ze niet):\n{context}\n" if context else ""
+    )
+    return [
         {"role": "system", "content": V6_SYSTEM_PROMPT},
         {
             "role": "user",
@@ -195,12 +612,15 @@ def generate_pattern_single(client, topic, index_item, sources, storyline, subje
                 "}\n"
                 f"Verhaallijn: {json.dumps(storyline or {}, ensure_ascii=False)}\n"
                 f"Spanningsassen: {json.dumps(subject_scan or [], ensure_ascii=False)}\n"
+                f"{context_line}"
                 f"Indexitem (titel + description): {json.dumps(index_item, ensure_ascii=False)}\n"
                 f"Bronnen (verplicht): {json.dumps(sources, ensure_ascii=False)}"
             ),
         },
     ]
-    data = call_openai_json(client, messages, temperature=0.4)
+
+
+def pattern_from_response(data, index_item):
     pattern = data.get("pattern")
     if not pattern and "patterns" in data and isinstance(data.get("patterns"), list):
         for item in data.get("patterns", []):
@@ -213,11 +633,19 @@ def generate_pattern_single(client, topic, index_item, sources, storyline, subje
         raise ValueError("Patroon ontbreekt in de AI-output.")
     if pattern.get("number") != index_item.get("number"):
         pattern["number"] = index_item.get("number")
+    return pattern
+
+
+@traced
+def generate_pattern_single(client, topic, index_item, sources, storyline, subject_scan, context=None):
+    messages = pattern_messages(topic, index_item, sources, storyline, subject_scan, context)
+    pattern = pattern_from_response(call_openai_json(client, messages, "pattern"), index_item)
     if not (index_item.get("description") or "").strip():
         st.warning("Index description ontbreekt; patroon kan drift vertonen.")
     return pattern
 
 
+@traced
 def generate_short_title(client, topic: str):
     messages = [
         {"role": "system", "content": V6_SYSTEM_PROMPT},
@@ -230,20 +658,26 @@ def generate_short_title(client, topic: str):
             ),
         },
     ]
-    data = call_openai_json(client, messages, temperature=0.4)
+    data = call_openai_json(client, messages, "short_title")
     title = (data.get("title") or "").strip()
     if not title:
         raise ValueError("Korte titel ontbreekt in de AI-output.")
     return title
 
 
-def generate_batch(client, topic: str, index_entries, batch_numbers, retry_note=None):
+@traced
+def generate_batch(client, topic: str, index_entries, batch_numbers, retry_note=None, sources_by_number=None,
+                   storyline=None, subject_scan=None, context=None):
     batch_list = [p for p in index_entries if p["number"] in batch_numbers]
     total_patterns = 20
     expected_count = len(batch_list)
     retry_suffix = ""
     if retry_note:
         retry_suffix = f"\n{retry_note}"
+    context_line = (
+        f"Eerdere patronen (digest; bouw hierop voort, herhaal ze niet):\n{context}\n" if context else ""
+    )
+
     def phase_info(number):
         if number <= 5:
             return "Macro", "filosofie, context en het grote plaatje"
@@ -254,12 +688,19 @@ def generate_batch(client, topic: str, index_entries, batch_numbers, retry_note=
     per_pattern_instructions = []
     for item in batch_list:
         phase_label, phase_desc = phase_info(item["number"])
+        sources = (sources_by_number or {}).get(item["number"])
+        source_instruction = (
+            f"Gebruik exact deze 3 bronnen: {json.dumps(sources, ensure_ascii=False)}\n\n"
+            if sources
+            else f"Zoek eerst 3 gezaghebbende bronnen die passen bij dit onderwerp en de huidige fase "
+            f"({phase_label}).\n\n"
+        )
         per_pattern_instructions.append(
             (
                 f"Schrijf nu Patroon {item['number']} van de {total_patterns}.\n\n"
                 f"Onderwerp: {item['title']} Fase: {phase_label} (Focus op {phase_desc})\n\n"
                 "Instructies voor deze run:\n\n"
-                f"Zoek eerst 3 gezaghebbende bronnen die passen bij dit onderwerp en de huidige fase ({phase_label}).\n\n"
+                f"{source_instruction}"
                 "Schrijf de Deep Analysis: exact 3 paragrafen, minimaal 300 woorden totaal. "
                 "Verwerk per paragraaf één bron.\n\n"
                 "Hanteer de 'Anonieme Autoriteit': geen bronvermeldingen of auteursnamen in de tekst zelf.\n\n"
@@ -268,6 +709,12 @@ def generate_batch(client, topic: str, index_entries, batch_numbers, retry_note=
                 "Lever de output als valide JSON binnen de afgesproken velden.\n"
             )
         )
+    instructions_text = "\n---\n".join(per_pattern_instructions)
+    search_line = (
+        "Gebruik per patroon exact de gegeven bronnen en noem ze alleen in de lijst onderaan.\n"
+        if sources_by_number
+        else "Zoek eerst 3 relevante boeken/titels bij dit specifieke onderwerp voordat je begint met schrijven.\n"
+    )
     messages = [
         {"role": "system", "content": V6_SYSTEM_PROMPT},
         {
@@ -276,8 +723,7 @@ def generate_batch(client, topic: str, index_entries, batch_numbers, retry_note=
                 "Schrijf de volledige patronen voor de volgende indexitems.\n"
                 "Volg de system prompt letterlijk en strikt.\n"
                 "Verweef de bronnen inhoudelijk in de analyse (geen losse bronvermelding).\n"
-                "Zoek eerst 3 relevante boeken/titels bij dit specifieke onderwerp voordat je "
-                "begint met schrijven.\n"
+                f"{search_line}"
                 "BELANGRIJK: Scheid de 3 paragrafen van de Deep Analysis ALTIJD met een lege regel, "
                 "zodat ze technisch herkenbaar zijn als 3 blokken.\n"
                 "Schrijf compact en precies; analyseer de bronnen diepgaand.\n"
@@ -287,7 +733,7 @@ def generate_batch(client, topic: str, index_entries, batch_numbers, retry_note=
                 "Gebruik deze indeling: 1-5 = Macro, 6-10 = Meso, 11-20 = Micro.\n"
                 "\n"
                 "Dynamische instructies per patroon:\n"
-                f"{'\n---\n'.join(per_pattern_instructions)}\n"
+                f"{instructions_text}\n"
                 f"Je MOET exact {expected_count} patronen teruggeven, één voor elk indexitem.\n"
                 f"Indexitem nummers: {[item['number'] for item in batch_list]}\n"
                 "Output als JSON met dit schema:\n"
@@ -312,57 +758,70 @@ def generate_batch(client, topic: str, index_entries, batch_numbers, retry_note=
                 "opdracht mislukt.\n"
                 f"Onderwerp: {topic}\n"
                 f"Totaal patronen: {total_patterns}\n"
+                f"Verhaallijn: {json.dumps(storyline or {}, ensure_ascii=False)}\n"
+                f"Spanningsassen: {json.dumps(subject_scan or [], ensure_ascii=False)}\n"
+                f"{context_line}"
                 f"Indexitems: {json.dumps(batch_list, ensure_ascii=False)}"
                 f"{retry_suffix}"
             ),
         },
     ]
-    response = client.chat.completions.create(
-        model=MODEL_NAME,
-        messages=messages,
-        temperature=0.5,
-        response_format={"type": "json_object"},
-    )
+    response = create_chat_completion(client, messages, "batch")
     raw_content = response.choices[0].message.content
     st.session_state.last_raw_ai_output = raw_content
-    try:
-        data = json.loads(raw_content)
-    except json.JSONDecodeError:
-        print("RAW AI OUTPUT (JSON decode failed):\n", raw_content)
-        data = {}
-    patterns = data.get("patterns", [])
-    if not isinstance(patterns, list) or not patterns:
+    expected_numbers = [item["number"] for item in batch_list]
+    patterns, missing = salvage_patterns(raw_content, expected_numbers)
+    if not patterns:
         fallback = extract_patterns_from_text(raw_content)
         if fallback:
             patterns = fallback
-        else:
-            print("RAW AI OUTPUT (no patterns parsed):\n", raw_content)
-    if retry_note is None and len(patterns) < expected_count:
-        return generate_batch(
-            client,
-            topic,
-            index_entries,
-            batch_numbers,
-            retry_note=(
-                f"Je gaf {len(patterns)} patronen terug. "
-                f"Lever nu exact {expected_count} patronen, één per indexitemnummer."
-            ),
-        )
-    if retry_note is None and any(is_incomplete_pattern(p) for p in patterns):
-        return generate_batch(
+            found = {pattern.get("number") for pattern in fallback}
+            missing = [number for number in expected_numbers if number not in found]
+    normalizations = {}
+    for pattern in patterns:
+        _, fired = normalize_pattern(pattern)
+        if fired:
+            normalizations[pattern.get("number")] = fired
+    incomplete = [pattern.get("number") for pattern in patterns if is_incomplete_pattern(pattern)]
+    retry_numbers = sorted(set(missing) | set(incomplete))
+    if retry_note is None and retry_numbers:
+        notes = []
+        if missing:
+            notes.append(
+                f"Je gaf {expected_count - len(missing)} van de {expected_count} patronen volledig terug. "
+                f"Lever nu alleen de patronen {missing}, één per indexitemnummer."
+            )
+        if incomplete:
+            notes.append(
+                f"De vorige output voor patronen {incomplete} miste analysis-tekst of echte bronnen. "
+                "Vul analysis met precies 3 paragrafen en geef 3 echte bronnen. "
+                "Gebruik geen placeholders."
+            )
+        retried, retried_normalizations = generate_batch(
             client,
             topic,
             index_entries,
-            batch_numbers,
-            retry_note=(
-                "De vorige output miste analysis-tekst of echte bronnen. "
-                "Vul analysis met precies 3 paragrafen en geef 3 echte bronnen. "
-                "Gebruik geen placeholders."
-            ),
+            retry_numbers,
+            retry_note=" ".join(notes),
+            sources_by_number=sources_by_number,
+            storyline=storyline,
+            subject_scan=subject_scan,
+            context=context,
         )
-    return patterns
-
-
+        by_number = {pattern.get("number"): pattern for pattern in patterns}
+        for pattern in retried:
+            number = pattern.get("number")
+            current = by_number.get(number)
+            if current is None or is_incomplete_pattern(current):
+                by_number[number] = pattern
+                normalizations.pop(number, None)
+                if number in retried_normalizations:
+                    normalizations[number] = retried_normalizations[number]
+        return sorted(by_number.values(), key=lambda p: p.get("number") or 0), normalizations
+    return patterns, normalizations
+
+
+@traced
 def generate_front_matter(client, topic: str, index_entries):
     messages = [
         {"role": "system", "content": V6_SYSTEM_PROMPT},
@@ -382,9 +841,10 @@ def generate_front_matter(client, topic: str, index_entries):
             ),
         },
     ]
-    return call_openai_json(client, messages, temperature=0.4)
+    return call_openai_json(client, messages, "front_matter")
 
 
+@traced
 def generate_foreword_from_pattern(client, topic: str, pattern):
     messages = [
         {"role": "system", "content": V6_SYSTEM_PROMPT},
@@ -400,87 +860,30 @@ def generate_foreword_from_pattern(client, topic: str, pattern):
             ),
         },
     ]
-    data = call_openai_json(client, messages, temperature=0.4)
+    data = call_openai_json(client, messages, "foreword")
     return (data.get("foreword") or "").strip()
 
 
-def assemble_markdown(topic, index_data, patterns, front_matter):
-    lines = []
-    lines.append(f"# {topic}")
-    lines.append("")
-    lines.append(front_matter["foreword"])
-    lines.append("")
-    lines.append("## Leesinstructies")
-    for i, text in enumerate(front_matter["reading_instructions"], start=1):
-        lines.append(f"Leesinstructie {i}: {text}")
-        lines.append("")
-    lines.append("## Index van patronen")
-    for item in index_data["index"]:
-        lines.append(
-            f"{item['number']}. {item['title']} — {item['description']}"
-        )
-        lines.append("")
-    lines.append("## Patronen")
-    for number in range(1, 21):
-        pattern = patterns[number]
-        lines.append(f"## {pattern['number']}. {pattern['title']} ({pattern['scale']})")
-        lines.append("")
-        lines.append(pattern["conflict"].strip())
-        lines.append("")
-        for paragraph in extract_paragraphs(get_analysis_text(pattern)):
-            lines.append(paragraph.strip())
-            lines.append("")
-        lines.append(pattern["resolution"].strip())
-        lines.append("")
-        sources_text = "; ".join(pattern["sources"])
-        lines.append(f"Bronnen: {sources_text}")
-        lines.append("")
-    lines.append("## Nawoord")
-    lines.append(front_matter["afterword"])
-    lines.append("")
-    return "\n".join(lines)
-
-
-def assemble_markdown_from_patterns(topic, patterns):
-    lines = []
-    lines.append(f"# {topic}")
-    lines.append("")
-    lines.append("## Patronen")
-    for number in sorted(patterns.keys()):
-        pattern = patterns[number]
-        lines.append(
-            f"## {pattern.get('number', '?')}. {pattern.get('title', 'Niet gegenereerd')} "
-            f"({pattern.get('scale', '')})"
-        )
-        lines.append("")
-        lines.append(pattern.get("conflict", "Niet gegenereerd").strip())
-        lines.append("")
-        for paragraph in extract_paragraphs(get_analysis_text(pattern)):
-            lines.append(paragraph.strip())
-            lines.append("")
-        lines.append(pattern.get("resolution", "Niet gegenereerd").strip())
-        lines.append("")
-        sources_text = "; ".join(pattern.get("sources") or [])
-        lines.append(f"Bronnen: {sources_text if sources_text else 'Niet gegenereerd'}")
-        lines.append("")
-    return "\n".join(lines)
-
-
-def extract_paragraphs(paragraphs_value):
-    if isinstance(paragraphs_value, list):
-        return [p for p in (p.strip() for p in paragraphs_value) if p]
-    if isinstance(paragraphs_value, str):
-        return [p for p in (p.strip() for p in paragraphs_value.split("\n\n")) if p]
-    return []
-
-
-def get_analysis_text(pattern):
-    if "analysis" in pattern and pattern.get("analysis"):
-        return pattern.get("analysis", "")
-    paragraphs = pattern.get("paragraphs", [])
-    if isinstance(paragraphs, list):
-        return "\n\n".join(paragraphs)
-    return paragraphs or ""
+@traced
+def generate_pattern_summary(client, pattern):
+    excerpt = {key: pattern.get(key) for key in ("title", "conflict", "resolution")}
+    messages = [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": (
+                "Vat dit patroon samen in één zin van maximaal 35 woorden: het kernconflict en de richting "
+                "van de resolution. Geen titel herhalen.\n"
+                'Output als JSON: {"summary": "..."}\n'
+                f"Patroon: {json.dumps(excerpt, ensure_ascii=False)}"
+            ),
+        },
+    ]
+    data = call_openai_json(client, messages, "digest")
+    summary = (data.get("summary") or "").strip()
+    if not summary:
+        raise ValueError("Samenvatting ontbreekt in de AI-output.")
+    return summary
 
 
 def is_incomplete_pattern(pattern):
@@ -516,8 +919,8 @@ def extract_patterns_from_text(raw_text):
         conflict_match = re.search(r"(\*\*.+?\*\*)", block, re.DOTALL)
         conflict = conflict_match.group(1).strip() if conflict_match else ""
         resolution_match = re.search(
-            r"(?:^|\n)\s*(?:#\s*)?Resolution[:\s]*([^\n]+)|"
-            r"(?:^|\n)\s*(Therefore,[^\n]+)",
+            r"(?:^|\n)[^\S\n]*(?:#\s*)?Resolution[:\s]*([^\n]+)|"
+            r"(?:^|\n)[^\S\n]*(Therefore,[^\n]+)",
             block,
             re.IGNORECASE,
         )
@@ -546,29 +949,170 @@ def extract_patterns_from_text(raw_text):
     return patterns
 
 
-def validate_pattern(pattern):
+@traced
+def salvage_patterns(raw_text, expected_numbers):
+    data, truncated_path = repair_truncated_json(raw_text)
+    partial_index = None
+    if isinstance(data, dict):
+        items = data.get("patterns", [])
+        if truncated_path and truncated_path[0] == "patterns" and len(truncated_path) > 1:
+            partial_index = truncated_path[1]
+    elif isinstance(data, list):
+        items = data
+        if truncated_path:
+            partial_index = truncated_path[0]
+    else:
+        items = []
+    if not isinstance(items, list):
+        items = []
+    by_number = {}
+    for position, item in enumerate(items):
+        if position == partial_index or not isinstance(item, dict):
+            continue
+        if item.get("number") not in expected_numbers or item["number"] in by_number:
+            continue
+        if not all(item.get(field) for field in ("title", "conflict", "resolution", "sources")):
+            continue
+        if not get_analysis_text(item).strip():
+            continue
+        by_number[item["number"]] = item
+    patterns = [by_number[number] for number in expected_numbers if number in by_number]
+    missing = [number for number in expected_numbers if number not in by_number]
+    return patterns, missing
+
+
+RESOLUTION_PREFIX_RE = re.compile(r"^(?:therefore|daarom|dus|derhalve)\b[\s,:;—–-]*", re.IGNORECASE)
+SOURCE_DASH_RE = re.compile(r"\s+(?:-{1,2}|–)\s+")
+
+
+@traced
+def normalize_pattern(pattern):
+    fired = []
+    title = (pattern.get("title") or "").strip()
+    if ":" in title:
+        head, _, tail = title.partition(":")
+        title = f"{head.strip()} — {tail.strip()}" if tail.strip() else head.strip()
+        title = title.replace(":", "")
+        pattern["title"] = title
+        fired.append("title_colon")
+    conflict = (pattern.get("conflict") or "").strip()
+    if conflict and not (conflict.startswith("**") and conflict.endswith("**")):
+        pattern["conflict"] = f"**{conflict.replace('**', '').strip('*').strip()}**"
+        fired.append("conflict_bold")
+    resolution = (pattern.get("resolution") or "").strip()
+    if resolution and not resolution.startswith("Therefore,"):
+        body = RESOLUTION_PREFIX_RE.sub("", resolution, count=1)
+        if body != resolution and not body[1:2].isupper():
+            body = f"{body[:1].lower()}{body[1:]}"
+        pattern["resolution"] = f"Therefore, {body}"
+        fired.append("resolution_therefore")
+    analysis = pattern.get("analysis")
+    if isinstance(analysis, str) and len(extract_paragraphs(analysis)) != 3:
+        lines = [line.strip() for line in analysis.splitlines() if line.strip()]
+        if len(lines) == 3:
+            pattern["analysis"] = "\n\n".join(lines)
+            fired.append("analysis_paragraphs")
+    sources = pattern.get("sources")
+    if isinstance(sources, str):
+        sources = [source.strip() for source in sources.split(";") if source.strip()]
+        pattern["sources"] = sources
+        fired.append("sources_list")
+    if isinstance(sources, list):
+        fixed = []
+        for source in sources:
+            source = str(source).strip()
+            if "—" not in source and SOURCE_DASH_RE.search(source):
+                source = SOURCE_DASH_RE.sub(" — ", source, count=1)
+                if "source_dash" not in fired:
+                    fired.append("source_dash")
+            fixed.append(source)
+        pattern["sources"] = fixed
+    return pattern, fired
+
+
+def collect_pattern_defects(pattern):
+    defects = []
     title = pattern.get("title", "").strip()
     if not title or ":" in title:
-        raise ValueError("Titel moet beeldend zijn en geen dubbele punt bevatten.")
+        defects.append(("title", "Titel moet beeldend zijn en geen dubbele punt bevatten."))
     conflict = pattern.get("conflict", "").strip()
     if not (conflict.startswith("**") and conflict.endswith("**")):
-        raise ValueError("The Conflict moet vetgedrukt zijn en één probleemstelling bevatten.")
-    analysis_text = get_analysis_text(pattern)
-    paragraphs = extract_paragraphs(analysis_text)
+        defects.append(("conflict", "The Conflict moet vetgedrukt zijn en één probleemstelling bevatten."))
+    paragraphs = extract_paragraphs(get_analysis_text(pattern))
     if len(paragraphs) != 3:
-        raise ValueError("The Deep Analysis moet exact 3 paragrafen bevatten.")
+        defects.append(("analysis", "The Deep Analysis moet exact 3 paragrafen bevatten."))
     total_words = sum(len(p.split()) for p in paragraphs)
     if total_words < 300:
-        raise ValueError("The Deep Analysis moet minimaal 300 woorden bevatten.")
+        defects.append(("analysis", "The Deep Analysis moet minimaal 300 woorden bevatten."))
     resolution = pattern.get("resolution", "").strip()
     if not resolution.startswith("Therefore,"):
-        raise ValueError('The Resolution moet starten met "Therefore,".')
+        defects.append(("resolution", 'The Resolution moet starten met "Therefore,".'))
     sources = pattern.get("sources", [])
     if len(sources) != 3:
-        raise ValueError("Er moeten exact 3 bronnen zijn.")
-    for source in sources:
-        if "—" not in source:
-            raise ValueError("Bronnen moeten het formaat 'Auteur — Titel' volgen.")
+        defects.append(("sources", "Er moeten exact 3 bronnen zijn."))
+    if any("—" not in source for source in sources):
+        defects.append(("sources", "Bronnen moeten het formaat 'Auteur — Titel' volgen."))
+    return defects
+
+
+def validate_pattern(pattern):
+    defects = collect_pattern_defects(pattern)
+    if defects:
+        raise ValueError(defects[0][1])
+
+
+@traced
+def repair_pattern_field(client, topic: str, pattern, field, problems):
+    instruction, max_tokens = FIELD_REPAIRS[field]
+    context = {key: value for key, value in pattern.items() if key != field}
+    messages = [
+        {"role": "system", "content": V6_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": (
+                f"Herstel uitsluitend het veld '{field}' van het onderstaande patroon.\n"
+                f"{instruction}\n"
+                f"Problemen: {'; '.join(problems)}\n"
+                f"Huidige waarde: {json.dumps(pattern.get(field), ensure_ascii=False)}\n"
+                'Output als JSON: {"value": ...}\n'
+                f"Onderwerp: {topic}\n"
+                f"Patroon: {json.dumps(context, ensure_ascii=False)}"
+            ),
+        },
+    ]
+    data = call_openai_json(client, messages, "repair", max_tokens=max_tokens)
+    value = data.get("value")
+    if field == "sources":
+        if not isinstance(value, list):
+            raise ValueError("Bronnen ontbreken in de herstel-output.")
+        return [str(source).strip() for source in value]
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f"Veld '{field}' ontbreekt in de herstel-output.")
+    return value.strip()
+
+
+@traced
+def repair_pattern(client, topic: str, pattern):
+    problems_by_field = {}
+    for field, message in collect_pattern_defects(pattern):
+        if field in FIELD_REPAIRS:
+            problems_by_field.setdefault(field, []).append(message)
+    if not problems_by_field:
+        return pattern
+    repaired = dict(pattern)
+    with context_executor(max_workers=len(problems_by_field)) as executor:
+        futures = {
+            field: executor.submit(repair_pattern_field, client, topic, pattern, field, problems)
+            for field, problems in problems_by_field.items()
+        }
+    for field, future in futures.items():
+        try:
+            repaired[field] = future.result()
+        except CancelledError:
+            raise
+        except Exception as exc:
+            st.warning(f"Veldherstel {field} voor patroon {pattern.get('number', '?')} mislukt: {exc}")
+    return repaired
 
 
 def warn_book_review_style(paragraphs, pattern_number):
@@ -582,252 +1126,68 @@ def warn_book_review_style(paragraphs, pattern_number):
             )
 
 
-def markdown_to_pdf_bytes(markdown_text, title):
-    if FPDF is None:
-        raise RuntimeError("fpdf2 ontbreekt. Installeer fpdf2 voor PDF-export.")
-    pdf = FPDF()
-    pdf.set_margins(left=22, top=24, right=22)
-    pdf.set_auto_page_break(auto=True, margin=24)
-    pdf.add_page()
-    pdf.set_title(title)
-    font_name = "Helvetica"
-    pdf.set_font(font_name, size=12)
-
-    def sanitize_text(text):
-        return normalize_pdf_text(text)
-
-    def write_heading(text, level):
-        sizes = {1: 18, 2: 15, 3: 13}
-        pdf.set_font(font_name, style="B", size=sizes.get(level, 12))
-        pdf.multi_cell(0, 9, sanitize_text(text))
-        pdf.ln(2)
-        pdf.set_font(font_name, size=12)
-
-    for raw_line in markdown_text.splitlines():
-        line = sanitize_text(raw_line.strip())
-        if not line:
-            pdf.ln(4)
-            continue
-        if line.startswith("### "):
-            write_heading(line[4:], 3)
-            continue
-        if line.startswith("## "):
-            write_heading(line[3:], 2)
-            continue
-        if line.startswith("# "):
-            write_heading(line[2:], 1)
-            continue
-        pdf.multi_cell(0, 7, line)
-        pdf.ln(1)
-
-    return bytes(pdf.output(dest="S"))
-
-
-def build_pdf_from_patterns(title, patterns, foreword=None, tagline=None, index_data=None):
+@traced
+def export_pdf(document):
+    FPDF = load_fpdf()
     if FPDF is None:
         raise RuntimeError("fpdf2 ontbreekt. Installeer fpdf2 voor PDF-export.")
+    if st.session_state.get("pdf_parallel_mode"):
+        pypdf = load_pypdf()
+        if pypdf is None:
+            raise RuntimeError("pypdf ontbreekt. Installeer pypdf voor parallelle PDF-export.")
+        return cached_export(
+            "pdf-chapters",
+            {"document": document["version"]},
+            lambda: render_pdf_chapters(document, FPDF, pypdf),
+        )
+    return cached_export("pdf", {"document": document["version"]}, lambda: render_pdf(document, FPDF))
 
-    patterns_sorted = sorted(patterns, key=lambda p: p.get("number", 0))
-
-    def sanitize_text(text):
-        return normalize_pdf_text(text)
-
-    def render_title_page(pdf, font_name_override=None):
-        heading_font = font_name_override or "Helvetica"
-        pdf.set_font(heading_font, style="B", size=20)
-        pdf.multi_cell(0, 10, sanitize_text(title))
-        pdf.ln(4)
-        if tagline:
-            pdf.set_font(heading_font, size=12)
-            pdf.multi_cell(0, 7, sanitize_text(tagline))
 
-    def render_index_page(pdf, font_name_override=None):
-        if not index_data:
-            return
-        heading_font = font_name_override or "Helvetica"
-        pdf.set_font(heading_font, style="B", size=16)
-        pdf.multi_cell(0, 9, sanitize_text("Index"))
-        pdf.ln(2)
-        pdf.set_font(heading_font, size=12)
-        for item in index_data.get("index", []):
-            line = f"{item['number']}. {item['title']} — {item['description']}"
-            pdf.multi_cell(0, 7, sanitize_text(line))
-            pdf.ln(1)
-
-    def render_foreword(pdf, font_name_override=None):
-        if not foreword:
-            return
-        heading_font = font_name_override or "Helvetica"
-        pdf.set_font(heading_font, style="B", size=16)
-        pdf.multi_cell(0, 9, sanitize_text("Voorwoord"))
-        pdf.ln(2)
-        pdf.set_font(heading_font, size=12)
-        for paragraph in extract_paragraphs(foreword):
-            pdf.multi_cell(0, 7, sanitize_text(paragraph))
-            pdf.ln(1)
-
-    def render_patterns(pdf, capture_pages=False, font_name_override=None):
-        toc_entries = []
-        for pattern in patterns_sorted:
-            start_page = pdf.page_no()
-            if capture_pages:
-                toc_entries.append(
-                    (pattern.get("number", "?"), pattern.get("title", "Onbekend"), start_page)
-                )
-            heading_font = font_name_override or "Helvetica"
-            pdf.set_font(heading_font, style="B", size=14)
-            pdf.multi_cell(
-                0,
-                8,
-                sanitize_text(
-                    f"{pattern.get('number', '?')}. {pattern.get('title', '')} "
-                    f"({pattern.get('scale', '')})"
-                ),
-            )
-            pdf.ln(1)
-            pdf.set_font(heading_font, size=12)
-            conflict = sanitize_text(pattern.get("conflict", "").strip())
-            if conflict:
-                pdf.multi_cell(0, 7, conflict)
-                pdf.ln(1)
-            paragraphs = extract_paragraphs(get_analysis_text(pattern))
-            for paragraph in paragraphs:
-                pdf.multi_cell(0, 7, sanitize_text(paragraph))
-                pdf.ln(1)
-            resolution = sanitize_text(pattern.get("resolution", "").strip())
-            if resolution:
-                pdf.multi_cell(0, 7, resolution)
-                pdf.ln(1)
-            sources = pattern.get("sources", [])
-            if sources:
-                pdf.set_font(heading_font, style="I", size=11)
-                pdf.multi_cell(0, 6, sanitize_text(f"Bronnen: {'; '.join(sources)}"))
-                pdf.set_font(heading_font, size=12)
-                pdf.ln(2)
-        return toc_entries
-
-    first_pass = FPDF()
-    first_pass.set_margins(left=22, top=24, right=22)
-    first_pass.set_auto_page_break(auto=True, margin=24)
-    first_pass.add_page()
-    first_pass.set_title(title)
-    font_name = "Helvetica"
-    first_pass.set_font(font_name, size=12)
-    render_title_page(first_pass, font_name_override=font_name)
-    first_pass.add_page()
-    render_index_page(first_pass, font_name_override=font_name)
-    first_pass.add_page()
-    render_foreword(first_pass, font_name_override=font_name)
-    if foreword:
-        first_pass.add_page()
-    toc_entries = render_patterns(first_pass, capture_pages=True, font_name_override=font_name)
-
-    pdf = FPDF()
-    pdf.set_margins(left=22, top=24, right=22)
-    pdf.set_auto_page_break(auto=True, margin=24)
-    pdf.add_page()
-    pdf.set_title(title)
-    font_name = "Helvetica"
-    render_title_page(pdf, font_name_override=font_name)
-    pdf.add_page()
-    render_index_page(pdf, font_name_override=font_name)
-    pdf.add_page()
-    render_foreword(pdf, font_name_override=font_name)
-    if foreword:
-        pdf.add_page()
-    render_patterns(pdf, capture_pages=False, font_name_override=font_name)
-
-    return bytes(pdf.output(dest="S"))
-
-
-def convert_with_pandoc(markdown_text, title, output_basename, patterns=None, author=None, foreword=None):
+@traced
+def export_epub(document, author=None):
+    pypandoc = load_pypandoc()
     if pypandoc is None:
         raise RuntimeError("pypandoc ontbreekt. Installeer pandoc en pypandoc.")
-    with tempfile.TemporaryDirectory() as tmpdir:
-        md_path = os.path.join(tmpdir, f"{output_basename}.md")
-        epub_path = os.path.join(tmpdir, f"{output_basename}.epub")
-        css_path = os.path.join(tmpdir, "epub.css")
-        cover_path = os.path.join(tmpdir, "cover.svg")
-        with open(md_path, "w", encoding="utf-8") as f:
-            f.write(markdown_text)
-        with open(css_path, "w", encoding="utf-8") as f:
-            f.write(
-                "body { font-family: serif; font-size: 9pt; line-height: 1.2; margin: 1.2em; }\n"
-                "h1, h2, h3 { font-family: sans-serif; }\n"
-                "h1 { font-size: 1.6em; margin-top: 0.6em; }\n"
-                "h2 { font-size: 1.3em; margin-top: 0.8em; }\n"
-                "h3 { font-size: 1.1em; margin-top: 0.8em; }\n"
-                "p { margin: 0 0 0.8em 0; }\n"
-            )
-        generate_epub_cover_svg(title, cover_path)
-
-        common_args = [
-            "--toc",
-            "--toc-depth=2",
-            f'--metadata=title:{title}',
-            "--top-level-division=chapter",
-        ]
-        if author:
-            common_args.append(f"--metadata=author:{author}")
-
-        if patterns:
-            pdf_bytes = build_pdf_from_patterns(
-                title,
-                patterns,
-                foreword=foreword,
-                tagline=f"Een patroonlandschap rond {title}",
-                index_data=None,
-            )
-        else:
-            pdf_bytes = markdown_to_pdf_bytes(markdown_text, title)
-        pypandoc.convert_file(
-            md_path,
-            "epub",
-            outputfile=epub_path,
-            extra_args=common_args
-            + ["--epub-chapter-level=2", f"--css={css_path}", f"--epub-cover-image={cover_path}"],
-        )
 
-        with open(epub_path, "rb") as f:
-            epub_bytes = f.read()
+    def render():
+        chapters = markdown_chapters(document)
+        bodies = cached_fragments(
+            "epub-chapter",
+            [chapter["markdown"] for chapter in chapters],
+            lambda missing: markdown_to_xhtml(pypandoc, missing),
+        )
+        identifier = f"urn:uuid:{uuid.UUID(document['version'][:32])}"
+        return assemble_epub(document["title"], author, identifier, chapters, bodies)
 
-    return pdf_bytes, epub_bytes
+    return cached_export("epub", {"document": document["version"], "author": author}, render)
 
 
-def generate_epub_cover_svg(title, output_path):
-    safe_title = (title or "").strip()
-    bg_colors = ["#1f2937", "#374151", "#1e3a8a", "#334155", "#0f172a"]
-    color_index = sum(ord(c) for c in safe_title) % len(bg_colors)
-    bg = bg_colors[color_index]
-    subtitle = "A Pattern Language"
-    svg = (
-        "<?xml version='1.0' encoding='UTF-8'?>"
-        "<svg xmlns='http://www.w3.org/2000/svg' width='1600' height='2560' viewBox='0 0 1600 2560'>"
-        f"<rect width='1600' height='2560' fill='{bg}'/>"
-        "<rect x='140' y='320' width='1320' height='1920' fill='none' stroke='#ffffff' stroke-width='4'/>"
-        f"<text x='800' y='1180' text-anchor='middle' font-family='Helvetica, Arial, sans-serif' "
-        "font-size='110' fill='#ffffff'>"
-        f"{escape_xml_text(safe_title)}</text>"
-        f"<text x='800' y='1320' text-anchor='middle' font-family='Helvetica, Arial, sans-serif' "
-        "font-size='52' fill='#e5e7eb'>"
-        f"{escape_xml_text(subtitle)}</text>"
-        "</svg>"
-    )
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(svg)
+@traced
+def convert_with_pandoc(document, author=None):
+    if load_pypandoc() is None:
+        raise RuntimeError("pypandoc ontbreekt. Installeer pandoc en pypandoc.")
+    pdf_bytes = export_pdf(document)
+    epub_bytes = export_epub(document, author=author)
+    return pdf_bytes, epub_bytes
 
 
-def escape_xml_text(text):
-    return (
-        text.replace("&", "&amp;")
-        .replace("<", "&lt;")
-        .replace(">", "&gt;")
-        .replace('"', "&quot;")
-        .replace("'", "&apos;")
-    )
+def upload_spooled_file(dbx, dropbox, handle, path):
+    mode = dropbox.files.WriteMode("overwrite")
+    with spool_open(handle) as f:
+        if handle["size"] <= DROPBOX_CHUNK_BYTES:
+            dbx.files_upload(f.read(), path, mode=mode)
+            return
+        session = dbx.files_upload_session_start(f.read(DROPBOX_CHUNK_BYTES))
+        cursor = dropbox.files.UploadSessionCursor(session_id=session.session_id, offset=f.tell())
+        commit = dropbox.files.CommitInfo(path=path, mode=mode)
+        while handle["size"] - f.tell() > DROPBOX_CHUNK_BYTES:
+            dbx.files_upload_session_append_v2(f.read(DROPBOX_CHUNK_BYTES), cursor)
+            cursor.offset = f.tell()
+        dbx.files_upload_session_finish(f.read(), cursor, commit)
 
 
-def upload_to_dropbox(file_content, file_name):
+@traced
+def upload_to_dropbox(handle, file_name):
     if not (
         st.secrets.get("DROPBOX_REFRESH_TOKEN")
         and st.secrets.get("DROPBOX_APP_KEY")
@@ -836,6 +1196,9 @@ def upload_to_dropbox(file_content, file_name):
         raise RuntimeError(
             "DROPBOX_APP_KEY, DROPBOX_APP_SECRET of DROPBOX_REFRESH_TOKEN ontbreekt."
         )
+    dropbox = load_dropbox()
+    if dropbox is None:
+        raise RuntimeError("Dropbox SDK ontbreekt. Installeer de dropbox package.")
     dbx = dropbox.Dropbox(
         oauth2_refresh_token=st.secrets["DROPBOX_REFRESH_TOKEN"],
         app_key=st.secrets["DROPBOX_APP_KEY"],
@@ -847,7 +1210,7 @@ def upload_to_dropbox(file_content, file_name):
     except Exception:
         pass
     path = f"{folder_path}/{file_name}"
-    dbx.files_upload(file_content, path, mode=dropbox.files.WriteMode("overwrite"))
+    upload_spooled_file(dbx, dropbox, handle, path)
     try:
         update_simple_index(dbx, folder_path)
     except Exception:
@@ -856,6 +1219,7 @@ def upload_to_dropbox(file_content, file_name):
 
 
 def update_simple_index(dbx, folder_path="/Apps/Rakuten Kobo"):
+    dropbox = load_dropbox()
     entries = dbx.files_list_folder(folder_path).entries
     files = [
         entry.name
@@ -886,26 +1250,6 @@ def update_simple_index(dbx, folder_path="/Apps/Rakuten Kobo"):
     )
 
 
-def normalize_pdf_text(text):
-    cleaned = unidecode(text or "")
-    cleaned = (
-        cleaned.replace("—", "-")
-        .replace("–", "-")
-        .replace("“", '"')
-        .replace("”", '"')
-        .replace("‘", "'")
-        .replace("’", "'")
-        .replace("…", "...")
-        .replace("•", "-")
-    )
-    for old, new in PDF_CHAR_REPLACEMENTS.items():
-        cleaned = cleaned.replace(old, new)
-    try:
-        return cleaned.encode("latin-1").decode("latin-1")
-    except UnicodeEncodeError:
-        return cleaned.encode("latin-1", "replace").decode("latin-1")
-
-
 def make_safe_filename(title, ext):
     base = (title or "pattern_language").strip().lower()
     base = re.sub(r"\s+", "_", base)
@@ -915,6 +1259,41 @@ def make_safe_filename(title, ext):
     return f"{base}.{ext}"
 
 
+def patterns_key():
+    revision, key = st.session_state.patterns_key
+    if revision != st.session_state.patterns_revision:
+        revision, key = st.session_state.patterns_revision, export_key("patterns", st.session_state.patterns)
+        st.session_state.patterns_key = (revision, key)
+    return key
+
+
+def book_document(with_front_matter=True):
+    return build_document(
+        st.session_state.short_title or st.session_state.topic,
+        st.session_state.patterns,
+        index_data=st.session_state.index_data if with_front_matter else None,
+        front_matter=st.session_state.front_matter if with_front_matter else None,
+        patterns_key=patterns_key(),
+    )
+
+
+@traced
+def show_pattern(block):
+    st.markdown(f"### {block['heading']}")
+    st.markdown(block["conflict"] or "Niet gegenereerd")
+    if block["paragraphs"]:
+        for paragraph in block["paragraphs"]:
+            st.markdown(paragraph)
+    else:
+        st.error("Analysis ontbreekt in de AI-output.")
+    st.markdown(block["resolution"] or "Resolutie niet gevonden")
+    st.markdown(f"Bronnen: {block['sources'] or 'Niet gegenereerd'}")
+
+
+def spool_artifact(name, data):
+    return spool_put(st.session_state.spool_session, name, data)
+
+
 def init_state():
     st.session_state.setdefault("topic", "")
     st.session_state.setdefault("author", "")
@@ -928,32 +1307,54 @@ def init_state():
     st.session_state.setdefault("index_generated", False)
     st.session_state.setdefault("index_data", None)
     st.session_state.setdefault("patterns", {})
+    st.session_state.setdefault("patterns_revision", 0)
+    st.session_state.setdefault("patterns_key", (None, None))
     st.session_state.setdefault("batch_status", {1: "pending", 2: "pending", 3: "pending", 4: "pending"})
     st.session_state.setdefault("front_matter", None)
-    st.session_state.setdefault("markdown", None)
-    st.session_state.setdefault("pdf_bytes", None)
-    st.session_state.setdefault("epub_bytes", None)
+    st.session_state.setdefault("spool_session", uuid.uuid4().hex)
+    st.session_state.setdefault("markdown_file", None)
+    st.session_state.setdefault("pdf_file", None)
+    st.session_state.setdefault("epub_file", None)
     st.session_state.setdefault("last_error", "")
     st.session_state.setdefault("failed_batch_id", None)
     st.session_state.setdefault("retry_batch_id", None)
     st.session_state.setdefault("last_raw_ai_output", "")
-    st.session_state.setdefault("final_pdf_bytes", None)
+    st.session_state.setdefault("final_pdf_file", None)
+    st.session_state.setdefault("last_pipeline_report", "")
+    st.session_state.setdefault("repair_mode", True)
+    st.session_state.setdefault("hedging_mode", False)
+    st.session_state.setdefault("tracing_mode", False)
+    st.session_state.setdefault("pdf_parallel_mode", False)
+    st.session_state.setdefault("context_mode", False)
+    st.session_state.setdefault("context_summarizer", False)
+    st.session_state.setdefault("hierarchical_index", False)
+    st.session_state.setdefault("batch_generation", False)
+    st.session_state.setdefault("batch_local", False)
+    st.session_state.setdefault("pattern_batch", None)
+    st.session_state.setdefault("last_trace", None)
+    st.session_state.setdefault("normalization_log", {})
 
 
 def reset_generation():
     st.session_state.index_data = None
     st.session_state.patterns = {}
+    st.session_state.patterns_revision += 1
     st.session_state.batch_status = {1: "pending", 2: "pending", 3: "pending", 4: "pending"}
     st.session_state.front_matter = None
-    st.session_state.markdown = None
-    st.session_state.pdf_bytes = None
-    st.session_state.epub_bytes = None
+    cancel_session(model_session())
+    take_abandoned(model_session())
+    spool_drop_session(st.session_state.spool_session)
+    st.session_state.markdown_file = None
+    st.session_state.pdf_file = None
+    st.session_state.epub_file = None
     st.session_state.last_error = ""
     st.session_state.failed_batch_id = None
     st.session_state.retry_batch_id = None
     st.session_state.last_raw_ai_output = ""
-    st.session_state.final_pdf_bytes = None
-    st.session_state.epub_bytes = None
+    st.session_state.final_pdf_file = None
+    st.session_state.last_pipeline_report = ""
+    st.session_state.normalization_log = {}
+    st.session_state.pattern_batch = None
     st.session_state.short_title = ""
     st.session_state.subject_scan = []
     st.session_state.subject_scan_approved = False
@@ -980,61 +1381,505 @@ def update_progress(progress_placeholder, caption_placeholder):
     caption_placeholder.caption(f"Voortgang: patroon {completed} van 20")
 
 
-def store_pattern(pattern, log_container=None):
-    if "number" not in pattern:
-        if log_container is not None:
-            log_container.error("Patroon mist 'number' en kan niet worden opgeslagen.")
-        return
+def apply_snapshot(snapshot):
+    reset_generation()
+    for field, value in snapshot.items():
+        if value is not None:
+            st.session_state[field] = value
+    st.session_state.patterns_revision += 1
+    st.session_state.index_generated = bool(st.session_state.index_data)
+    st.session_state.batch_status = {
+        batch_id: "done"
+        if all(number in st.session_state.patterns for number in batch_numbers(batch_id))
+        else "pending"
+        for batch_id in st.session_state.batch_status
+    }
+    for i, item in enumerate(st.session_state.subject_scan):
+        st.session_state[f"scan_{i}"] = item in st.session_state.subject_scan_selected
+
+
+def with_pattern_defaults(pattern):
     pattern.setdefault("title", "Niet gegenereerd")
     pattern.setdefault("scale", "")
     pattern.setdefault("conflict", "Niet gegenereerd")
     pattern.setdefault("analysis", "Niet gegenereerd")
     pattern.setdefault("resolution", "Niet gegenereerd")
     pattern.setdefault("sources", [])
+    return pattern
+
+
+def store_pattern(pattern, log_container=None):
+    if "number" not in pattern:
+        if log_container is not None:
+            log_container.error("Patroon mist 'number' en kan niet worden opgeslagen.")
+        return
+    with_pattern_defaults(pattern)
     patterns = dict(st.session_state.patterns)
     patterns[pattern["number"]] = pattern
     st.session_state.patterns = patterns
+    st.session_state.patterns_revision += 1
     if log_container is not None:
         log_container.info(
             f"Patroon {pattern['number']}: {pattern['title']} succesvol opgeslagen."
         )
 
 
-def execute_batch(batch_id, client, index_entries, log_container, progress_placeholder, caption_placeholder):
-    st.session_state.batch_status[batch_id] = "running"
-    batch = generate_batch(
-        client, st.session_state.topic, index_entries, batch_numbers(batch_id)
-    )
-    expected = len(batch_numbers(batch_id))
-    if len(batch) < expected:
-        st.warning(
-            f"Batch {batch_id} leverde {len(batch)} patronen i.p.v. {expected}. "
-            "Ik sla de beschikbare patronen op."
-        )
-    for pattern in batch:
+def session_book():
+    book = {field: st.session_state[field] for field in SNAPSHOT_FIELDS}
+    book["patterns"] = st.session_state.patterns
+    return book
+
+
+def book_index_item(book, number):
+    for item in (book.get("index_data") or {}).get("index", []):
+        if item["number"] == number:
+            return item
+    return None
+
+
+def pending_pattern_requests(books):
+    requests = {}
+    for book_id, book in books.items():
+        for item in (book.get("index_data") or {}).get("index", []):
+            sources = (book.get("sources_by_number") or {}).get(item["number"])
+            if item["number"] in book["patterns"] or not sources:
+                continue
+            messages = pattern_messages(
+                book["topic"], item, sources, book.get("storyline"), book.get("subject_scan_selected")
+            )
+            requests[f"{book_id}|{item['number']}"] = chat_completion_body(messages, "pattern")
+    return requests
+
+
+def batch_patterns(books, results):
+    patterns = {}
+    errors = []
+    for custom_id, result in results.items():
+        book_id, number = custom_id.rsplit("|", 1)
+        item = book_index_item(books.get(book_id) or {}, int(number))
+        if item is None:
+            errors.append(f"{custom_id}: boek of indexitem onbekend.")
+            continue
+        if "error" in result:
+            errors.append(f"{custom_id}: {result['error']}")
+            continue
         try:
-            validate_pattern(pattern)
-        except Exception as exc:
-            pattern_number = pattern.get("number", "?")
-            if "minimaal 300 woorden" in str(exc):
-                st.warning(f"Patroon {pattern_number} is korter dan gewenst: {exc}")
+            pattern = pattern_from_response(json.loads(result["content"]), item)
+        except ValueError as exc:
+            errors.append(f"{custom_id}: {exc}")
+            continue
+        pattern, _ = normalize_pattern(pattern)
+        patterns.setdefault(book_id, {})[item["number"]] = pattern
+    return patterns, errors
+
+
+def batch_client(client, local):
+    if not local:
+        return client
+    return local_batch_client(
+        lambda body: client.chat.completions.create(**body).choices[0].message.content
+    )
+
+
+@traced
+def submit_pattern_batch(client, books, local):
+    requests = pending_pattern_requests(books)
+    if not requests:
+        return None
+    path = write_batch_file(requests)
+    batch_id = submit_batch(batch_client(client, local), path, metadata={"books": str(len(books))})
+    return {
+        "id": batch_id,
+        "local": local,
+        "path": path,
+        "requests": len(requests),
+        "books": {book_id: book for book_id, book in books.items() if book_id != SESSION_BOOK_ID},
+        "status": None,
+        "applied": False,
+    }
+
+
+@traced
+def apply_pattern_batch(client, record, log_container=None):
+    books = dict(record["books"])
+    books[SESSION_BOOK_ID] = session_book()
+    results = fetch_batch_results(batch_client(client, record["local"]), record["status"])
+    patterns, errors = batch_patterns(books, results)
+    for book_id, found in patterns.items():
+        for number, pattern in sorted(found.items()):
+            try:
+                validate_pattern(pattern)
+            except Exception as exc:
+                st.warning(f"Patroon {number} ({book_id}): {exc}")
+            if book_id == SESSION_BOOK_ID:
+                store_pattern(pattern, log_container)
             else:
-                st.error(f"Fout bij patroon {pattern_number}: {exc}")
-        store_pattern(pattern, log_container)
-        warn_book_review_style(
-            extract_paragraphs(pattern.get("paragraphs", [])),
-            pattern.get("number", "?"),
+                books[book_id]["patterns"][number] = with_pattern_defaults(pattern)
+    record["applied"] = True
+    return errors
+
+
+def pattern_node(number):
+    return f"pattern_{number}"
+
+
+def sources_node(shard):
+    return f"sources_{shard[0]}_{shard[-1]}"
+
+
+def batch_node(batch_id):
+    return f"batch_{batch_id}"
+
+
+def batch_for_number(number):
+    return next(batch_id for batch_id in range(1, 5) if number in batch_numbers(batch_id))
+
+
+def book_source_shards():
+    return source_shards(range(1, 21))
+
+
+def batch_source_shards(batch_id):
+    return [shard for shard in book_source_shards() if set(shard) & set(batch_numbers(batch_id))]
+
+
+def build_book_graph(client, batch_mode=False):
+    topic = st.session_state.topic
+    selected = list(st.session_state.subject_scan_selected)
+    repair_mode = st.session_state.repair_mode
+    hedging_mode = st.session_state.hedging_mode
+    normalization_log = st.session_state.normalization_log
+    index_generator = generate_index_hierarchical if st.session_state.hierarchical_index else generate_index
+    earlier_patterns = dict(st.session_state.patterns) if st.session_state.context_mode else None
+    summarize = (
+        (lambda pattern: generate_pattern_summary(client, pattern))
+        if st.session_state.context_summarizer
+        else None
+    )
+
+    def run_sources(shard):
+        def run(inputs):
+            return generate_sources_shard(
+                client, topic, inputs["index"]["index"], inputs["storyline"], shard
+            )
+
+        return run
+
+    def earlier_context(inputs, number):
+        if earlier_patterns is None:
+            return None
+        earlier = dict(earlier_patterns)
+        earlier.update((n, inputs[pattern_node(n)]) for n in range(1, number) if pattern_node(n) in inputs)
+        return rolling_digest(earlier, number, summarize=summarize)
+
+    def run_batch(batch_id):
+        numbers = batch_numbers(batch_id)
+
+        def run(inputs):
+            sources = {
+                number: shard_sources
+                for shard in batch_source_shards(batch_id)
+                for number, shard_sources in inputs[sources_node(shard)].items()
+            }
+            context = earlier_context(inputs, numbers[0])
+            try:
+                patterns, normalizations = hedged_call(
+                    "batch",
+                    lambda: generate_batch(
+                        client,
+                        topic,
+                        inputs["index"]["index"],
+                        numbers,
+                        sources_by_number=sources,
+                        storyline=inputs["storyline"],
+                        subject_scan=selected,
+                        context=context,
+                    ),
+                    is_valid=lambda candidate: len(candidate[0]) >= len(numbers),
+                    enabled=hedging_mode,
+                )
+            except CancelledError:
+                raise
+            except Exception as exc:
+                st.warning(f"Batch {batch_id} mislukt ({exc}); de patronen worden los gegenereerd.")
+                return {}
+            return {
+                pattern["number"]: (pattern, normalizations.get(pattern["number"], []))
+                for pattern in patterns
+                if pattern.get("number") in numbers
+            }
+
+        return run
+
+    def run_pattern(number, shard, batch=None):
+        def run(inputs):
+            item = next(
+                (entry for entry in inputs["index"]["index"] if entry["number"] == number),
+                None,
+            )
+            if item is None:
+                raise ValueError(f"Indexitem {number} ontbreekt.")
+            pattern, fired = inputs[batch].get(number, (None, [])) if batch else (None, [])
+            if pattern is None or is_incomplete_pattern(pattern):
+                context = earlier_context(inputs, number)
+                pattern = hedged_call(
+                    "pattern",
+                    lambda: generate_pattern_single(
+                        client,
+                        topic,
+                        item,
+                        inputs[sources_node(shard)].get(number, []),
+                        inputs["storyline"],
+                        selected,
+                        context,
+                    ),
+                    is_valid=lambda candidate: not is_incomplete_pattern(candidate),
+                    enabled=hedging_mode,
+                )
+                pattern, fired = normalize_pattern(pattern)
+            normalization_log[number] = fired
+            if repair_mode:
+                pattern = repair_pattern(client, topic, pattern)
+            return pattern
+
+        return run
+
+    nodes = [
+        task("subject_scan", lambda inputs: generate_subject_scan(client, topic)),
+        task("short_title", lambda inputs: generate_short_title(client, topic)),
+        gate(
+            "scan_selection",
+            lambda: 5 <= len(selected) <= 8,
+            "Selecteer 5–8 spanningsassen.",
+            deps=["subject_scan"],
+        ),
+        task(
+            "storyline",
+            lambda inputs: generate_storyline(client, topic, selected),
+            deps=["scan_selection"],
+        ),
+        gate(
+            "storyline_approval",
+            lambda: st.session_state.storyline_approved,
+            "Keurt eerst de verhaallijn goed.",
+            deps=["storyline"],
+        ),
+        task(
+            "index",
+            lambda inputs: index_generator(client, topic, selected, inputs["storyline"]),
+            deps=["storyline", "storyline_approval"],
+        ),
+        task(
+            "front_matter",
+            lambda inputs: generate_front_matter(client, topic, inputs["index"]["index"]),
+            deps=["index"],
+        ),
+    ]
+    if batch_mode:
+        for batch_id in range(1, 5):
+            first = batch_numbers(batch_id)[0]
+            nodes.append(
+                task(
+                    batch_node(batch_id),
+                    run_batch(batch_id),
+                    deps=["index", "storyline", *[sources_node(shard) for shard in batch_source_shards(batch_id)]],
+                    after=[pattern_node(n) for n in range(1, first)] if earlier_patterns is not None else (),
+                )
+            )
+    for shard in book_source_shards():
+        nodes.append(task(sources_node(shard), run_sources(shard), deps=["index", "storyline"]))
+        for number in shard:
+            batch = batch_node(batch_for_number(number)) if batch_mode else None
+            nodes.append(
+                task(
+                    pattern_node(number),
+                    run_pattern(number, shard, batch),
+                    deps=["index", sources_node(shard), "storyline", *([batch] if batch else [])],
+                    after=[pattern_node(n) for n in range(1, shard[0])] if earlier_patterns is not None else (),
+                )
+            )
+    return {node["name"]: node for node in nodes}
+
+
+def book_graph_done():
+    done = {}
+    if st.session_state.subject_scan:
+        done["subject_scan"] = st.session_state.subject_scan
+    if st.session_state.short_title:
+        done["short_title"] = st.session_state.short_title
+    if st.session_state.storyline:
+        done["storyline"] = st.session_state.storyline
+    if st.session_state.index_data:
+        done["index"] = st.session_state.index_data
+    if st.session_state.front_matter:
+        done["front_matter"] = st.session_state.front_matter
+    for shard in book_source_shards():
+        if all(number in st.session_state.sources_by_number for number in shard):
+            done[sources_node(shard)] = {
+                number: st.session_state.sources_by_number[number] for number in shard
+            }
+    for number in st.session_state.patterns:
+        done[pattern_node(number)] = st.session_state.patterns[number]
+        done[batch_node(batch_for_number(number))] = {}
+    return done
+
+
+def apply_book_result(name, value, log_container=None, progress=None):
+    if name == "subject_scan":
+        st.session_state.subject_scan = value
+        st.session_state.subject_scan_approved = False
+    elif name == "short_title":
+        st.session_state.short_title = value
+    elif name == "scan_selection":
+        st.session_state.subject_scan_approved = True
+    elif name == "storyline":
+        st.session_state.storyline = value
+        st.session_state.storyline_approved = False
+    elif name == "index":
+        st.session_state.index_data = value
+        st.session_state.index_generated = True
+    elif name == "front_matter":
+        st.session_state.front_matter = value
+    elif name.startswith("sources_"):
+        sources_by_number = dict(st.session_state.sources_by_number)
+        sources_by_number.update(value)
+        st.session_state.sources_by_number = sources_by_number
+    elif name.startswith("pattern_"):
+        number = int(name.split("_", 1)[1])
+        st.session_state.last_raw_ai_output = json.dumps(value, ensure_ascii=False, indent=2)
+        if value.get("number") != number:
+            st.warning(f"Patroon {number} kreeg nummer {value.get('number')} van de AI; gecorrigeerd.")
+            value["number"] = number
+        fired = st.session_state.normalization_log.get(number)
+        if fired:
+            st.info(f"Patroon {number}: lokaal genormaliseerd ({', '.join(fired)}).")
+        defects = collect_pattern_defects(value)
+        if defects:
+            st.warning(f"Patroon {number} validatie: {' '.join(message for _, message in defects)}")
+        store_pattern(value, log_container)
+        if progress is not None:
+            update_progress(*progress)
+
+
+def session_ended():
+    ctx = get_script_run_ctx()
+    return ctx is None or not Runtime.exists() or not Runtime.instance().is_active_session(ctx.session_id)
+
+
+def adopt_abandoned_results():
+    results = take_abandoned(model_session())
+    for name, value in results.items():
+        apply_book_result(name, value)
+    if results:
+        st.info(f"{len(results)} resultaten van een onderbroken generatie zijn bewaard.")
+
+
+@traced
+def run_book_graph(client, targets=None, rerun=(), log_container=None, progress=None, lane="interactive",
+                   batch_mode=False):
+    adopt_abandoned_results()
+    nodes = build_book_graph(client, batch_mode)
+    done = book_graph_done()
+    for name in rerun:
+        done.pop(name, None)
+    session = model_session()
+    token = start_run(session)
+    status = st.empty()
+    abandoned = {}
+
+    def abandon(futures):
+        abandoned.update(futures)
+        detach_script_context()
+        keep_abandoned(session, futures, keep=lambda: not is_cancelled(token))
+
+    try:
+        with model_lane(lane), run_token(token):
+            report = run_graph(
+                nodes,
+                targets=targets,
+                done=done,
+                on_result=lambda name, value: apply_book_result(name, value, log_container, progress),
+                on_wait=lambda running: status.caption(
+                    f"Bezig: {', '.join(running)}. Stop via 'Stop generatie' in de zijbalk."
+                ),
+                on_abandon=abandon,
+            )
+    except StopException:
+        if session_ended():
+            cancel(token)
+        raise
+    finally:
+        release_run(token, abandoned.values())
+    status.empty()
+    messages = []
+    if token["event"].is_set():
+        completed = sum(1 for name in report["results"] if name.startswith("pattern_"))
+        st.warning(f"Generatie gestopt. {completed} patronen zijn voltooid en bewaard.")
+    for name, exc in report["errors"].items():
+        if isinstance(exc, CancelledError):
+            continue
+        if name.startswith("pattern_"):
+            st.error(f"Patroon {name.split('_', 1)[1]} mislukt: {exc}")
+        else:
+            messages.append(str(exc))
+    messages.extend(report["blocked"].values())
+    st.session_state.last_error = " ".join(messages)
+    if report["timings"]:
+        st.session_state.last_pipeline_report = (
+            f"Pipeline: {report['wall_time']:.1f}s, kritiek pad "
+            f"{report['critical_path_time']:.1f}s ({' → '.join(report['critical_path'])})"
         )
-        update_progress(progress_placeholder, caption_placeholder)
-    st.session_state.batch_status[batch_id] = "done"
-    if batch_id == 1:
-        st.success("Batch 1 succesvol gegenereerd!")
+    return report
 
 
 def main():
     st.set_page_config(page_title=APP_TITLE, layout="centered")
     init_state()
+    if not st.session_state.tracing_mode:
+        render_app()
+        return
+    trace = start_trace("rerun")
+    try:
+        render_app()
+    finally:
+        stop_trace()
+        st.session_state.last_trace = trace
+        write_chrome_trace(trace)
+
 
+def show_trace(trace):
+    rows = timeline_rows(trace)
+    if not rows:
+        st.caption("Geen spans opgenomen.")
+        return
+    st.caption(f"{len(rows)} spans, {max(row['end_ms'] for row in rows):.0f} ms")
+    st.vega_lite_chart(
+        rows,
+        {
+            "mark": "bar",
+            "encoding": {
+                "y": {"field": "lane", "type": "nominal", "sort": None, "title": None},
+                "x": {"field": "start_ms", "type": "quantitative", "title": "ms"},
+                "x2": {"field": "end_ms"},
+                "color": {"field": "span", "type": "nominal", "legend": None},
+                "tooltip": [
+                    {"field": "span", "type": "nominal"},
+                    {"field": "duur_ms", "type": "quantitative"},
+                ],
+            },
+        },
+        use_container_width=True,
+    )
+    st.download_button(
+        "Download Chrome trace",
+        data=functools.partial(chrome_trace, trace),
+        file_name="rerun_trace.json",
+        mime="application/json",
+        key="download_trace_btn",
+    )
+
+
+def render_app():
     st.title(APP_TITLE)
     app_password = st.secrets.get("APP_PASSWORD", "").strip()
     entered_password = st.sidebar.text_input("Wachtwoord", type="password")
@@ -1047,6 +1892,120 @@ def main():
     if entered_password != app_password:
         st.error("Wachtwoord onjuist.")
         return
+    adopt_abandoned_results()
+    st.sidebar.checkbox(
+        "Veldherstel (goedkope reparatie van afgekeurde velden)",
+        key="repair_mode",
+    )
+    st.sidebar.checkbox(
+        "Hedging (dubbel verzoek boven p90 bij patroon-calls)",
+        key="hedging_mode",
+    )
+    st.sidebar.checkbox(
+        "Patronen per batch van 5 (één modelcall per batch, los als aanvulling)",
+        key="batch_generation",
+    )
+    st.sidebar.checkbox(
+        "Tracing (tijdlijn per rerun, Chrome trace JSON)",
+        key="tracing_mode",
+    )
+    st.sidebar.checkbox(
+        "Parallelle PDF-export (hoofdstukken in werkprocessen)",
+        key="pdf_parallel_mode",
+        disabled=load_pypdf() is None,
+        help="Vereist pypdf. Elk hoofdstuk start op een nieuwe pagina en wordt los gecachet; "
+        "bladwijzers en paginanummers per hoofdstuk.",
+    )
+    st.sidebar.checkbox(
+        f"Doorlopende context (digest van eerdere patronen, max {DIGEST_TOKEN_BUDGET} tokens)",
+        key="context_mode",
+    )
+    st.sidebar.checkbox(
+        "Digest samenvatten met klein model (gecachet per patroon)",
+        key="context_summarizer",
+        disabled=not st.session_state.context_mode,
+    )
+    st.sidebar.checkbox(
+        "Hiërarchische index (outline per schaal, secties parallel uitgewerkt)",
+        key="hierarchical_index",
+    )
+    if st.sidebar.button("Stop generatie", key="stop_generation"):
+        cancel_session(model_session())
+        st.sidebar.info("Generatie gestopt. Voltooide patronen blijven bewaard.")
+    if st.session_state.tracing_mode and st.session_state.last_trace:
+        with st.sidebar.expander("Tijdlijn vorige rerun", expanded=False):
+            show_trace(st.session_state.last_trace)
+    with st.sidebar.expander("Instrumentatie", expanded=False):
+        metrics = connection_metrics()
+        st.caption(
+            f"HTTP-verzoeken: {metrics['requests']} · nieuwe verbindingen: {metrics['connections']} · "
+            f"TLS-handshakes: {metrics['tls_handshakes']} · hergebruik: {metrics['reuse_ratio']:.0%}"
+        )
+        for row in stage_report(STAGE_CONFIG):
+            st.caption(
+                f"{row['stage']}: {row['model']} · max {row['max_tokens']} tokens · "
+                f"timeout {row['timeout']}s · T {row['temperature']} — {row['calls']} calls, "
+                f"gem. {row['avg_seconds']:.1f}s, {row['avg_completion_tokens']:.0f} tokens"
+            )
+        for stage, latency in latency_summary().items():
+            st.caption(
+                f"{stage} (hedging): {latency['count']} calls · p50 {latency['p50']:.1f}s · "
+                f"p90 {latency['p90']:.1f}s"
+            )
+        exports = cache_stats()
+        st.caption(
+            f"Export-cache: {exports['memory_hits']} geheugen-hits, {exports['disk_hits']} schijf-hits, "
+            f"{exports['misses']} renders, {exports['memory_entries']} in geheugen "
+            f"({exports['memory_bytes'] / 1024 / 1024:.1f} MB)"
+        )
+        scheduler = scheduler_stats()
+        st.caption(
+            f"Planner: {scheduler['running']}/{scheduler['capacity']} modelcalls actief over "
+            f"{scheduler['sessions']} sessies"
+        )
+        for lane, label in (("interactive", "interactief"), ("bulk", "bulk")):
+            queue = scheduler[lane]
+            st.caption(
+                f"Wachtrij {label}: {queue['queued']} wachtend · {queue['granted']} gestart · "
+                f"wachttijd p50 {queue['wait_p50']:.2f}s, p90 {queue['wait_p90']:.2f}s"
+            )
+        cancels = cancel_stats()
+        st.caption(
+            f"Annulering: {cancels['cancelled']} van {cancels['runs']} runs gestopt · "
+            f"{cancels['closed_streams']} streams gesloten · {scheduler['withdrawn']} wachtende calls ingetrokken"
+        )
+        summaries = summary_stats()
+        st.caption(
+            f"Digest-samenvattingen: {summaries['hits']} uit cache, {summaries['misses']} gegenereerd, "
+            f"{summaries['entries']} bewaard, {summaries['failures']} teruggevallen op lokale digest"
+        )
+        flights = flight_stats()
+        st.caption(
+            f"Single-flight: {flights['shared']} van {flights['calls']} modelverzoeken gedeeld met een lopend "
+            f"identiek verzoek, {flights['inflight']} nu onderweg"
+        )
+        st.caption(
+            f"Hoofdstukfragmenten: {exports['fragment_hits']} hergebruikt, {exports['fragment_misses']} gerenderd, "
+            f"{exports['fragment_entries']} in geheugen ({exports['fragment_bytes'] / 1024 / 1024:.1f} MB)"
+        )
+        spooled = spool_usage()
+        st.caption(
+            f"Spool: {spooled['files']} bestanden, {spooled['bytes'] / 1024 / 1024:.1f} MB "
+            f"over {spooled['sessions']} sessies"
+        )
+        if CASSETTE_MODE == "replay":
+            replayed = cassette_stats(get_replay_cassette(CASSETTE_PATH))
+            st.caption(
+                f"Cassette (replay ×{CASSETTE_LATENCY_SCALE:g}): {replayed['served']} antwoorden geserveerd uit "
+                f"{replayed['recorded']} opnames"
+            )
+        elif CASSETTE_MODE == "record":
+            st.caption(f"Cassette (opname): {CASSETTE_PATH}")
+        hedges = hedge_stats()
+        st.caption(
+            f"Hedging: {hedges['hedged']} extra verzoeken op {hedges['calls']} calls, "
+            f"{hedges['hedge_wins']} keer sneller, {hedges['losers_cancelled']} verliezers afgebroken"
+        )
     st.write(f"Aantal patronen in geheugen: {len(st.session_state.patterns)}")
     st.write("Genereer een volledig Pattern Language boek in academisch Nederlands.")
 
@@ -1054,7 +2013,7 @@ def main():
         st.subheader("Input")
         topic = st.text_input("Onderwerp", value=st.session_state.topic)
         author = st.text_input("Auteur (voor ePub)", value=st.session_state.author)
-        col_a, col_b = st.columns([1, 1])
+        col_a, col_b, col_c = st.columns([1, 1, 1])
         with col_a:
             if st.button("Start nieuw project"):
                 st.session_state.topic = topic
@@ -1067,11 +2026,45 @@ def main():
                 st.session_state.author = author
                 try:
                     client = get_client()
-                    st.session_state.subject_scan = generate_subject_scan(client, topic)
-                    st.session_state.subject_scan_approved = False
-                    if not st.session_state.short_title:
-                        st.session_state.short_title = generate_short_title(client, topic)
-                    st.session_state.last_error = ""
+                    run_book_graph(
+                        client,
+                        targets=["subject_scan", "short_title"],
+                        rerun=["subject_scan"],
+                    )
+                except Exception as exc:
+                    st.session_state.last_error = str(exc)
+        with col_c:
+            if st.button("Genereer alles tot volgende goedkeuring"):
+                st.session_state.topic = topic
+                st.session_state.author = author
+                try:
+                    client = get_client()
+                    run_book_graph(client, lane="bulk", batch_mode=st.session_state.batch_generation)
+                except Exception as exc:
+                    st.session_state.last_error = str(exc)
+        if st.session_state.last_pipeline_report:
+            st.caption(st.session_state.last_pipeline_report)
+        with st.expander("Snapshot opslaan of laden", expanded=False):
+            if st.session_state.topic:
+                st.download_button(
+                    "Download snapshot",
+                    data=functools.partial(dump_snapshot, session_book()),
+                    file_name=make_safe_filename(
+                        st.session_state.short_title or st.session_state.topic, SNAPSHOT_EXTENSION
+                    ),
+                    mime="application/gzip",
+                    key="download_snapshot_btn",
+                )
+            uploaded = st.file_uploader("Snapshot", type=[SNAPSHOT_EXTENSION], key="snapshot_upload")
+            if uploaded is not None and st.button("Laad snapshot"):
+                try:
+                    started = time.perf_counter()
+                    apply_snapshot(load_snapshot(uploaded.getvalue()))
+                    st.session_state.last_pipeline_report = (
+                        f"Snapshot geladen: {len(st.session_state.patterns)} patronen in "
+                        f"{(time.perf_counter() - started) * 1000:.0f} ms"
+                    )
+                    st.rerun()
                 except Exception as exc:
                     st.session_state.last_error = str(exc)
 
@@ -1093,21 +2086,11 @@ def main():
         selected_count = len(st.session_state.subject_scan_selected)
         st.caption(f"Geselecteerd: {selected_count} (kies 5–8)")
         if st.button("Genereer verhaallijn"):
-            if 5 <= selected_count <= 8:
-                try:
-                    client = get_client()
-                    st.session_state.subject_scan_approved = True
-                    st.session_state.storyline = generate_storyline(
-                        client,
-                        st.session_state.topic,
-                        st.session_state.subject_scan_selected,
-                    )
-                    st.session_state.storyline_approved = False
-                    st.session_state.last_error = ""
-                except Exception as exc:
-                    st.session_state.last_error = str(exc)
-            else:
-                st.session_state.last_error = "Selecteer 5–8 spanningsassen."
+            try:
+                client = get_client()
+                run_book_graph(client, targets=["storyline"], rerun=["storyline"])
+            except Exception as exc:
+                st.session_state.last_error = str(exc)
 
     if st.session_state.storyline:
         st.subheader("Verhaallijn (Macro → Micro)")
@@ -1122,22 +2105,13 @@ def main():
 
     if st.session_state.storyline:
         if st.button("Genereer index", key="generate_index_btn"):
-            if not st.session_state.storyline_approved:
-                st.session_state.last_error = "Keurt eerst de verhaallijn goed."
-            else:
-                try:
-                    client = get_client()
-                    st.session_state.index_data = generate_index(
-                        client,
-                        st.session_state.topic,
-                        st.session_state.subject_scan_selected,
-                        st.session_state.storyline,
-                    )
-                    st.session_state.last_error = ""
-                    st.session_state.index_generated = True
+            try:
+                client = get_client()
+                report = run_book_graph(client, targets=["index"], rerun=["index"])
+                if "index" in report["timings"] and not report["errors"]:
                     st.success("Index gegenereerd.")
-                except Exception as exc:
-                    st.session_state.last_error = str(exc)
+            except Exception as exc:
+                st.session_state.last_error = str(exc)
         st.caption(
             f"Status index: {'Gegenereerd' if st.session_state.index_generated else 'Nog niet gegenereerd'}"
         )
@@ -1149,13 +2123,8 @@ def main():
         if st.button("Genereer bronnen per patroon"):
             try:
                 client = get_client()
-                st.session_state.sources_by_number = generate_sources_for_index(
-                    client,
-                    st.session_state.topic,
-                    st.session_state.index_data["index"],
-                    st.session_state.storyline,
-                )
-                st.session_state.last_error = ""
+                shard_nodes = [sources_node(shard) for shard in book_source_shards()]
+                run_book_graph(client, targets=shard_nodes, rerun=shard_nodes)
             except Exception as exc:
                 st.session_state.last_error = str(exc)
 
@@ -1167,66 +2136,91 @@ def main():
 
             st.subheader("Patronen (per hoofdstuk)")
 
-            if st.button("Genereer alle patronen (1 voor 1)"):
+            if st.button("Genereer alle patronen (parallel)"):
                 try:
                     client = get_client()
-                    for item in st.session_state.index_data["index"]:
-                        number = item["number"]
-                        if number in st.session_state.patterns:
-                            continue
-                        try:
-                            pattern = generate_pattern_single(
-                                client,
-                                st.session_state.topic,
-                                item,
-                                st.session_state.sources_by_number.get(number, []),
-                                st.session_state.storyline,
-                                st.session_state.subject_scan_selected,
-                            )
-                            st.session_state.last_raw_ai_output = json.dumps(pattern, ensure_ascii=False, indent=2)
-                            if pattern.get("number") != number:
-                                st.warning(
-                                    f"Patroon {number} kreeg nummer {pattern.get('number')} van de AI; gecorrigeerd."
-                                )
-                            try:
-                                validate_pattern(pattern)
-                            except Exception as exc:
-                                st.warning(f"Patroon {number} validatie: {exc}")
-                            store_pattern(pattern, log_container)
-                            update_progress(progress_placeholder, caption_placeholder)
-                        except Exception as exc:
-                            st.error(f"Patroon {number} mislukt: {exc}")
-                    st.session_state.last_error = ""
+                    run_book_graph(
+                        client,
+                        targets=[
+                            pattern_node(item["number"])
+                            for item in st.session_state.index_data["index"]
+                        ],
+                        log_container=log_container,
+                        progress=(progress_placeholder, caption_placeholder),
+                        lane="bulk",
+                        batch_mode=st.session_state.batch_generation,
+                    )
                 except Exception as exc:
                     st.session_state.last_error = str(exc)
 
+            with st.expander("Batchmodus (offline via de Batch API, goedkoper)", expanded=False):
+                st.checkbox("Lokale batch-simulatie (test)", key="batch_local")
+                extra_books = st.file_uploader(
+                    "Extra boeken (snapshots)",
+                    type=[SNAPSHOT_EXTENSION],
+                    accept_multiple_files=True,
+                    key="batch_snapshots",
+                )
+                if st.button("Verstuur openstaande patronen als batch"):
+                    try:
+                        books = {SESSION_BOOK_ID: session_book()}
+                        for i, uploaded in enumerate(extra_books or [], start=1):
+                            books[f"snapshot{i}"] = load_snapshot(uploaded.getvalue())
+                        record = submit_pattern_batch(get_client(), books, st.session_state.batch_local)
+                        if record is None:
+                            st.info("Geen openstaande patronen met bronnen.")
+                        else:
+                            st.session_state.pattern_batch = record
+                    except Exception as exc:
+                        st.session_state.last_error = str(exc)
+                record = st.session_state.pattern_batch
+                if record:
+                    if st.button("Controleer batch"):
+                        try:
+                            client = get_client()
+                            record["status"] = batch_status(batch_client(client, record["local"]), record["id"])
+                            if record["status"]["status"] in BATCH_TERMINAL_STATUSES and not record["applied"]:
+                                for error in apply_pattern_batch(client, record, log_container):
+                                    st.warning(error)
+                                update_progress(progress_placeholder, caption_placeholder)
+                        except Exception as exc:
+                            st.session_state.last_error = str(exc)
+                    status = record["status"]
+                    st.caption(
+                        f"Batch {record['id']}: {record['requests']} verzoeken"
+                        + (
+                            f" · {status['status']} · {status['completed']}/{status['total']} klaar, "
+                            f"{status['failed']} mislukt"
+                            if status
+                            else " · verstuurd"
+                        )
+                        + (" · verwerkt" if record["applied"] else "")
+                    )
+                    if record["applied"]:
+                        for book_id, book in record["books"].items():
+                            st.download_button(
+                                f"Download bijgewerkte snapshot ({book['short_title'] or book['topic']})",
+                                data=functools.partial(dump_snapshot, book),
+                                file_name=make_safe_filename(
+                                    book["short_title"] or book["topic"], SNAPSHOT_EXTENSION
+                                ),
+                                mime="application/gzip",
+                                key=f"download_batch_{book_id}",
+                            )
+
             if st.session_state.patterns:
                 st.subheader("Gegenereerde Patronen")
-                patterns_sorted = sorted(
-                    st.session_state.patterns.values(), key=lambda p: p["number"], reverse=True
-                )
-                for pattern in patterns_sorted:
+                for block in reversed(book_document(with_front_matter=False)["patterns"]):
                     with st.container():
-                        st.markdown(
-                            f"### {pattern.get('number', '?')}. "
-                            f"{pattern.get('title', 'Niet gegenereerd')} "
-                            f"({pattern.get('scale', '')})"
-                        )
-                        st.markdown(pattern.get("conflict", "Niet gegenereerd"))
-                        analysis_text = get_analysis_text(pattern)
-                        paragraphs = extract_paragraphs(analysis_text)
-                        if paragraphs:
-                            for paragraph in paragraphs:
-                                st.markdown(paragraph)
-                        else:
-                            st.error("Analysis ontbreekt in de AI-output.")
-                        st.markdown(pattern.get("resolution", "Resolutie niet gevonden"))
-                        sources = pattern.get("sources") or []
-                        st.markdown(f"Bronnen: {'; '.join(sources) if sources else 'Niet gegenereerd'}")
+                        show_pattern(block)
                         st.divider()
 
         if st.session_state.sources_by_number:
             st.subheader("Pakketten per patroon")
+            blocks = {
+                block["number"]: block
+                for block in book_document(with_front_matter=False)["patterns"]
+            }
             for item in st.session_state.index_data["index"]:
                 number = item["number"]
                 sources = st.session_state.sources_by_number.get(number, [])
@@ -1237,75 +2231,24 @@ def main():
                         if st.button(f"Genereer patroon {number}", key=f"gen_pkg_{number}"):
                             try:
                                 client = get_client()
-                                pattern = generate_pattern_single(
+                                run_book_graph(
                                     client,
-                                    st.session_state.topic,
-                                    item,
-                                    sources,
-                                    st.session_state.storyline,
-                                    st.session_state.subject_scan_selected,
-                                )
-                                st.session_state.last_raw_ai_output = json.dumps(
-                                    pattern, ensure_ascii=False, indent=2
+                                    targets=[pattern_node(number)],
+                                    rerun=[pattern_node(number)],
+                                    log_container=log_container,
+                                    progress=(progress_placeholder, caption_placeholder),
                                 )
-                                if pattern.get("number") != number:
-                                    st.warning(
-                                        f"Patroon {number} kreeg nummer {pattern.get('number')} van de AI; gecorrigeerd."
-                                    )
-                                try:
-                                    validate_pattern(pattern)
-                                except Exception as exc:
-                                    st.warning(f"Patroon {number} validatie: {exc}")
-                                store_pattern(pattern, log_container)
-                                update_progress(progress_placeholder, caption_placeholder)
-                                st.session_state.last_error = ""
                             except Exception as exc:
                                 st.session_state.last_error = str(exc)
-                        pattern = st.session_state.patterns.get(number)
-                        if pattern:
-                            st.markdown(
-                                f"### {pattern.get('number', '?')}. "
-                                f"{pattern.get('title', 'Niet gegenereerd')} "
-                                f"({pattern.get('scale', '')})"
-                            )
-                            st.markdown(pattern.get("conflict", "Niet gegenereerd"))
-                            analysis_text = get_analysis_text(pattern)
-                            paragraphs = extract_paragraphs(analysis_text)
-                            if paragraphs:
-                                for paragraph in paragraphs:
-                                    st.markdown(paragraph)
-                            else:
-                                st.error("Analysis ontbreekt in de AI-output.")
-                            st.markdown(pattern.get("resolution", "Resolutie niet gevonden"))
-                            sources = pattern.get("sources") or []
-                            st.markdown(
-                                f"Bronnen: {'; '.join(sources) if sources else 'Niet gegenereerd'}"
-                            )
+                        if number in blocks:
+                            show_pattern(blocks[number])
                     st.divider()
 
     if st.session_state.patterns and not st.session_state.sources_by_number:
         st.subheader("Gegenereerde Patronen")
-        patterns_sorted = sorted(
-            st.session_state.patterns.values(), key=lambda p: p["number"], reverse=True
-        )
-        for pattern in patterns_sorted:
+        for block in reversed(book_document(with_front_matter=False)["patterns"]):
             with st.container():
-                st.markdown(
-                    f"### {pattern.get('number', '?')}. "
-                    f"{pattern.get('title', 'Niet gegenereerd')} "
-                    f"({pattern.get('scale', '')})"
-                )
-                st.markdown(pattern.get("conflict", "Niet gegenereerd"))
-                analysis_text = get_analysis_text(pattern)
-                paragraphs = extract_paragraphs(analysis_text)
-                if paragraphs:
-                    for paragraph in paragraphs:
-                        st.markdown(paragraph)
-                else:
-                    st.error("Analysis ontbreekt in de AI-output.")
-                st.markdown(pattern.get("resolution", "Resolutie niet gevonden"))
-                sources = pattern.get("sources") or []
-                st.markdown(f"Bronnen: {'; '.join(sources) if sources else 'Niet gegenereerd'}")
+                show_pattern(block)
                 st.divider()
 
         # Weergave van gegenereerde patronen staat nu boven de pakketten
@@ -1321,33 +2264,21 @@ def main():
         st.subheader("Conversie")
         if st.button("Maak PDF en ePub"):
             try:
-                book_title = st.session_state.short_title or st.session_state.topic
-                markdown_text = assemble_markdown(
-                    book_title,
-                    st.session_state.index_data,
-                    st.session_state.patterns,
-                    st.session_state.front_matter,
-                )
-                st.session_state.markdown = markdown_text
-                tagline = f"Een patroonlandschap rond {book_title}"
+                document = book_document()
+                book_title = document["title"]
+                st.session_state.markdown_file = spool_artifact("book.md", render_markdown(document))
                 pdf_bytes, epub_bytes = convert_with_pandoc(
-                    markdown_text,
-                    book_title,
-                    f"pattern_language_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-                    patterns=list(st.session_state.patterns.values()),
+                    document,
                     author=st.session_state.author.strip() or None,
-                    foreword=st.session_state.front_matter.get("foreword")
-                    if st.session_state.front_matter
-                    else None,
                 )
-                st.session_state.pdf_bytes = pdf_bytes
-                st.session_state.epub_bytes = epub_bytes
+                st.session_state.pdf_file = spool_artifact("book.pdf", pdf_bytes)
+                st.session_state.epub_file = spool_artifact("book.epub", epub_bytes)
                 st.session_state.last_error = ""
                 try:
                     pdf_name = make_safe_filename(book_title, "pdf")
                     epub_name = make_safe_filename(f"{book_title}.kepub", "epub")
-                    pdf_path = upload_to_dropbox(pdf_bytes, pdf_name)
-                    epub_path = upload_to_dropbox(epub_bytes, epub_name)
+                    pdf_path = upload_to_dropbox(st.session_state.pdf_file, pdf_name)
+                    epub_path = upload_to_dropbox(st.session_state.epub_file, epub_name)
                     st.success("Bestand staat voor je klaar in Dropbox!")
                     st.info(f"Geüpload naar: {pdf_path}")
                     st.info(f"Geüpload naar: {epub_path}")
@@ -1364,17 +2295,8 @@ def main():
             use_container_width=True,
         ):
             try:
-                book_title = st.session_state.short_title or st.session_state.topic
-                tagline = f"Een patroonlandschap rond {book_title}"
-                st.session_state.final_pdf_bytes = build_pdf_from_patterns(
-                    book_title,
-                    list(st.session_state.patterns.values()),
-                    foreword=st.session_state.front_matter.get("foreword")
-                    if st.session_state.front_matter
-                    else None,
-                    tagline=tagline,
-                    index_data=st.session_state.index_data,
-                )
+                final_pdf_bytes = export_pdf(book_document())
+                st.session_state.final_pdf_file = spool_artifact("book_final.pdf", final_pdf_bytes)
                 st.session_state.last_error = ""
             except Exception as exc:
                 st.session_state.last_error = str(exc)
@@ -1382,32 +2304,15 @@ def main():
         st.subheader("ePub Export")
         if st.button("Genereer ePub", use_container_width=True):
             try:
-                book_title = st.session_state.short_title or st.session_state.topic
-                if st.session_state.front_matter and st.session_state.index_data:
-                    markdown_text = assemble_markdown(
-                        book_title,
-                        st.session_state.index_data,
-                        st.session_state.patterns,
-                        st.session_state.front_matter,
-                    )
-                else:
-                    markdown_text = assemble_markdown_from_patterns(
-                        book_title,
-                        st.session_state.patterns,
-                    )
-                st.session_state.markdown = markdown_text
-                _, epub_bytes = convert_with_pandoc(
-                    markdown_text,
-                    book_title,
-                    f"pattern_language_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-                    patterns=list(st.session_state.patterns.values()),
-                    author=st.session_state.author.strip() or None,
-                )
-                st.session_state.epub_bytes = epub_bytes
+                document = book_document()
+                book_title = document["title"]
+                st.session_state.markdown_file = spool_artifact("book.md", render_markdown(document))
+                epub_bytes = export_epub(document, author=st.session_state.author.strip() or None)
+                st.session_state.epub_file = spool_artifact("book.epub", epub_bytes)
                 st.session_state.last_error = ""
                 try:
                     epub_name = make_safe_filename(f"{book_title}.kepub", "epub")
-                    epub_path = upload_to_dropbox(epub_bytes, epub_name)
+                    epub_path = upload_to_dropbox(st.session_state.epub_file, epub_name)
                     st.success("Bestand staat voor je klaar in Dropbox!")
                     st.info(f"Geüpload naar: {epub_path}")
                 except Exception as exc:
@@ -1438,9 +2343,9 @@ def main():
                 st.session_state.last_error = str(exc)
 
     if (
-        st.session_state.pdf_bytes
-        or st.session_state.epub_bytes
-        or st.session_state.final_pdf_bytes
+        spool_exists(st.session_state.pdf_file)
+        or spool_exists(st.session_state.epub_file)
+        or spool_exists(st.session_state.final_pdf_file)
     ):
         st.subheader("Export")
         book_title = st.session_state.short_title or st.session_state.topic
@@ -1449,59 +2354,47 @@ def main():
         final_pdf_name = make_safe_filename(f"{book_title}_definitief", "pdf")
         if st.button("Genereer ePub (test)"):
             try:
-                markdown_text = assemble_markdown_from_patterns(
-                    book_title,
-                    st.session_state.patterns,
-                )
-                st.session_state.markdown = markdown_text
-                _, epub_bytes = convert_with_pandoc(
-                    markdown_text,
-                    book_title,
-                    f"pattern_language_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
-                    patterns=list(st.session_state.patterns.values()),
-                    author=st.session_state.author.strip() or None,
-                    foreword=st.session_state.front_matter.get("foreword")
-                    if st.session_state.front_matter
-                    else None,
-                )
-                st.session_state.epub_bytes = epub_bytes
+                document = book_document(with_front_matter=False)
+                st.session_state.markdown_file = spool_artifact("book.md", render_markdown(document))
+                epub_bytes = export_epub(document, author=st.session_state.author.strip() or None)
+                st.session_state.epub_file = spool_artifact("book.epub", epub_bytes)
                 st.session_state.last_error = ""
             except Exception as exc:
                 st.session_state.last_error = str(exc)
-        if st.session_state.pdf_bytes:
+        if spool_exists(st.session_state.pdf_file):
             st.download_button(
                 "Download PDF",
-                data=st.session_state.pdf_bytes,
+                data=functools.partial(spool_read, st.session_state.pdf_file),
                 file_name=pdf_name,
                 mime="application/pdf",
                 key="download_pdf_btn",
             )
-        if st.session_state.epub_bytes:
+        if spool_exists(st.session_state.epub_file):
             st.download_button(
                 "Download ePub",
-                data=st.session_state.epub_bytes,
+                data=functools.partial(spool_read, st.session_state.epub_file),
                 file_name=epub_name,
                 mime="application/epub+zip",
                 key="download_epub_btn",
             )
-        if st.session_state.final_pdf_bytes:
+        if spool_exists(st.session_state.final_pdf_file):
             st.download_button(
                 "Download Definitieve PDF",
-                data=st.session_state.final_pdf_bytes,
+                data=functools.partial(spool_read, st.session_state.final_pdf_file),
                 file_name=final_pdf_name,
                 mime="application/pdf",
                 key="download_final_pdf_btn",
             )
         if st.button("Verstuur naar mijn Kobo (Dropbox)"):
             try:
-                if st.session_state.pdf_bytes:
-                    pdf_path = upload_to_dropbox(st.session_state.pdf_bytes, pdf_name)
+                if spool_exists(st.session_state.pdf_file):
+                    pdf_path = upload_to_dropbox(st.session_state.pdf_file, pdf_name)
                     st.info(f"Geüpload naar: {pdf_path}")
-                if st.session_state.epub_bytes:
-                    epub_path = upload_to_dropbox(st.session_state.epub_bytes, epub_name)
+                if spool_exists(st.session_state.epub_file):
+                    epub_path = upload_to_dropbox(st.session_state.epub_file, epub_name)
                     st.info(f"Geüpload naar: {epub_path}")
-                if st.session_state.final_pdf_bytes:
-                    final_path = upload_to_dropbox(st.session_state.final_pdf_bytes, final_pdf_name)
+                if spool_exists(st.session_state.final_pdf_file):
+                    final_path = upload_to_dropbox(st.session_state.final_pdf_file, final_pdf_name)
                     st.info(f"Geüpload naar: {final_path}")
                 st.success("Bestand staat voor je klaar in Dropbox!")
             except Exception as exc:
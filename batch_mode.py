@@ -0,0 +1,183 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import types
+import uuid
+from datetime import datetime
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_POLL_SECONDS = 60
+BATCH_DIR = os.path.join(tempfile.gettempdir(), "pattern_language_batches")
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+LOCAL_FILES = {}
+LOCAL_BATCHES = {}
+LOCAL_LOCK = threading.Lock()
+
+
+def batch_line(custom_id, body):
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+def write_batch_file(requests):
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    path = os.path.join(BATCH_DIR, f"patterns_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        for custom_id, body in requests.items():
+            f.write(json.dumps(batch_line(custom_id, body), ensure_ascii=False) + "\n")
+    return path
+
+
+def submit_batch(client, path, metadata=None):
+    with open(path, "rb") as f:
+        uploaded = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=uploaded.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=BATCH_COMPLETION_WINDOW,
+        metadata=metadata,
+    )
+    return batch.id
+
+
+def batch_status(client, batch_id):
+    batch = client.batches.retrieve(batch_id)
+    counts = batch.request_counts
+    return {
+        "id": batch.id,
+        "status": batch.status,
+        "total": getattr(counts, "total", 0) if counts else 0,
+        "completed": getattr(counts, "completed", 0) if counts else 0,
+        "failed": getattr(counts, "failed", 0) if counts else 0,
+        "output_file_id": batch.output_file_id,
+        "error_file_id": batch.error_file_id,
+    }
+
+
+def wait_for_batch(client, batch_id, poll_seconds=BATCH_POLL_SECONDS, timeout=None, on_status=None):
+    started = time.monotonic()
+    while True:
+        status = batch_status(client, batch_id)
+        if on_status is not None:
+            on_status(status)
+        if status["status"] in BATCH_TERMINAL_STATUSES:
+            return status
+        if timeout is not None and time.monotonic() - started > timeout:
+            raise TimeoutError(f"Batch {batch_id} is na {timeout}s nog niet klaar ({status['status']}).")
+        time.sleep(poll_seconds)
+
+
+def parse_batch_output(text):
+    results = {}
+    for raw in (text or "").splitlines():
+        if not raw.strip():
+            continue
+        line = json.loads(raw)
+        response = line.get("response") or {}
+        error = line.get("error")
+        if not error and response.get("status_code") != 200:
+            error = (response.get("body") or {}).get("error") or f"HTTP {response.get('status_code')}"
+        if error:
+            message = error.get("message", str(error)) if isinstance(error, dict) else str(error)
+            results[line["custom_id"]] = {"error": message}
+            continue
+        choice = response["body"]["choices"][0]
+        results[line["custom_id"]] = {
+            "content": choice["message"]["content"],
+            "finish_reason": choice.get("finish_reason"),
+        }
+    return results
+
+
+def fetch_batch_results(client, status):
+    results = {}
+    for file_id in (status["error_file_id"], status["output_file_id"]):
+        if file_id:
+            results.update(parse_batch_output(client.files.content(file_id).text))
+    return results
+
+
+def _local_batch_object(batch_id):
+    with LOCAL_LOCK:
+        entry = dict(LOCAL_BATCHES[batch_id])
+    return types.SimpleNamespace(
+        id=batch_id,
+        status=entry["status"],
+        output_file_id=entry["output_file_id"],
+        error_file_id=entry["error_file_id"],
+        request_counts=types.SimpleNamespace(
+            total=entry["total"], completed=entry["completed"], failed=entry["failed"]
+        ),
+    )
+
+
+def _store_local_file(text):
+    file_id = f"file-local-{uuid.uuid4().hex[:12]}"
+    with LOCAL_LOCK:
+        LOCAL_FILES[file_id] = text
+    return file_id
+
+
+def _run_local_batch(batch_id, lines, complete):
+    output = []
+    errors = []
+    for line in lines:
+        try:
+            content = complete(line["body"])
+        except Exception as exc:
+            errors.append({"custom_id": line["custom_id"], "response": None, "error": {"message": str(exc)}})
+            with LOCAL_LOCK:
+                LOCAL_BATCHES[batch_id]["failed"] += 1
+            continue
+        output.append(
+            {
+                "custom_id": line["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "body": {"choices": [{"message": {"content": content}, "finish_reason": "stop"}]},
+                },
+                "error": None,
+            }
+        )
+        with LOCAL_LOCK:
+            LOCAL_BATCHES[batch_id]["completed"] += 1
+    output_file_id = _store_local_file("\n".join(json.dumps(line, ensure_ascii=False) for line in output))
+    error_file_id = (
+        _store_local_file("\n".join(json.dumps(line, ensure_ascii=False) for line in errors)) if errors else None
+    )
+    with LOCAL_LOCK:
+        LOCAL_BATCHES[batch_id].update(
+            {"status": "completed", "output_file_id": output_file_id, "error_file_id": error_file_id}
+        )
+
+
+def local_batch_client(complete):
+    def create_file(file, purpose):
+        return types.SimpleNamespace(id=_store_local_file(file.read().decode("utf-8")))
+
+    def file_content(file_id):
+        with LOCAL_LOCK:
+            return types.SimpleNamespace(text=LOCAL_FILES[file_id])
+
+    def create_batch(input_file_id, endpoint, completion_window, metadata=None):
+        with LOCAL_LOCK:
+            lines = [json.loads(raw) for raw in LOCAL_FILES[input_file_id].splitlines() if raw.strip()]
+            batch_id = f"batch-local-{uuid.uuid4().hex[:12]}"
+            LOCAL_BATCHES[batch_id] = {
+                "status": "in_progress",
+                "total": len(lines),
+                "completed": 0,
+                "failed": 0,
+                "output_file_id": None,
+                "error_file_id": None,
+            }
+        threading.Thread(target=_run_local_batch, args=(batch_id, lines, complete), daemon=True).start()
+        return _local_batch_object(batch_id)
+
+    return types.SimpleNamespace(
+        files=types.SimpleNamespace(create=create_file, content=file_content),
+        batches=types.SimpleNamespace(create=create_batch, retrieve=_local_batch_object),
+    )
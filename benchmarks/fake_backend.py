@@ -0,0 +1,98 @@
+import json
+import re
+import sys
+import threading
+import time
+import types
+
+LATENCY = {"base": 0.05, "per_1k_tokens": 0.25}
+CALLS = {"count": 0, "tokens": 0}
+CALLS_LOCK = threading.Lock()
+
+
+def _topic(text):
+    match = re.search(r"Onderwerp: (.+)", text)
+    return match.group(1).strip() if match else "Onderwerp"
+
+
+def _pattern(number, topic):
+    paragraph = " ".join(["woord"] * 120)
+    return {
+        "number": number,
+        "title": f"{topic} {number}",
+        "scale": "Macro",
+        "conflict": "**Bewoners willen rust, maar de stad vraagt beweging.**",
+        "analysis": "\n\n".join([paragraph] * 3),
+        "resolution": "Therefore, maak ruimte voor beide.",
+        "sources": ["Jacobs — The Death and Life", "Alexander — A Pattern Language", "Gehl — Cities for People"],
+    }
+
+
+def answer(messages):
+    text = messages[-1]["content"]
+    topic = _topic(text)
+    if "index van precies" in text:
+        return {
+            "subject_scan": "x",
+            "index": [
+                {
+                    "number": i,
+                    "title": f"{topic} {i}",
+                    "scale": "Macro",
+                    "description": "een korte beschrijving van dit patroon",
+                }
+                for i in range(1, 21)
+            ],
+        }
+    if "Herstel uitsluitend het veld" in text:
+        field = re.search(r"veld '(\w+)'", text).group(1)
+        pattern = _pattern(0, topic)
+        return {"value": pattern[field]}
+    if "Onderwerp-scan" in text:
+        return {"subject_scan": [f"spanningsas {i}" for i in range(10)]}
+    if "boektitel" in text:
+        return {"title": topic}
+    if "verhaallijn" in text:
+        return {"macro": "macro", "meso": "meso", "micro": "micro"}
+    if "Bronnen: kies" in text:
+        numbers = [int(n) for n in re.findall(r'"number": (\d+)', text.split("Index (titels")[1])]
+        return {"sources": [{"number": n, "sources": _pattern(n, topic)["sources"]} for n in numbers]}
+    if "voorwoord, drie leesinstructies" in text:
+        return {"foreword": "Voorwoord.", "reading_instructions": ["a", "b", "c"], "afterword": "Nawoord."}
+    if "Schrijf één patroon" in text:
+        item = json.loads(re.search(r"Indexitem \(titel \+ description\): (\{.*?\})\n", text).group(1))
+        return {"pattern": _pattern(item["number"], topic)}
+    if "volledige patronen" in text:
+        numbers = json.loads(re.search(r"Indexitem nummers: (\[.*?\])", text).group(1))
+        return {"patterns": [_pattern(n, topic) for n in numbers]}
+    return {"foreword": "Voorwoord."}
+
+
+class Completions:
+    def create(self, **kwargs):
+        max_tokens = kwargs.get("max_tokens") or 1000
+        with CALLS_LOCK:
+            CALLS["count"] += 1
+            CALLS["tokens"] += max_tokens
+        time.sleep(LATENCY["base"] + LATENCY["per_1k_tokens"] * max_tokens / 1000)
+        content = json.dumps(answer(kwargs["messages"]), ensure_ascii=False)
+        message = types.SimpleNamespace(content=content)
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=message, finish_reason="stop")],
+            usage=types.SimpleNamespace(prompt_tokens=len(kwargs["messages"][-1]["content"]) // 4, completion_tokens=len(content) // 4),
+        )
+
+
+class OpenAI:
+    def __init__(self, *args, **kwargs):
+        self.chat = types.SimpleNamespace(completions=Completions())
+
+
+def install(base=None, per_1k_tokens=None):
+    if base is not None:
+        LATENCY["base"] = base
+    if per_1k_tokens is not None:
+        LATENCY["per_1k_tokens"] = per_1k_tokens
+    module = types.ModuleType("openai")
+    module.OpenAI = OpenAI
+    sys.modules["openai"] = module
@@ -0,0 +1,103 @@
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_OUTPUT = os.path.join(ROOT, "benchmarks", "importtime_report.txt")
+
+SCENARIOS = {
+    "cold start (lazy SDKs)": "import app",
+    "cold start + all SDKs loaded": (
+        "import app; app.load_openai(); app.load_fpdf(); app.load_pypandoc(); app.load_dropbox()"
+    ),
+}
+
+PROBE = (
+    "import resource, time; _t = time.perf_counter(); {code}; "
+    "print(time.perf_counter() - _t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+)
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def run_probe(code):
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(code=code)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    seconds, rss_kb = result.stdout.strip().splitlines()[-1].split()
+    return float(seconds), int(rss_kb)
+
+
+def top_level_imports(code):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    totals = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match or len(match.group(3)) > 3:
+            continue
+        package = match.group(4).split(".")[0]
+        if package == "app":
+            continue
+        totals[package] = totals.get(package, 0) + int(match.group(2))
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def git(*args):
+    return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+
+
+def tree_revision():
+    try:
+        revision = git("rev-parse", "--short", "HEAD")
+        dirty = git("status", "--porcelain", "--", "*.py", ":!benchmarks")
+    except (OSError, subprocess.CalledProcessError):
+        return "onbekend"
+    return f"{revision} (met lokale wijzigingen)" if dirty else revision
+
+
+def build_report(repeat, top):
+    lines = [
+        f"Python {sys.version.split()[0]} ({sys.executable}), tree {tree_revision()}",
+        f"{repeat} runs per scenario (median)",
+        "",
+    ]
+    for label, code in SCENARIOS.items():
+        samples = [run_probe(code) for _ in range(repeat)]
+        seconds = statistics.median(sample[0] for sample in samples)
+        rss_mb = statistics.median(sample[1] for sample in samples) / 1024
+        lines.append(f"{label}: {seconds * 1000:.0f} ms import, {rss_mb:.1f} MB max RSS")
+    for label, code in SCENARIOS.items():
+        lines.append("")
+        lines.append(f"-X importtime, packages imported by app.py ({label}):")
+        for package, micros in top_level_imports(code)[:top]:
+            lines.append(f"  {micros / 1000:8.1f} ms  {package}")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Meet de cold start van app.py.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=12)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+    report = build_report(args.repeat, args.top)
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+import argparse
+import asyncio
+import os
+import re
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+APP_PATH = os.path.join(ROOT, "app.py")
+DEFAULT_OUTPUT = os.path.join(ROOT, "benchmarks", "loadtest_report.txt")
+PASSWORD = "loadtest"
+SCAN_SELECTION = 6
+CASSETTE_TOPIC = "Stilte in stad 0"
+SERVER_START_TIMEOUT = 60
+PATTERN_HEADING_RE = re.compile(r"^### (\d+)\. ")
+EXPORT_DOWNLOADS = {
+    "Download PDF": b"%PDF",
+    "Download ePub": b"PK",
+    "Download Definitieve PDF": b"%PDF",
+}
+
+
+def rss_mb(pid=None):
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve(port, secrets_path, base, per_1k_tokens, cassette=None, latency_scale=1.0):
+    sys.path.insert(0, BENCH_DIR)
+    import fake_backend
+    from streamlit.web import cli
+
+    if cassette:
+        os.environ["PATTERN_CASSETTE"] = cassette
+        os.environ["PATTERN_CASSETTE_MODE"] = "replay"
+        os.environ["PATTERN_CASSETTE_LATENCY_SCALE"] = str(latency_scale)
+    fake_backend.install(base=base, per_1k_tokens=per_1k_tokens)
+
+    def report_calls():
+        for _ in sys.stdin:
+            print(f"calls {fake_backend.CALLS['count']}", flush=True)
+
+    threading.Thread(target=report_calls, daemon=True).start()
+    sys.argv = [
+        "streamlit",
+        "run",
+        APP_PATH,
+        "--server.headless=true",
+        "--server.address=127.0.0.1",
+        f"--server.port={port}",
+        "--server.fileWatcherType=none",
+        "--browser.gatherUsageStats=false",
+        f"--secrets.files={secrets_path}",
+    ]
+    cli.main()
+
+
+def start_server(base, per_1k_tokens, cassette=None, latency_scale=1.0):
+    port = free_port()
+    secrets_dir = tempfile.mkdtemp(prefix="loadtest-")
+    secrets_path = os.path.join(secrets_dir, "secrets.toml")
+    with open(secrets_path, "w", encoding="utf-8") as f:
+        f.write(f'APP_PASSWORD = "{PASSWORD}"\nOPENAI_API_KEY = "loadtest"\n')
+    replay = ["--cassette", cassette, "--latency-scale", str(latency_scale)] if cassette else []
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--serve",
+            str(port),
+            "--secrets",
+            secrets_path,
+            "--latency-base",
+            str(base),
+            "--latency-per-1k",
+            str(per_1k_tokens),
+            *replay,
+        ],
+        cwd=ROOT,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while True:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    break
+        except OSError:
+            pass
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise RuntimeError("Streamlit-server startte niet.")
+        time.sleep(0.2)
+    return {"process": process, "port": port}
+
+
+def server_calls(server):
+    process = server["process"]
+    process.stdin.write("calls\n")
+    process.stdin.flush()
+    for line in process.stdout:
+        if line.startswith("calls "):
+            return int(line.split()[1])
+    raise RuntimeError("Streamlit-server is gestopt.")
+
+
+def stop_server(server):
+    server["process"].terminate()
+    try:
+        server["process"].wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        server["process"].kill()
+
+
+async def open_session(port):
+    import websockets
+
+    return {
+        "ws": await websockets.connect(f"ws://127.0.0.1:{port}/_stcore/stream", max_size=None),
+        "port": port,
+        "widgets": {},
+        "elements": {},
+        "cache": {},
+        "requests": 0,
+        "id": "",
+    }
+
+
+async def receive(session):
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    msg = ForwardMsg.FromString(await session["ws"].recv())
+    if msg.WhichOneof("type") == "ref_hash":
+        return session["cache"][msg.ref_hash]
+    if msg.metadata.cacheable:
+        session["cache"][msg.hash] = msg
+    return msg
+
+
+async def rerun(session, *triggers):
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    back = BackMsg()
+    back.rerun_script.query_string = ""
+    for state in session["widgets"].values():
+        back.rerun_script.widget_states.widgets.append(state)
+    for widget_id in triggers:
+        back.rerun_script.widget_states.widgets.add(id=widget_id, trigger_value=True)
+    await session["ws"].send(back.SerializeToString())
+    while True:
+        msg = await receive(session)
+        kind = msg.WhichOneof("type")
+        if kind == "new_session":
+            session["elements"] = {}
+            if msg.new_session.HasField("initialize"):
+                session["id"] = msg.new_session.initialize.session_id
+        elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+            session["elements"][tuple(msg.metadata.delta_path)] = msg.delta.new_element
+        elif kind == "script_finished":
+            if msg.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                raise RuntimeError("app.py compileert niet.")
+            if msg.script_finished == ForwardMsg.FINISHED_SUCCESSFULLY:
+                break
+    for element in session["elements"].values():
+        if element.WhichOneof("type") == "exception":
+            raise RuntimeError(element.exception.message)
+
+
+def widget(session, kind, label=None, key=None):
+    for element in session["elements"].values():
+        if element.WhichOneof("type") != kind:
+            continue
+        proto = getattr(element, kind)
+        if (label is not None and proto.label == label) or (key is not None and proto.id.endswith(f"-{key}")):
+            return proto
+    raise RuntimeError(f"Widget '{label or key}' niet gevonden.")
+
+
+async def set_widget(session, kind, value, label=None, key=None):
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+    widget_id = widget(session, kind, label, key).id
+    field = "bool_value" if isinstance(value, bool) else "string_value"
+    session["widgets"][widget_id] = WidgetState(id=widget_id, **{field: value})
+
+
+async def click(session, label):
+    await rerun(session, widget(session, "button", label).id)
+
+
+async def download(session, label):
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+
+    button = widget(session, "download_button", label)
+    url = button.url
+    if button.deferred_file_id:
+        session["requests"] += 1
+        request_id = f"download-{session['requests']}"
+        back = BackMsg()
+        back.backend_operation_request.request_id = request_id
+        back.backend_operation_request.session_id = session["id"]
+        back.backend_operation_request.deferred_file.file_id = button.deferred_file_id
+        await session["ws"].send(back.SerializeToString())
+        while True:
+            msg = await receive(session)
+            if msg.WhichOneof("type") != "backend_operation_response":
+                continue
+            response = msg.backend_operation_response
+            if response.request_id == request_id:
+                if response.error_msg:
+                    raise RuntimeError(f"{label}: {response.error_msg}")
+                url = response.deferred_file.url
+                break
+    full_url = f"http://127.0.0.1:{session['port']}{url}"
+    return await asyncio.to_thread(lambda: urllib.request.urlopen(full_url, timeout=60).read())
+
+
+def check_exports(session):
+    errors = [
+        element.alert.body
+        for element in session["elements"].values()
+        if element.WhichOneof("type") == "alert" and element.alert.format == element.alert.ERROR
+    ]
+    if errors:
+        raise RuntimeError(f"Export mislukt: {errors[0]}")
+
+
+async def run_session(port, index, record, topic=None):
+    session = await open_session(port)
+
+    async def step(name, action):
+        started = time.perf_counter()
+        await action
+        record(name, time.perf_counter() - started)
+
+    async def select_scan():
+        for i in range(SCAN_SELECTION):
+            await set_widget(session, "checkbox", True, key=f"scan_{i}")
+        await rerun(session)
+
+    async def enter(kind, label, value):
+        await set_widget(session, kind, value, label=label)
+        await rerun(session)
+
+    async def exports():
+        check_exports(session)
+        for label, magic in EXPORT_DOWNLOADS.items():
+            if not (await download(session, label)).startswith(magic):
+                raise RuntimeError(f"{label} levert geen geldig bestand.")
+
+    try:
+        await step("start", rerun(session))
+        await step("wachtwoord", enter("text_input", "Wachtwoord", PASSWORD))
+        await step("onderwerp", enter("text_input", "Onderwerp", topic or f"Stilte in stad {index}"))
+        await step("onderwerp-scan", click(session, "Genereer onderwerp-scan"))
+        await step("selectie", select_scan())
+        await step("verhaallijn", click(session, "Genereer verhaallijn"))
+        await step("goedkeuren", click(session, "Goedkeuren verhaallijn"))
+        await step("index, bronnen, patronen", click(session, "Genereer alles tot volgende goedkeuring"))
+        await step("pdf en epub", click(session, "Maak PDF en ePub"))
+        await step("definitieve pdf", click(session, "Create PDF"))
+        await step("downloads", exports())
+        patterns = {
+            match.group(1)
+            for element in session["elements"].values()
+            if element.WhichOneof("type") == "markdown"
+            for match in [PATTERN_HEADING_RE.match(element.markdown.body)]
+            if match
+        }
+        if len(patterns) != 20:
+            raise RuntimeError(f"{len(patterns)} van 20 patronen gegenereerd.")
+    finally:
+        await session["ws"].close()
+
+
+async def session_worker(port, index, topic):
+    latencies = []
+    error = None
+    try:
+        await run_session(port, index, lambda name, seconds: latencies.append((name, seconds)), topic)
+    except Exception as exc:
+        error = str(exc)
+    return {"completed": error is None, "error": error, "latencies": latencies}
+
+
+async def run_sessions(port, sessions, topic):
+    return await asyncio.gather(*(session_worker(port, i, topic) for i in range(sessions)))
+
+
+def run_level(server, sessions, topic=None):
+    pid = server["process"].pid
+    rss_before = rss_mb(pid)
+    calls_before = server_calls(server)
+    started = time.perf_counter()
+    results = asyncio.run(run_sessions(server["port"], sessions, topic))
+    wall = time.perf_counter() - started
+    return {
+        "completed": sum(result["completed"] for result in results),
+        "errors": [result["error"] for result in results if result["error"]],
+        "wall": wall,
+        "latencies": [sample for result in results for sample in result["latencies"]],
+        "rss_per_session": (rss_mb(pid) - rss_before) / sessions,
+        "model_calls": server_calls(server) - calls_before,
+    }
+
+
+def percentile(samples, q):
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[q - 1]
+
+
+def build_report(levels, base, per_1k_tokens, cassette=None, latency_scale=1.0):
+    if cassette:
+        backend = f"cassette {os.path.basename(cassette)} replayed at {latency_scale:g}x recorded latency"
+    else:
+        backend = f"fake model latency {base:.2f}s + {per_1k_tokens:.2f}s per 1k max_tokens"
+    lines = [
+        f"Python {sys.version.split()[0]}, {backend}",
+        "Rerun latency over all steps of the full flow (topic → scan → storyline → index/sources/patterns → exports).",
+        "All sessions are websocket clients of one Streamlit server (one replica), started together after a",
+        "warm-up book; a session only counts as klaar when it shows no error and its PDF, ePub and final PDF",
+        "downloads are served. MB/sessie is the server RSS growth during a level divided by the sessions.",
+        "",
+        f"{'sessies':>7} {'klaar':>5} {'p50 s':>7} {'p90 s':>7} {'p99 s':>7} {'max s':>7} "
+        f"{'MB/sessie':>9} {'boeken/uur':>10} {'calls':>6}",
+    ]
+    server = start_server(base, per_1k_tokens, cassette, latency_scale)
+    topic = CASSETTE_TOPIC if cassette else None
+    per_step = {}
+    try:
+        warmup = run_level(server, 1, topic)
+        if warmup["errors"]:
+            raise RuntimeError(f"Opwarmboek mislukt: {warmup['errors'][0]}")
+        warm_rss = rss_mb(server["process"].pid)
+        for sessions in levels:
+            result = run_level(server, sessions, topic)
+            samples = [seconds for _, seconds in result["latencies"]]
+            per_session = result["rss_per_session"]
+            books_per_hour = result["completed"] * 3600 / result["wall"]
+            lines.append(
+                f"{sessions:>7} {result['completed']:>5} {percentile(samples, 50):>7.2f} "
+                f"{percentile(samples, 90):>7.2f} {percentile(samples, 99):>7.2f} {max(samples):>7.2f} "
+                f"{per_session:>9.1f} {books_per_hour:>10.0f} {result['model_calls']:>6}"
+            )
+            for name, seconds in result["latencies"]:
+                per_step.setdefault(sessions, {}).setdefault(name, []).append(seconds)
+            for error in result["errors"]:
+                lines.append(f"        fout: {error}")
+    finally:
+        stop_server(server)
+    lines.append("")
+    lines.append(f"Warme server na import en opwarmboek: {warm_rss:.0f} MB RSS")
+    lines.append("")
+    lines.append("p90 per stap (s):")
+    steps = list(next(iter(per_step.values()), {}))
+    lines.append(f"  {'stap':<26}" + "".join(f"{f'N={n}':>8}" for n in per_step))
+    for name in steps:
+        lines.append(
+            f"  {name:<26}"
+            + "".join(f"{percentile(per_step[n].get(name, [0.0]), 90):>8.2f}" for n in per_step)
+        )
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Belast app.py met N gelijktijdige sessies.")
+    parser.add_argument("--sessions", default="1,2,4,8")
+    parser.add_argument("--latency-base", type=float, default=0.05)
+    parser.add_argument("--latency-per-1k", type=float, default=0.25)
+    parser.add_argument("--cassette", help="Speel opgenomen modelverkeer af in plaats van de nep-backend.")
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--secrets", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve is not None:
+        serve(args.serve, args.secrets, args.latency_base, args.latency_per_1k, args.cassette, args.latency_scale)
+        return
+    levels = [int(n) for n in args.sessions.split(",")]
+    cassette = os.path.abspath(args.cassette) if args.cassette else None
+    report = build_report(levels, args.latency_base, args.latency_per_1k, cassette, args.latency_scale)
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, "microbench_report.txt")
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "microbench_baseline.json")
+SCALE_FACTOR = 4
+SUPERLINEAR_EXPONENT = 1.4
+REGRESSION_RATIO = 1.5
+
+WORDS = (
+    "de stad vraagt beweging terwijl bewoners rust zoeken en het plein tussen markt en kade "
+    "draagt beide ritmes zonder dat een van beide verdwijnt"
+).split()
+UNICODE_SOUP = "Ĳsselmeer — “citaat” ‘enkel’ … • café naïef Zoë 😀 漢字 ﬁ é ​ "
+
+
+def words(count, offset=0):
+    return " ".join(WORDS[(offset + i) % len(WORDS)] for i in range(count))
+
+
+def pattern(number=1, paragraphs=3, words_per_paragraph=120):
+    return {
+        "number": number,
+        "title": f"Plein met twee ritmes {number}",
+        "scale": "Meso",
+        "conflict": "**Bewoners willen rust, maar de stad vraagt beweging.**",
+        "analysis": "\n\n".join(words(words_per_paragraph, i) for i in range(paragraphs)),
+        "resolution": "Therefore, geef het plein een stille rand en een levendige kern.",
+        "sources": [
+            "Jane Jacobs — The Death and Life of Great American Cities",
+            "Christopher Alexander — A Pattern Language",
+            "Jan Gehl — Cities for People",
+        ],
+    }
+
+
+def markdown_book(count):
+    blocks = []
+    for i in range(1, count + 1):
+        item = pattern(i)
+        blocks.append(
+            f"### {i}. {item['title']} (Meso)\n\n{item['conflict']}\n\n{item['analysis']}\n\n"
+            f"{item['resolution']}\n\nBronnen: {'; '.join(item['sources'])}\n"
+        )
+    return "\n".join(blocks)
+
+
+def malformed_markdown(count):
+    lines = []
+    for i in range(count):
+        lines.append(f"###{i}.Titel zonder schaal ((Macro)")
+        lines.append("**onafgesloten vet " + words(12, i))
+        lines.append("Resolution:" if i % 2 else "# Resolution")
+        lines.append("Bronnen:" + ";" * (i % 5))
+    return "### 1. Begin\n" + "\n".join(lines)
+
+
+def load_cases():
+    sys.path.insert(0, ROOT)
+    import app
+    from document import extract_paragraphs, get_analysis_text, normalize_pdf_text
+
+    def validate(value):
+        try:
+            app.validate_pattern(value)
+        except ValueError:
+            pass
+
+    def safe_filename(title):
+        return app.make_safe_filename(title, "pdf")
+
+    defective = dict(pattern(), title="Titel: met dubbele punt", conflict="niet vet", sources="a; b")
+    return [
+        ("extract_paragraphs/realistisch", extract_paragraphs, lambda n: pattern()["analysis"], False),
+        ("extract_paragraphs/lang", extract_paragraphs, lambda n: "\n\n".join(words(40, i) for i in range(n)), True),
+        ("extract_paragraphs/lijst", extract_paragraphs, lambda n: [words(20, i) if i % 3 else "  " for i in range(n)], True),
+        ("get_analysis_text/analysis", get_analysis_text, lambda n: pattern(), False),
+        ("get_analysis_text/paragraphs", get_analysis_text, lambda n: {"paragraphs": [words(40, i) for i in range(n)]}, True),
+        ("extract_patterns_from_text/boek", app.extract_patterns_from_text, lambda n: markdown_book(20), False),
+        ("extract_patterns_from_text/koppen", app.extract_patterns_from_text, lambda n: markdown_book(n), True),
+        ("extract_patterns_from_text/witruimte", app.extract_patterns_from_text, lambda n: "### 1. T\nx" + " \n" * (20 * n) + "x", True),
+        ("extract_patterns_from_text/onafgesloten", app.extract_patterns_from_text, lambda n: "### 1. T\n**" + words(40 * n), True),
+        ("extract_patterns_from_text/kapot", app.extract_patterns_from_text, malformed_markdown, True),
+        ("validate_pattern/geldig", validate, lambda n: pattern(), False),
+        ("validate_pattern/defect", validate, lambda n: defective, False),
+        ("validate_pattern/lang", validate, lambda n: pattern(paragraphs=3, words_per_paragraph=40 * n), True),
+        ("is_incomplete_pattern/geldig", app.is_incomplete_pattern, lambda n: pattern(), False),
+        ("is_incomplete_pattern/lang", app.is_incomplete_pattern, lambda n: pattern(paragraphs=n), True),
+        ("normalize_pdf_text/alinea", normalize_pdf_text, lambda n: words(120), False),
+        ("normalize_pdf_text/unicode", normalize_pdf_text, lambda n: UNICODE_SOUP * (4 * n), True),
+        ("make_safe_filename/titel", safe_filename, lambda n: "Stilte in de stad", False),
+        ("make_safe_filename/unicode", safe_filename, lambda n: UNICODE_SOUP * n, True),
+    ]
+
+
+def time_per_op(func, value, min_time):
+    calls = 0
+    started = time.perf_counter()
+    elapsed = 0.0
+    while calls < 3 or elapsed < min_time:
+        func(value)
+        calls += 1
+        elapsed = time.perf_counter() - started
+    return elapsed / calls
+
+
+def peak_kib(func, value):
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        func(value)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (peak - before) / 1024
+
+
+def measure(cases, size, min_time):
+    results = {}
+    for name, func, make, scales in cases:
+        value = make(size)
+        seconds = time_per_op(func, value, min_time)
+        result = {"ops_per_sec": 1 / seconds, "peak_kib": peak_kib(func, value), "exponent": None}
+        if scales:
+            larger = time_per_op(func, make(size * SCALE_FACTOR), min_time)
+            result["exponent"] = math.log(larger / seconds) / math.log(SCALE_FACTOR)
+        results[name] = result
+    return results
+
+
+def regressions(result, baseline):
+    found = []
+    if result["exponent"] is not None and result["exponent"] > SUPERLINEAR_EXPONENT:
+        found.append(f"superlineair (n^{result['exponent']:.2f})")
+    if baseline:
+        if result["ops_per_sec"] * REGRESSION_RATIO < baseline["ops_per_sec"]:
+            found.append(f"{baseline['ops_per_sec'] / result['ops_per_sec']:.1f}x trager")
+        if result["peak_kib"] > REGRESSION_RATIO * baseline["peak_kib"] + 1:
+            found.append(f"{result['peak_kib'] / max(baseline['peak_kib'], 1e-9):.1f}x meer geheugen")
+    return found
+
+
+def build_report(results, size, baseline):
+    lines = [
+        f"Python {sys.version.split()[0]}, schaal n={size} (schaaltest n vs {SCALE_FACTOR}n), "
+        f"piekgeheugen via tracemalloc per aanroep",
+        f"Regressie: >{REGRESSION_RATIO}x trager of meer geheugen dan de baseline, of exponent >{SUPERLINEAR_EXPONENT}.",
+        "",
+        f"{'case':<40} {'ops/s':>12} {'piek KiB':>9} {'exponent':>8} {'vs base':>8}  signaal",
+    ]
+    flagged = 0
+    for name, result in results.items():
+        base = (baseline or {}).get("cases", {}).get(name)
+        ratio = f"{result['ops_per_sec'] / base['ops_per_sec']:.2f}x" if base else "-"
+        exponent = f"{result['exponent']:.2f}" if result["exponent"] is not None else "-"
+        found = regressions(result, base)
+        flagged += bool(found)
+        lines.append(
+            f"{name:<40} {result['ops_per_sec']:>12,.0f} {result['peak_kib']:>9.1f} {exponent:>8} {ratio:>8}  "
+            f"{', '.join(found)}"
+        )
+    lines.append("")
+    lines.append(f"{flagged} van {len(results)} cases gemarkeerd.")
+    return "\n".join(lines) + "\n", flagged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks voor de tekstverwerking in app.py en document.py.")
+    parser.add_argument("--size", type=int, default=200)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--filter", default="")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true", help="Exitcode 1 bij een gemarkeerde case.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+    cases = [case for case in load_cases() if args.filter in case[0]]
+    results = measure(cases, args.size, args.min_time)
+    baseline = None
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    report, flagged = build_report(results, args.size, baseline)
+    with open(args.output, "w", encoding="utf-8") as f:
+        f.write(report)
+    print(report)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(
+                {"python": sys.version.split()[0], "size": args.size, "cases": results},
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+            f.write("\n")
+    if args.check and flagged:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
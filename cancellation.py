@@ -0,0 +1,164 @@
+import itertools
+import threading
+import types
+from concurrent.futures import CancelledError, wait
+from contextlib import contextmanager
+
+CANCELLED_MESSAGE = "Generatie geannuleerd."
+
+RUNS = {}
+CANCEL_STATS = {"runs": 0, "cancelled": 0, "branches_cancelled": 0, "closed_streams": 0}
+CANCEL_LOCK = threading.Lock()
+
+_local = threading.local()
+_closer_ids = itertools.count()
+
+
+def current_token():
+    return getattr(_local, "token", None)
+
+
+def attach_token(token):
+    _local.token = token
+
+
+@contextmanager
+def run_token(token):
+    previous = current_token()
+    attach_token(token)
+    try:
+        yield token
+    finally:
+        attach_token(previous)
+
+
+def start_run(session):
+    token = {"session": session, "event": threading.Event(), "closers": {}}
+    with CANCEL_LOCK:
+        RUNS.setdefault(session, []).append(token)
+        CANCEL_STATS["runs"] += 1
+    return token
+
+
+def branch_token(parent):
+    token = {
+        "session": parent["session"] if parent else None,
+        "event": threading.Event(),
+        "closers": {},
+        "branch": True,
+    }
+    if is_cancelled(parent):
+        token["event"].set()
+    return token
+
+
+def finish_run(token):
+    with CANCEL_LOCK:
+        live = [run for run in RUNS.get(token["session"], []) if run is not token]
+        if live:
+            RUNS[token["session"]] = live
+        else:
+            RUNS.pop(token["session"], None)
+
+
+def release_run(token, futures=()):
+    pending = [future for future in futures if not future.done()]
+    if not pending:
+        finish_run(token)
+        return
+
+    def drain():
+        wait(pending)
+        finish_run(token)
+
+    threading.Thread(target=drain, daemon=True).start()
+
+
+def cancel(token):
+    with CANCEL_LOCK:
+        if token["event"].is_set():
+            return False
+        token["event"].set()
+        closers = list(token["closers"].values())
+        token["closers"].clear()
+        CANCEL_STATS["branches_cancelled" if token.get("branch") else "cancelled"] += 1
+    for close in closers:
+        try:
+            close()
+        except Exception:
+            pass
+    return True
+
+
+def cancel_session(session):
+    with CANCEL_LOCK:
+        tokens = list(RUNS.get(session, []))
+    return any([cancel(token) for token in tokens])
+
+
+def is_cancelled(token):
+    return token is not None and token["event"].is_set()
+
+
+def raise_if_cancelled(token):
+    if is_cancelled(token):
+        raise CancelledError(CANCELLED_MESSAGE)
+
+
+@contextmanager
+def on_cancel(token, close):
+    closer_id = next(_closer_ids)
+    with CANCEL_LOCK:
+        registered = not token["event"].is_set()
+        if registered:
+            token["closers"][closer_id] = close
+    if not registered:
+        close()
+        raise CancelledError(CANCELLED_MESSAGE)
+    try:
+        yield
+    finally:
+        with CANCEL_LOCK:
+            token["closers"].pop(closer_id, None)
+
+
+def _close_stream(stream):
+    with CANCEL_LOCK:
+        CANCEL_STATS["closed_streams"] += 1
+    stream.close()
+
+
+def collect_stream(stream, token):
+    parts = []
+    finish_reason = None
+    usage = None
+    try:
+        with on_cancel(token, lambda: _close_stream(stream)):
+            for chunk in stream:
+                if chunk.choices:
+                    choice = chunk.choices[0]
+                    if choice.delta and choice.delta.content:
+                        parts.append(choice.delta.content)
+                    finish_reason = choice.finish_reason or finish_reason
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+    except Exception as exc:
+        if is_cancelled(token):
+            raise CancelledError(CANCELLED_MESSAGE) from exc
+        raise
+    finally:
+        stream.close()
+    raise_if_cancelled(token)
+    return types.SimpleNamespace(
+        choices=[
+            types.SimpleNamespace(message=types.SimpleNamespace(content="".join(parts)), finish_reason=finish_reason)
+        ],
+        usage=usage or types.SimpleNamespace(prompt_tokens=0, completion_tokens=0),
+    )
+
+
+def cancel_stats():
+    with CANCEL_LOCK:
+        stats = dict(CANCEL_STATS)
+        stats["active"] = sum(len(tokens) for tokens in RUNS.values())
+    return stats
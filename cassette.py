@@ -0,0 +1,122 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+import types
+from datetime import datetime
+
+CASSETTE_VERSION = 1
+
+CASSETTE_LOCK = threading.Lock()
+
+
+def request_key(body):
+    payload = json.dumps(body, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _append(path, record):
+    line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+    with CASSETTE_LOCK:
+        if not os.path.exists(path):
+            header = {"kind": "header", "version": CASSETTE_VERSION, "created": datetime.now().isoformat(timespec="seconds")}
+            line = json.dumps(header, separators=(",", ":")).encode("utf-8") + b"\n" + line
+        with gzip.open(path, "ab") as f:
+            f.write(line)
+
+
+def _response_record(response):
+    choice = response.choices[0]
+    usage = getattr(response, "usage", None)
+    return {
+        "content": choice.message.content,
+        "finish_reason": getattr(choice, "finish_reason", None),
+        "usage": {
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        },
+    }
+
+
+def _response_object(record):
+    message = types.SimpleNamespace(content=record["content"])
+    return types.SimpleNamespace(
+        choices=[types.SimpleNamespace(message=message, finish_reason=record["finish_reason"])],
+        usage=types.SimpleNamespace(**record["usage"]),
+    )
+
+
+def _client(create, client=None):
+    return types.SimpleNamespace(
+        chat=types.SimpleNamespace(completions=types.SimpleNamespace(create=create)),
+        files=getattr(client, "files", None),
+        batches=getattr(client, "batches", None),
+    )
+
+
+def recording_client(client, path):
+    def create(timeout=None, **body):
+        started = time.perf_counter()
+        options = {"timeout": timeout} if timeout is not None else {}
+        response = client.chat.completions.create(**body, **options)
+        seconds = time.perf_counter() - started
+        _append(
+            path,
+            {
+                "kind": "interaction",
+                "key": request_key(body),
+                "model": body.get("model"),
+                "seconds": round(seconds, 4),
+                "request": body,
+                "response": _response_record(response),
+            },
+        )
+        return response
+
+    return _client(create, client)
+
+
+def load_cassette(path):
+    interactions = {}
+    header = None
+    try:
+        with gzip.open(path, "rb") as f:
+            for raw in f:
+                if not raw.strip():
+                    continue
+                record = json.loads(raw)
+                if record["kind"] == "header":
+                    header = header or record
+                elif record["kind"] == "interaction":
+                    interactions.setdefault(record["key"], []).append(record)
+    except (OSError, EOFError, KeyError, ValueError) as exc:
+        raise RuntimeError(f"Cassette kan niet worden gelezen: {exc}") from exc
+    if header is None or header.get("version") != CASSETTE_VERSION:
+        raise RuntimeError(f"Cassette-versie {(header or {}).get('version')} wordt niet ondersteund.")
+    return {"header": header, "interactions": interactions, "served": {}, "lock": threading.Lock()}
+
+
+def replay_client(cassette, latency_scale=1.0):
+    def create(timeout=None, **body):
+        key = request_key(body)
+        records = cassette["interactions"].get(key)
+        if not records:
+            raise RuntimeError(f"Cassette bevat geen opname voor dit {body.get('model')}-verzoek.")
+        with cassette["lock"]:
+            served = cassette["served"].get(key, 0)
+            cassette["served"][key] = served + 1
+        record = records[served % len(records)]
+        if latency_scale:
+            time.sleep(record["seconds"] * latency_scale)
+        return _response_object(record["response"])
+
+    return _client(create)
+
+
+def cassette_stats(cassette):
+    with cassette["lock"]:
+        served = sum(cassette["served"].values())
+    recorded = sum(len(records) for records in cassette["interactions"].values())
+    return {"recorded": recorded, "requests": len(cassette["interactions"]), "served": served}
@@ -0,0 +1,101 @@
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError
+
+from export_cache import export_key
+
+DIGEST_TOKEN_BUDGET = 600
+DIGEST_CHARS_PER_TOKEN = 4
+DIGEST_CONFLICT_WORDS = 24
+DIGEST_RESOLUTION_WORDS = 18
+SUMMARY_CACHE_MAX_ENTRIES = 2048
+
+SUMMARIES = OrderedDict()
+SUMMARY_STATS = {"hits": 0, "misses": 0, "failures": 0}
+SUMMARY_LOCK = threading.Lock()
+
+
+def estimate_tokens(text):
+    return -(-len(text) // DIGEST_CHARS_PER_TOKEN)
+
+
+def _words(text, limit):
+    words = re.sub(r"[*_`#]", "", text or "").split()
+    if len(words) <= limit:
+        return " ".join(words)
+    return " ".join(words[:limit]) + " …"
+
+
+def _first_sentence(text):
+    match = re.match(r"(.+?[.!?])(\s|$)", (text or "").strip(), re.S)
+    return match.group(1) if match else (text or "").strip()
+
+
+def digest_line(pattern, summary=None):
+    head = f"{pattern.get('number', '?')}. {pattern.get('title') or '?'}"
+    if summary:
+        return f"{head}: {_words(summary, DIGEST_CONFLICT_WORDS + DIGEST_RESOLUTION_WORDS)}"
+    conflict = _words(pattern.get("conflict"), DIGEST_CONFLICT_WORDS)
+    resolution = _words(_first_sentence(pattern.get("resolution")), DIGEST_RESOLUTION_WORDS)
+    return f"{head}: {conflict} → {resolution}"
+
+
+def summary_key(pattern):
+    return export_key(
+        "digest-summary",
+        {field: pattern.get(field) for field in ("number", "title", "conflict", "analysis", "resolution")},
+    )
+
+
+def cached_summary(pattern, summarize):
+    key = summary_key(pattern)
+    with SUMMARY_LOCK:
+        if key in SUMMARIES:
+            SUMMARIES.move_to_end(key)
+            SUMMARY_STATS["hits"] += 1
+            return SUMMARIES[key]
+    try:
+        summary = summarize(pattern)
+    except CancelledError:
+        raise
+    except Exception:
+        with SUMMARY_LOCK:
+            SUMMARY_STATS["failures"] += 1
+        return None
+    with SUMMARY_LOCK:
+        SUMMARY_STATS["misses"] += 1
+        SUMMARIES[key] = summary
+        while len(SUMMARIES) > SUMMARY_CACHE_MAX_ENTRIES:
+            SUMMARIES.popitem(last=False)
+    return summary
+
+
+def rolling_digest(patterns, number, budget=DIGEST_TOKEN_BUDGET, summarize=None):
+    earlier = sorted(n for n in patterns if n < number)
+    lines = []
+    used = 0
+    for n in reversed(earlier):
+        pattern = patterns[n]
+        full = digest_line(pattern, cached_summary(pattern, summarize) if summarize else None)
+        short = f"{n}. {pattern.get('title') or '?'}"
+        for line in (full, short):
+            cost = estimate_tokens(line) + 1
+            if used + cost <= budget:
+                lines.append(line)
+                used += cost
+                break
+        else:
+            break
+    lines.reverse()
+    dropped = len(earlier) - len(lines)
+    if dropped:
+        lines.insert(0, f"(+{dropped} eerdere patronen weggelaten)")
+    return "\n".join(lines)
+
+
+def summary_stats():
+    with SUMMARY_LOCK:
+        stats = dict(SUMMARY_STATS)
+        stats["entries"] = len(SUMMARIES)
+    return stats
@@ -0,0 +1,277 @@
+import threading
+from collections import OrderedDict
+
+from unidecode import unidecode
+
+from export_cache import export_key
+from tracing import traced
+
+DOCUMENT_CACHE_MAX_ENTRIES = 16
+PLACEHOLDER = "Niet gegenereerd"
+PDF_FONT = "Helvetica"
+PDF_CHAR_REPLACEMENTS = {
+    "—": "-",
+    "–": "-",
+    "“": '"',
+    "”": '"',
+    "‘": "'",
+    "’": "'",
+    "…": "...",
+    "•": "-",
+}
+
+DOCUMENTS = OrderedDict()
+DOCUMENT_LOCK = threading.Lock()
+
+
+def extract_paragraphs(paragraphs_value):
+    if isinstance(paragraphs_value, list):
+        return [p for p in (p.strip() for p in paragraphs_value) if p]
+    if isinstance(paragraphs_value, str):
+        return [p for p in (p.strip() for p in paragraphs_value.split("\n\n")) if p]
+    return []
+
+
+def get_analysis_text(pattern):
+    if "analysis" in pattern and pattern.get("analysis"):
+        return pattern.get("analysis", "")
+    paragraphs = pattern.get("paragraphs", [])
+    if isinstance(paragraphs, list):
+        return "\n\n".join(paragraphs)
+    return paragraphs or ""
+
+
+def normalize_pdf_text(text):
+    cleaned = unidecode(text or "")
+    for old, new in PDF_CHAR_REPLACEMENTS.items():
+        cleaned = cleaned.replace(old, new)
+    try:
+        return cleaned.encode("latin-1").decode("latin-1")
+    except UnicodeEncodeError:
+        return cleaned.encode("latin-1", "replace").decode("latin-1")
+
+
+def pattern_block(pattern):
+    number = pattern.get("number", "?")
+    title = pattern.get("title") or PLACEHOLDER
+    scale = pattern.get("scale", "")
+    sources = [source.strip() for source in pattern.get("sources") or [] if source.strip()]
+    return {
+        "number": number,
+        "heading": f"{number}. {title} ({scale})",
+        "conflict": (pattern.get("conflict") or "").strip(),
+        "paragraphs": extract_paragraphs(get_analysis_text(pattern)),
+        "resolution": (pattern.get("resolution") or "").strip(),
+        "sources": "; ".join(sources),
+    }
+
+
+@traced
+def _build_document(title, patterns, index_data, front_matter):
+    front = None
+    if front_matter:
+        front = {
+            "foreword": extract_paragraphs(front_matter.get("foreword") or ""),
+            "reading_instructions": list(front_matter.get("reading_instructions") or []),
+            "afterword": extract_paragraphs(front_matter.get("afterword") or ""),
+        }
+    return {
+        "title": title,
+        "tagline": f"Een patroonlandschap rond {title}",
+        "front": front,
+        "index": [
+            f"{item['number']}. {item['title']} — {item['description']}"
+            for item in (index_data or {}).get("index", [])
+        ],
+        "patterns": [pattern_block(patterns[number]) for number in sorted(patterns)],
+    }
+
+
+def build_document(title, patterns, index_data=None, front_matter=None, patterns_key=None):
+    version = export_key(
+        "document",
+        {
+            "title": title,
+            "patterns": patterns_key or export_key("patterns", patterns),
+            "index_data": index_data,
+            "front_matter": front_matter,
+        },
+    )
+    with DOCUMENT_LOCK:
+        if version in DOCUMENTS:
+            DOCUMENTS.move_to_end(version)
+            return DOCUMENTS[version]
+    document = _build_document(title, patterns, index_data, front_matter)
+    document["version"] = version
+    with DOCUMENT_LOCK:
+        DOCUMENTS[version] = document
+        while len(DOCUMENTS) > DOCUMENT_CACHE_MAX_ENTRIES:
+            DOCUMENTS.popitem(last=False)
+    return document
+
+
+@traced
+def pdf_text(document):
+    if "pdf" not in document:
+        front = document["front"] or {}
+        text = {
+            "title": normalize_pdf_text(document["title"]),
+            "tagline": normalize_pdf_text(document["tagline"]),
+            "index": [normalize_pdf_text(line) for line in document["index"]],
+            "foreword": [normalize_pdf_text(p) for p in front.get("foreword", [])],
+            "patterns": [
+                {
+                    "heading": normalize_pdf_text(block["heading"]),
+                    "conflict": normalize_pdf_text(block["conflict"]),
+                    "paragraphs": [normalize_pdf_text(p) for p in block["paragraphs"]],
+                    "resolution": normalize_pdf_text(block["resolution"]),
+                    "sources": normalize_pdf_text(block["sources"]),
+                }
+                for block in document["patterns"]
+            ],
+        }
+        with DOCUMENT_LOCK:
+            cached = DOCUMENTS.get(document["version"])
+            if cached is not None and "pdf" not in cached:
+                DOCUMENTS[document["version"]] = dict(cached, pdf=text)
+        return text
+    return document["pdf"]
+
+
+def _chapter(chapter_id, title, lines):
+    return {"id": chapter_id, "title": title, "markdown": "\n".join(lines)}
+
+
+def markdown_chapters(document):
+    front = document["front"]
+    full = bool(front and document["index"])
+    opening = [f"# {document['title']}", ""]
+    if full and front["foreword"]:
+        opening.extend(["\n\n".join(front["foreword"]), ""])
+    chapters = [_chapter("titel", document["title"], opening)]
+    if full:
+        instructions = ["## Leesinstructies"]
+        for i, text in enumerate(front["reading_instructions"], start=1):
+            instructions.extend([f"Leesinstructie {i}: {text}", ""])
+        chapters.append(_chapter("leesinstructies", "Leesinstructies", instructions))
+        index = ["## Index van patronen"]
+        for line in document["index"]:
+            index.extend([line, ""])
+        chapters.append(_chapter("index", "Index van patronen", index))
+    chapters.append(_chapter("patronen", "Patronen", ["## Patronen"]))
+    for block in document["patterns"]:
+        lines = [f"## {block['heading']}", ""]
+        lines.extend([block["conflict"] or PLACEHOLDER, ""])
+        for paragraph in block["paragraphs"]:
+            lines.extend([paragraph, ""])
+        lines.extend([block["resolution"] or PLACEHOLDER, ""])
+        lines.extend([f"Bronnen: {block['sources'] or PLACEHOLDER}", ""])
+        chapters.append(_chapter(f"patroon-{block['number']}", block["heading"], lines))
+    if full:
+        afterword = ["## Nawoord", "\n\n".join(front["afterword"]), ""]
+        chapters.append(_chapter("nawoord", "Nawoord", afterword))
+    return chapters
+
+
+@traced
+def render_markdown(document):
+    return "\n".join(chapter["markdown"] for chapter in markdown_chapters(document))
+
+
+def _new_pdf(FPDF):
+    pdf = FPDF()
+    pdf.set_margins(left=22, top=24, right=22)
+    pdf.set_auto_page_break(auto=True, margin=24)
+    pdf.add_page()
+    return pdf
+
+
+def _heading(pdf, value, size, height=9):
+    pdf.set_font(PDF_FONT, style="B", size=size)
+    pdf.multi_cell(0, height, value)
+
+
+def _paragraph(pdf, value):
+    pdf.multi_cell(0, 7, value)
+    pdf.ln(1)
+
+
+def _draw_title(pdf, text):
+    _heading(pdf, text["title"], 20, height=10)
+    pdf.ln(4)
+    pdf.set_font(PDF_FONT, size=12)
+    pdf.multi_cell(0, 7, text["tagline"])
+
+
+def _draw_index(pdf, text):
+    _heading(pdf, "Index", 16)
+    pdf.ln(2)
+    pdf.set_font(PDF_FONT, size=12)
+    for line in text["index"]:
+        _paragraph(pdf, line)
+
+
+def _draw_foreword(pdf, text):
+    _heading(pdf, "Voorwoord", 16)
+    pdf.ln(2)
+    pdf.set_font(PDF_FONT, size=12)
+    for value in text["foreword"]:
+        _paragraph(pdf, value)
+
+
+def _draw_pattern(pdf, block):
+    _heading(pdf, block["heading"], 14, height=8)
+    pdf.ln(1)
+    pdf.set_font(PDF_FONT, size=12)
+    for value in [block["conflict"], *block["paragraphs"], block["resolution"]]:
+        if value:
+            _paragraph(pdf, value)
+    if block["sources"]:
+        pdf.set_font(PDF_FONT, style="I", size=11)
+        pdf.multi_cell(0, 6, f"Bronnen: {block['sources']}")
+        pdf.set_font(PDF_FONT, size=12)
+        pdf.ln(2)
+
+
+PDF_SECTION_DRAWERS = {
+    "title": _draw_title,
+    "index": _draw_index,
+    "foreword": _draw_foreword,
+    "pattern": _draw_pattern,
+}
+
+
+@traced
+def render_pdf(document, FPDF):
+    text = pdf_text(document)
+    pdf = _new_pdf(FPDF)
+    pdf.set_title(document["title"])
+    _draw_title(pdf, text)
+    pdf.add_page()
+    if text["index"]:
+        _draw_index(pdf, text)
+    pdf.add_page()
+    if text["foreword"]:
+        _draw_foreword(pdf, text)
+        pdf.add_page()
+    for block in text["patterns"]:
+        _draw_pattern(pdf, block)
+    return bytes(pdf.output())
+
+
+def pdf_sections(document):
+    text = pdf_text(document)
+    sections = [{"kind": "title", "outline": document["title"], "title": text["title"], "tagline": text["tagline"]}]
+    if text["index"]:
+        sections.append({"kind": "index", "outline": "Index", "index": text["index"]})
+    if text["foreword"]:
+        sections.append({"kind": "foreword", "outline": "Voorwoord", "foreword": text["foreword"]})
+    for block, source in zip(text["patterns"], document["patterns"]):
+        sections.append({"kind": "pattern", "outline": source["heading"], **block})
+    return sections
+
+
+def render_pdf_section(section, FPDF):
+    pdf = _new_pdf(FPDF)
+    PDF_SECTION_DRAWERS[section["kind"]](pdf, section)
+    return bytes(pdf.output())
@@ -0,0 +1,146 @@
+import io
+import uuid
+import zipfile
+from datetime import datetime, timezone
+
+from tracing import span, traced
+
+EPUB_LANGUAGE = "nl"
+EPUB_CSS = (
+    "body { font-family: serif; font-size: 9pt; line-height: 1.2; margin: 1.2em; }\n"
+    "h1, h2, h3 { font-family: sans-serif; }\n"
+    "h1 { font-size: 1.6em; margin-top: 0.6em; }\n"
+    "h2 { font-size: 1.3em; margin-top: 0.8em; }\n"
+    "h3 { font-size: 1.1em; margin-top: 0.8em; }\n"
+    "p { margin: 0 0 0.8em 0; }\n"
+)
+EPUB_COVER_COLORS = ["#1f2937", "#374151", "#1e3a8a", "#334155", "#0f172a"]
+PANDOC_FORMAT = "markdown-raw_html-raw_attribute-auto_identifiers"
+
+
+def escape_xml_text(text):
+    return (
+        text.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+        .replace('"', "&quot;")
+        .replace("'", "&apos;")
+    )
+
+
+def epub_cover_svg(title):
+    safe_title = (title or "").strip()
+    bg = EPUB_COVER_COLORS[sum(ord(c) for c in safe_title) % len(EPUB_COVER_COLORS)]
+    subtitle = "A Pattern Language"
+    return (
+        "<?xml version='1.0' encoding='UTF-8'?>"
+        "<svg xmlns='http://www.w3.org/2000/svg' width='1600' height='2560' viewBox='0 0 1600 2560'>"
+        f"<rect width='1600' height='2560' fill='{bg}'/>"
+        "<rect x='140' y='320' width='1320' height='1920' fill='none' stroke='#ffffff' stroke-width='4'/>"
+        f"<text x='800' y='1180' text-anchor='middle' font-family='Helvetica, Arial, sans-serif' "
+        "font-size='110' fill='#ffffff'>"
+        f"{escape_xml_text(safe_title)}</text>"
+        f"<text x='800' y='1320' text-anchor='middle' font-family='Helvetica, Arial, sans-serif' "
+        "font-size='52' fill='#e5e7eb'>"
+        f"{escape_xml_text(subtitle)}</text>"
+        "</svg>"
+    )
+
+
+@traced
+def markdown_to_xhtml(pypandoc, texts):
+    marker = f"HOOFDSTUKGRENS{uuid.uuid4().hex}"
+    with span("pandoc:chapters", chapters=len(texts)):
+        html = pypandoc.convert_text(f"\n\n{marker}\n\n".join(texts), "html5", format=PANDOC_FORMAT)
+    bodies = [body.strip() for body in html.split(f"<p>{marker}</p>")]
+    if len(bodies) != len(texts):
+        raise RuntimeError("Pandoc gaf een onverwacht aantal hoofdstukken terug.")
+    return bodies
+
+
+def _xhtml_page(title, body):
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" '
+        f'xml:lang="{EPUB_LANGUAGE}" lang="{EPUB_LANGUAGE}">\n'
+        f"<head><meta charset=\"utf-8\" /><title>{escape_xml_text(title)}</title>"
+        '<link rel="stylesheet" type="text/css" href="stylesheet.css" /></head>\n'
+        f"<body>\n{body}\n</body>\n</html>\n"
+    )
+
+
+def _package(title, author, identifier, chapters):
+    modified = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    creator = f"<dc:creator>{escape_xml_text(author)}</dc:creator>" if author else ""
+    manifest = "".join(
+        f'<item id="{chapter["id"]}" href="{chapter["id"]}.xhtml" media-type="application/xhtml+xml" />'
+        for chapter in chapters
+    )
+    spine = "".join(f'<itemref idref="{chapter["id"]}" />' for chapter in chapters)
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="bookid">'
+        '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+        f'<dc:identifier id="bookid">{identifier}</dc:identifier>'
+        f"<dc:title>{escape_xml_text(title)}</dc:title>{creator}"
+        f"<dc:language>{EPUB_LANGUAGE}</dc:language>"
+        f'<meta property="dcterms:modified">{modified}</meta>'
+        '<meta name="cover" content="cover-image" />'
+        "</metadata><manifest>"
+        '<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav" />'
+        '<item id="ncx" href="toc.ncx" media-type="application/x-dtbncx+xml" />'
+        '<item id="style" href="stylesheet.css" media-type="text/css" />'
+        '<item id="cover-image" href="cover.svg" media-type="image/svg+xml" properties="cover-image" />'
+        '<item id="cover" href="cover.xhtml" media-type="application/xhtml+xml" />'
+        f'{manifest}</manifest><spine toc="ncx"><itemref idref="cover" />{spine}</spine>'
+        "</package>\n"
+    )
+
+
+def _nav(title, chapters):
+    items = "".join(
+        f'<li><a href="{chapter["id"]}.xhtml">{escape_xml_text(chapter["title"])}</a></li>' for chapter in chapters
+    )
+    return _xhtml_page(title, f'<nav epub:type="toc" id="toc"><h1>Inhoud</h1><ol>{items}</ol></nav>')
+
+
+def _ncx(title, identifier, chapters):
+    points = "".join(
+        f'<navPoint id="nav-{chapter["id"]}" playOrder="{i}"><navLabel><text>{escape_xml_text(chapter["title"])}'
+        f'</text></navLabel><content src="{chapter["id"]}.xhtml" /></navPoint>'
+        for i, chapter in enumerate(chapters, start=1)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">'
+        f'<head><meta name="dtb:uid" content="{identifier}" /></head>'
+        f"<docTitle><text>{escape_xml_text(title)}</text></docTitle>"
+        f"<navMap>{points}</navMap></ncx>\n"
+    )
+
+
+@traced
+def assemble_epub(title, author, identifier, chapters, bodies):
+    cover = _xhtml_page(title, f'<div id="cover-image"><img src="cover.svg" alt="{escape_xml_text(title)}" /></div>')
+    files = {
+        "META-INF/container.xml": (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+            '<rootfiles><rootfile full-path="EPUB/content.opf" media-type="application/oebps-package+xml" />'
+            "</rootfiles></container>\n"
+        ),
+        "EPUB/content.opf": _package(title, author, identifier, chapters),
+        "EPUB/nav.xhtml": _nav(title, chapters),
+        "EPUB/toc.ncx": _ncx(title, identifier, chapters),
+        "EPUB/stylesheet.css": EPUB_CSS,
+        "EPUB/cover.svg": epub_cover_svg(title),
+        "EPUB/cover.xhtml": cover,
+    }
+    for chapter, body in zip(chapters, bodies):
+        files[f"EPUB/{chapter['id']}.xhtml"] = _xhtml_page(chapter["title"], body)
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w") as archive:
+        archive.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        for name, content in files.items():
+            archive.writestr(name, content, compress_type=zipfile.ZIP_DEFLATED)
+    return output.getvalue()
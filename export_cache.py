@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+EXPORT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+EXPORT_CACHE_MAX_DISK_BYTES = 512 * 1024 * 1024
+EXPORT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "pattern_language_exports")
+FRAGMENT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+MEMORY = OrderedDict()
+MEMORY_BYTES = {"total": 0}
+FRAGMENTS = OrderedDict()
+FRAGMENT_BYTES = {"total": 0}
+CACHE_STATS = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "fragment_hits": 0, "fragment_misses": 0}
+CACHE_LOCK = threading.Lock()
+
+
+def export_key(fmt, inputs):
+    payload = json.dumps(
+        {"format": fmt, "inputs": inputs},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _disk_path(key):
+    return os.path.join(EXPORT_CACHE_DIR, f"{key}.bin")
+
+
+def _spill(key, data):
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    path = _disk_path(key)
+    if os.path.exists(path):
+        os.utime(path)
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    _trim_disk()
+
+
+def _trim_disk():
+    entries = []
+    for name in os.listdir(EXPORT_CACHE_DIR):
+        if not name.endswith(".bin"):
+            continue
+        path = os.path.join(EXPORT_CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= EXPORT_CACHE_MAX_DISK_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def _load_from_disk(key):
+    path = _disk_path(key)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)
+    except OSError:
+        return None
+    return data
+
+
+def _remember(key, data):
+    if key in MEMORY:
+        MEMORY_BYTES["total"] -= len(MEMORY.pop(key))
+    MEMORY[key] = data
+    MEMORY_BYTES["total"] += len(data)
+    while MEMORY_BYTES["total"] > EXPORT_CACHE_MAX_BYTES:
+        old_key, old_data = MEMORY.popitem(last=False)
+        MEMORY_BYTES["total"] -= len(old_data)
+        try:
+            _spill(old_key, old_data)
+        except OSError:
+            pass
+
+
+def cached_export(fmt, inputs, build):
+    key = export_key(fmt, inputs)
+    with CACHE_LOCK:
+        if key in MEMORY:
+            MEMORY.move_to_end(key)
+            CACHE_STATS["memory_hits"] += 1
+            return MEMORY[key]
+        data = _load_from_disk(key)
+        if data is not None:
+            CACHE_STATS["disk_hits"] += 1
+            _remember(key, data)
+            return data
+    data = build()
+    with CACHE_LOCK:
+        CACHE_STATS["misses"] += 1
+        _remember(key, data)
+    return data
+
+
+def _remember_fragment(key, data):
+    if key in FRAGMENTS:
+        FRAGMENT_BYTES["total"] -= len(FRAGMENTS.pop(key))
+    FRAGMENTS[key] = data
+    FRAGMENT_BYTES["total"] += len(data)
+    while FRAGMENT_BYTES["total"] > FRAGMENT_CACHE_MAX_BYTES and len(FRAGMENTS) > 1:
+        _, old_data = FRAGMENTS.popitem(last=False)
+        FRAGMENT_BYTES["total"] -= len(old_data)
+
+
+def cached_fragments(fmt, inputs, render):
+    keys = [export_key(fmt, value) for value in inputs]
+    found = {}
+    with CACHE_LOCK:
+        for key in keys:
+            if key in FRAGMENTS:
+                FRAGMENTS.move_to_end(key)
+                found[key] = FRAGMENTS[key]
+        CACHE_STATS["fragment_hits"] += sum(1 for key in keys if key in found)
+    missing = {}
+    for key, value in zip(keys, inputs):
+        if key not in found:
+            missing.setdefault(key, value)
+    if missing:
+        rendered = render(list(missing.values()))
+        with CACHE_LOCK:
+            CACHE_STATS["fragment_misses"] += len(missing)
+            for key, data in zip(missing, rendered):
+                found[key] = data
+                _remember_fragment(key, data)
+    return [found[key] for key in keys]
+
+
+def cache_stats():
+    with CACHE_LOCK:
+        stats = dict(CACHE_STATS)
+        stats["memory_entries"] = len(MEMORY)
+        stats["memory_bytes"] = MEMORY_BYTES["total"]
+        stats["fragment_entries"] = len(FRAGMENTS)
+        stats["fragment_bytes"] = FRAGMENT_BYTES["total"]
+    return stats
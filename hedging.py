@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+from contextlib import nullcontext
+
+from cancellation import branch_token, cancel, current_token, on_cancel, run_token
+from pipeline import context_executor
+from singleflight import bypassing
+
+HEDGE_QUANTILE = 0.9
+HEDGE_MIN_SAMPLES = 8
+HEDGE_WINDOW = 200
+HEDGE_BUDGET_RATIO = 0.1
+
+LATENCIES = {}
+HEDGE_STATS = {"calls": 0, "hedged": 0, "hedge_wins": 0, "losers_cancelled": 0}
+HEDGE_LOCK = threading.Lock()
+
+
+def record_latency(stage, seconds):
+    with HEDGE_LOCK:
+        LATENCIES.setdefault(stage, deque(maxlen=HEDGE_WINDOW)).append(seconds)
+
+
+def latency_quantile(stage, quantile=HEDGE_QUANTILE):
+    with HEDGE_LOCK:
+        samples = sorted(LATENCIES.get(stage, ()))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return None
+    return samples[min(len(samples) - 1, int(quantile * len(samples)))]
+
+
+def latency_summary():
+    with HEDGE_LOCK:
+        snapshot = {stage: sorted(samples) for stage, samples in LATENCIES.items()}
+    summary = {}
+    for stage, samples in snapshot.items():
+        if samples:
+            summary[stage] = {
+                "count": len(samples),
+                "p50": samples[len(samples) // 2],
+                "p90": samples[min(len(samples) - 1, int(0.9 * len(samples)))],
+            }
+    return summary
+
+
+def hedge_stats():
+    with HEDGE_LOCK:
+        return dict(HEDGE_STATS)
+
+
+def _reserve_hedge():
+    with HEDGE_LOCK:
+        if HEDGE_STATS["hedged"] + 1 > HEDGE_BUDGET_RATIO * HEDGE_STATS["calls"]:
+            return False
+        HEDGE_STATS["hedged"] += 1
+        return True
+
+
+def _timed(call, token):
+    started = time.perf_counter()
+    with run_token(token):
+        result = call()
+    return result, time.perf_counter() - started
+
+
+def _cancel_losers(tokens):
+    for token in tokens:
+        if cancel(token):
+            with HEDGE_LOCK:
+                HEDGE_STATS["losers_cancelled"] += 1
+
+
+def _cancel_all(tokens):
+    for token in list(tokens.values()):
+        cancel(token)
+
+
+def _race(stage, call, is_valid, threshold, executor, tokens, parent):
+    primary_token = branch_token(parent)
+    primary = executor.submit(_timed, call, primary_token)
+    tokens[primary] = primary_token
+    running = {primary}
+    done, _ = wait(running, timeout=threshold)
+    if not done and _reserve_hedge():
+        hedge_token = branch_token(parent)
+        hedge = executor.submit(_timed, bypassing(call), hedge_token)
+        tokens[hedge] = hedge_token
+        running.add(hedge)
+    last_exc = None
+    fallback = None
+    while running:
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+            running.discard(future)
+            try:
+                result, seconds = future.result()
+            except Exception as exc:
+                last_exc = exc
+                continue
+            record_latency(stage, seconds)
+            if is_valid is None or is_valid(result):
+                _cancel_losers([tokens[other] for other in running if not other.done()])
+                if future is not primary:
+                    with HEDGE_LOCK:
+                        HEDGE_STATS["hedge_wins"] += 1
+                return result
+            if fallback is None:
+                fallback = result
+    if fallback is not None:
+        return fallback
+    raise last_exc
+
+
+def hedged_call(stage, call, is_valid=None, enabled=True):
+    with HEDGE_LOCK:
+        HEDGE_STATS["calls"] += 1
+    threshold = latency_quantile(stage) if enabled else None
+    if threshold is None:
+        started = time.perf_counter()
+        result = call()
+        record_latency(stage, time.perf_counter() - started)
+        return result
+
+    parent = current_token()
+    tokens = {}
+    executor = context_executor(max_workers=2)
+    guard = on_cancel(parent, lambda: _cancel_all(tokens)) if parent else nullcontext()
+    try:
+        with guard:
+            return _race(stage, call, is_valid, threshold, executor, tokens, parent)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
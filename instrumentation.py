@@ -0,0 +1,64 @@
+import threading
+
+
+CONNECTION_METRICS = {"requests": 0, "connections": 0, "tls_handshakes": 0}
+CONNECTION_METRICS_LOCK = threading.Lock()
+
+
+def count_connection_event(event_name, info):
+    if event_name == "connection.connect_tcp.complete":
+        key = "connections"
+    elif event_name == "connection.start_tls.complete":
+        key = "tls_handshakes"
+    else:
+        return
+    with CONNECTION_METRICS_LOCK:
+        CONNECTION_METRICS[key] += 1
+
+
+def trace_openai_request(request):
+    request.extensions["trace"] = count_connection_event
+    with CONNECTION_METRICS_LOCK:
+        CONNECTION_METRICS["requests"] += 1
+
+
+def connection_metrics():
+    with CONNECTION_METRICS_LOCK:
+        metrics = dict(CONNECTION_METRICS)
+    if metrics["requests"]:
+        metrics["reuse_ratio"] = 1 - metrics["connections"] / metrics["requests"]
+    else:
+        metrics["reuse_ratio"] = 0.0
+    return metrics
+
+
+STAGE_METRICS = {}
+STAGE_METRICS_LOCK = threading.Lock()
+
+
+def record_stage_call(stage, seconds, response):
+    usage = getattr(response, "usage", None)
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    with STAGE_METRICS_LOCK:
+        metrics = STAGE_METRICS.setdefault(stage, {"calls": 0, "seconds": 0.0, "completion_tokens": 0})
+        metrics["calls"] += 1
+        metrics["seconds"] += seconds
+        metrics["completion_tokens"] += completion_tokens
+
+
+def stage_report(stage_config):
+    rows = []
+    for stage, config in stage_config.items():
+        with STAGE_METRICS_LOCK:
+            metrics = dict(STAGE_METRICS.get(stage, {"calls": 0, "seconds": 0.0, "completion_tokens": 0}))
+        calls = metrics["calls"]
+        rows.append(
+            {
+                "stage": stage,
+                **config,
+                "calls": calls,
+                "avg_seconds": metrics["seconds"] / calls if calls else 0.0,
+                "avg_completion_tokens": metrics["completion_tokens"] / calls if calls else 0.0,
+            }
+        )
+    return rows
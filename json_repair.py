@@ -0,0 +1,147 @@
+import json
+import re
+
+WHITESPACE = " \t\r\n"
+CLOSERS = {"{": "}", "[": "]"}
+PRIMITIVE_RE = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null")
+
+
+def _string_end(text, start):
+    i = start + 1
+    while i < len(text):
+        ch = text[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if ch == '"':
+            return i + 1
+        i += 1
+    return -1
+
+
+def _snapshot(stack):
+    return [dict(frame) for frame in stack]
+
+
+def _close(prefix, stack):
+    return prefix + "".join(CLOSERS[frame["type"]] for frame in reversed(stack))
+
+
+def _open_string_prefix(text, start):
+    body = text[start:]
+    body = re.sub(r"\\u[0-9a-fA-F]{0,3}$", "", body)
+    if (len(body) - len(body.rstrip("\\"))) % 2:
+        body = body[:-1]
+    return body + '"'
+
+
+def _truncation_path(stack):
+    path = []
+    for frame in stack:
+        if frame["state"] != "value":
+            break
+        path.append(frame["key"] if frame["type"] == "{" else frame["index"])
+    return path
+
+
+def repair_truncated_json(text):
+    text = text or ""
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        return None, None
+    start = min(starts)
+    try:
+        value, _ = json.JSONDecoder().raw_decode(text, start)
+        return value, None
+    except ValueError:
+        pass
+
+    stack = []
+    safe = None
+    open_string = None
+    i = start
+
+    def complete_value(end):
+        nonlocal safe
+        if stack:
+            stack[-1]["state"] = "comma"
+        safe = (end, _snapshot(stack))
+
+    while i < len(text):
+        ch = text[i]
+        if ch in WHITESPACE:
+            i += 1
+            continue
+        top = stack[-1] if stack else None
+        if top is None and i > start:
+            break
+        expecting_value = top is None or top["state"] == "value"
+        if ch == '"':
+            end = _string_end(text, i)
+            if end < 0:
+                open_string = i
+                break
+            if top is not None and top["type"] == "{" and top["state"] == "key":
+                try:
+                    top["key"] = json.loads(text[i:end])
+                except ValueError:
+                    break
+                top["state"] = "colon"
+            elif expecting_value:
+                complete_value(end)
+            else:
+                break
+            i = end
+            continue
+        if ch in CLOSERS:
+            if not expecting_value:
+                break
+            stack.append(
+                {"type": ch, "state": "key" if ch == "{" else "value", "key": None, "index": 0}
+            )
+            safe = (i + 1, _snapshot(stack))
+            i += 1
+            continue
+        if ch in "}]":
+            if top is None or CLOSERS[top["type"]] != ch or top["state"] == "colon":
+                break
+            stack.pop()
+            complete_value(i + 1)
+            i += 1
+            continue
+        if ch == ":":
+            if top is None or top["type"] != "{" or top["state"] != "colon":
+                break
+            top["state"] = "value"
+            i += 1
+            continue
+        if ch == ",":
+            if top is None or top["state"] != "comma":
+                break
+            if top["type"] == "{":
+                top["state"] = "key"
+                top["key"] = None
+            else:
+                top["state"] = "value"
+                top["index"] += 1
+            i += 1
+            continue
+        match = PRIMITIVE_RE.match(text, i) if expecting_value else None
+        if not match or match.end() >= len(text):
+            break
+        complete_value(match.end())
+        i = match.end()
+
+    path = _truncation_path(stack)
+    candidates = []
+    if open_string is not None and stack and stack[-1]["state"] == "value":
+        prefix = text[start:open_string] + _open_string_prefix(text, open_string)
+        candidates.append(_close(prefix, stack))
+    if safe is not None:
+        candidates.append(_close(text[start:safe[0]], safe[1]))
+    for candidate in candidates:
+        try:
+            return json.loads(candidate), path
+        except ValueError:
+            continue
+    return None, path
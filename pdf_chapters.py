@@ -0,0 +1,70 @@
+import io
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from document import pdf_sections, render_pdf_section
+from export_cache import cached_fragments
+from tracing import span, traced
+
+PDF_WORKERS = int(os.getenv("PATTERN_PDF_WORKERS", "0")) or os.cpu_count() or 1
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pdf_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _drop_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def render_sections(sections, FPDF):
+    pool = pdf_pool()
+    chunksize = max(1, len(sections) // (PDF_WORKERS * 4))
+    try:
+        return list(pool.map(render_pdf_section, sections, itertools.repeat(FPDF), chunksize=chunksize))
+    except BrokenProcessPool:
+        _drop_pool(pool)
+        return [render_pdf_section(section, FPDF) for section in sections]
+
+
+def merge_pdf_sections(title, sections, parts, pypdf):
+    writer = pypdf.PdfWriter()
+    front_pages = 0
+    for section, data in zip(sections, parts):
+        writer.append(io.BytesIO(data), outline_item=section["outline"])
+        if section["kind"] != "pattern":
+            front_pages = len(writer.pages)
+    total = len(writer.pages)
+    if front_pages:
+        writer.set_page_label(0, front_pages - 1, style="/r", start=1)
+    if total > front_pages:
+        writer.set_page_label(front_pages, total - 1, style="/D", start=1)
+    writer.add_metadata({"/Title": title})
+    writer.page_mode = "/UseOutlines"
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+@traced
+def render_pdf_chapters(document, FPDF, pypdf):
+    sections = pdf_sections(document)
+    with span("pdf:chapters", sections=len(sections), workers=PDF_WORKERS):
+        parts = cached_fragments("pdf-section", sections, lambda missing: render_sections(missing, FPDF))
+    with span("pdf:merge", bytes=sum(len(part) for part in parts)):
+        return merge_pdf_sections(document["title"], sections, parts, pypdf)
@@ -0,0 +1,223 @@
+import functools
+import threading
+import time
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from cancellation import attach_token, current_token
+from scheduler import attach_lane, current_lane
+from tracing import attach_trace, current_trace, span
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+    from streamlit.runtime.scriptrunner_utils.script_run_context import SCRIPT_RUN_CONTEXT_ATTR_NAME
+except Exception:
+    add_script_run_ctx = None
+    get_script_run_ctx = None
+    SCRIPT_RUN_CONTEXT_ATTR_NAME = None
+
+
+MAX_PIPELINE_WORKERS = 8
+WAIT_HEARTBEAT_SECONDS = 0.5
+
+ABANDONED = {}
+ABANDONED_LOCK = threading.Lock()
+
+SCRIPT_THREADS = weakref.WeakKeyDictionary()
+DETACHED_CONTEXTS = weakref.WeakValueDictionary()
+SCRIPT_LOCK = threading.Lock()
+
+
+def task(name, run, deps=(), after=()):
+    return {"name": name, "kind": "task", "run": run, "deps": tuple(deps), "after": tuple(after)}
+
+
+def gate(name, check, message, deps=()):
+    return {"name": name, "kind": "gate", "check": check, "message": message, "deps": tuple(deps), "after": ()}
+
+
+def required_nodes(nodes, targets=None, done=()):
+    if targets is None:
+        targets = [name for name, node in nodes.items() if node["kind"] == "task"]
+    needed = set()
+    stack = [name for name in targets if name in nodes and name not in done]
+    while stack:
+        name = stack.pop()
+        if name in needed:
+            continue
+        needed.add(name)
+        stack.extend(dep for dep in nodes[name]["deps"] if dep in nodes and dep not in done)
+    return needed
+
+
+def critical_path(nodes, timings):
+    finish = {}
+    previous = {}
+
+    def longest(name):
+        if name in finish:
+            return finish[name]
+        start, end = timings.get(name, (0.0, 0.0))
+        best_dep, best = None, 0.0
+        for dep in (*nodes[name]["deps"], *nodes[name]["after"]):
+            if dep in nodes and dep in timings and longest(dep) > best:
+                best_dep, best = dep, longest(dep)
+        finish[name] = best + (end - start)
+        previous[name] = best_dep
+        return finish[name]
+
+    if not timings:
+        return [], 0.0
+    tail = max(timings, key=longest)
+    path = []
+    while tail is not None:
+        path.append(tail)
+        tail = previous.get(tail)
+    path.reverse()
+    return path, finish[path[-1]]
+
+
+def _script_run(ctx):
+    return getattr(ctx, "parallel_coordinator", None) or ctx
+
+
+def _attach_script_context(ctx, trace, lane, token):
+    if ctx is not None and add_script_run_ctx is not None:
+        with SCRIPT_LOCK:
+            if id(_script_run(ctx)) not in DETACHED_CONTEXTS:
+                add_script_run_ctx(threading.current_thread(), ctx)
+                SCRIPT_THREADS[threading.current_thread()] = ctx
+    attach_trace(trace)
+    attach_lane(lane)
+    attach_token(token)
+
+
+def context_executor(max_workers=MAX_PIPELINE_WORKERS):
+    ctx = get_script_run_ctx() if get_script_run_ctx is not None else None
+    return ThreadPoolExecutor(
+        max_workers=max_workers,
+        initializer=_attach_script_context,
+        initargs=(ctx, current_trace(), current_lane(), current_token()),
+    )
+
+
+def detach_script_context():
+    ctx = get_script_run_ctx(suppress_warning=True) if get_script_run_ctx is not None else None
+    if ctx is None:
+        return
+    with SCRIPT_LOCK:
+        DETACHED_CONTEXTS[id(_script_run(ctx))] = _script_run(ctx)
+        for thread in [thread for thread, attached in SCRIPT_THREADS.items() if attached is ctx]:
+            setattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, None)
+            del SCRIPT_THREADS[thread]
+
+
+def _timed(name, run, inputs, started):
+    begin = time.perf_counter() - started
+    with span(f"node:{name}"):
+        return begin, run(inputs)
+
+
+def keep_abandoned(key, futures, keep=None):
+    def store(name, future):
+        if future.cancelled() or future.exception() is not None or (keep is not None and not keep()):
+            return
+        with ABANDONED_LOCK:
+            ABANDONED.setdefault(key, {})[name] = future.result()[1]
+
+    for name, future in futures.items():
+        future.add_done_callback(functools.partial(store, name))
+
+
+def take_abandoned(key):
+    with ABANDONED_LOCK:
+        return ABANDONED.pop(key, {})
+
+
+def run_graph(nodes, targets=None, done=None, on_result=None, max_workers=MAX_PIPELINE_WORKERS, on_wait=None,
+              on_abandon=None):
+    results = {name: value for name, value in (done or {}).items() if name in nodes}
+    needed = required_nodes(nodes, targets, results)
+    errors = {}
+    blocked = {}
+    skipped = {}
+    timings = {}
+    running = {}
+    pending = [name for name in nodes if name in needed]
+    started = time.perf_counter()
+
+    def settle(name, value):
+        try:
+            if on_result is not None:
+                on_result(name, value)
+            results[name] = value
+        except Exception as exc:
+            errors[name] = exc
+
+    executor = context_executor(max_workers)
+    try:
+        while True:
+            changed = True
+            while changed:
+                changed = False
+                for name in list(pending):
+                    node = nodes[name]
+                    stuck = [
+                        dep for dep in node["deps"]
+                        if dep in errors or dep in blocked or dep in skipped
+                    ]
+                    if stuck:
+                        skipped[name] = stuck[0]
+                        pending.remove(name)
+                        changed = True
+                        continue
+                    if not all(dep in results for dep in node["deps"]):
+                        continue
+                    if any(dep in pending or dep in running.values() for dep in node["after"]):
+                        continue
+                    pending.remove(name)
+                    changed = True
+                    inputs = {dep: results[dep] for dep in (*node["deps"], *node["after"]) if dep in results}
+                    if node["kind"] == "gate":
+                        if node["check"]():
+                            settle(name, True)
+                        else:
+                            blocked[name] = node["message"]
+                        continue
+                    running[executor.submit(_timed, name, node["run"], inputs, started)] = name
+            if not running:
+                break
+            finished, _ = wait(
+                list(running),
+                timeout=WAIT_HEARTBEAT_SECONDS if on_wait is not None else None,
+                return_when=FIRST_COMPLETED,
+            )
+            if not finished:
+                on_wait(sorted(running.values()))
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    begin, value = future.result()
+                except Exception as exc:
+                    errors[name] = exc
+                    continue
+                timings[name] = (begin, time.perf_counter() - started)
+                settle(name, value)
+    except BaseException:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if on_abandon is not None:
+            on_abandon({name: future for future, name in running.items()})
+        raise
+    executor.shutdown(wait=True)
+
+    path, path_time = critical_path(nodes, timings)
+    return {
+        "results": results,
+        "errors": errors,
+        "blocked": blocked,
+        "skipped": skipped,
+        "timings": timings,
+        "wall_time": time.perf_counter() - started,
+        "critical_path": path,
+        "critical_path_time": path_time,
+    }
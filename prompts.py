@@ -45,3 +45,8 @@ Te praktisch? Of precies goed?
 STARTOPDRACHT
 Begin met de Scherpstelling en de Index voor het onderwerp: [ONDERWERP].
 """
+
+SUMMARY_SYSTEM_PROMPT = (
+    "Je vat patronen uit een Pattern Language-boek samen voor de context van volgende patronen. "
+    "Schrijf zakelijk Nederlands en antwoord uitsluitend met JSON."
+)
@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import CancelledError
+from contextlib import contextmanager
+
+from tracing import span
+
+MODEL_CONCURRENCY = int(os.getenv("PATTERN_MODEL_CONCURRENCY", "16"))
+INTERACTIVE_RESERVED = int(os.getenv("PATTERN_INTERACTIVE_RESERVED", "2"))
+LANES = ("interactive", "bulk")
+WAIT_WINDOW = 500
+SLOT_POLL_SECONDS = 0.25
+
+SCHEDULER = {
+    "queues": {lane: OrderedDict() for lane in LANES},
+    "running": {},
+    "waits": {lane: deque(maxlen=WAIT_WINDOW) for lane in LANES},
+    "granted": {lane: 0 for lane in LANES},
+    "withdrawn": 0,
+}
+SCHEDULER_LOCK = threading.Lock()
+
+_local = threading.local()
+
+
+def current_lane():
+    return getattr(_local, "lane", "interactive")
+
+
+def attach_lane(lane):
+    _local.lane = lane
+
+
+@contextmanager
+def model_lane(lane):
+    previous = current_lane()
+    attach_lane(lane)
+    try:
+        yield
+    finally:
+        attach_lane(previous)
+
+
+def _running_total():
+    return sum(SCHEDULER["running"].values())
+
+
+def _lane_limit(lane):
+    if lane == "interactive":
+        return MODEL_CONCURRENCY
+    return max(1, MODEL_CONCURRENCY - INTERACTIVE_RESERVED)
+
+
+def _next_waiter(lane):
+    queues = SCHEDULER["queues"][lane]
+    if not queues or _running_total() >= _lane_limit(lane):
+        return None
+    running = SCHEDULER["running"]
+    session = min(queues, key=lambda name: running.get(name, 0))
+    waiters = queues[session]
+    waiter = waiters.popleft()
+    if waiters:
+        queues.move_to_end(session)
+    else:
+        del queues[session]
+    return waiter
+
+
+def _dispatch():
+    while True:
+        waiter = _next_waiter("interactive") or _next_waiter("bulk")
+        if waiter is None:
+            return
+        session = waiter["session"]
+        SCHEDULER["running"][session] = SCHEDULER["running"].get(session, 0) + 1
+        SCHEDULER["granted"][waiter["lane"]] += 1
+        SCHEDULER["waits"][waiter["lane"]].append(time.perf_counter() - waiter["enqueued"])
+        waiter["event"].set()
+
+
+def _release(session):
+    with SCHEDULER_LOCK:
+        SCHEDULER["running"][session] -= 1
+        if not SCHEDULER["running"][session]:
+            del SCHEDULER["running"][session]
+        _dispatch()
+
+
+def _withdraw(waiter):
+    with SCHEDULER_LOCK:
+        if waiter["event"].is_set():
+            return False
+        queues = SCHEDULER["queues"][waiter["lane"]]
+        waiters = queues[waiter["session"]]
+        waiters.remove(waiter)
+        if not waiters:
+            del queues[waiter["session"]]
+        SCHEDULER["withdrawn"] += 1
+        return True
+
+
+@contextmanager
+def model_slot(session, lane=None, cancel=None):
+    lane = lane or current_lane()
+    waiter = {"session": session, "lane": lane, "enqueued": time.perf_counter(), "event": threading.Event()}
+    with SCHEDULER_LOCK:
+        SCHEDULER["queues"][lane].setdefault(session, deque()).append(waiter)
+        _dispatch()
+    if not waiter["event"].is_set():
+        with span("scheduler:wait", lane=lane):
+            while not waiter["event"].wait(SLOT_POLL_SECONDS if cancel is not None else None):
+                if cancel.is_set() and _withdraw(waiter):
+                    raise CancelledError("Generatie geannuleerd.")
+    try:
+        yield
+    finally:
+        _release(session)
+
+
+def _quantile(samples, q):
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+def scheduler_stats():
+    with SCHEDULER_LOCK:
+        stats = {
+            "capacity": MODEL_CONCURRENCY,
+            "running": _running_total(),
+            "sessions": len(SCHEDULER["running"]),
+            "withdrawn": SCHEDULER["withdrawn"],
+        }
+        for lane in LANES:
+            waits = sorted(SCHEDULER["waits"][lane])
+            stats[lane] = {
+                "queued": sum(len(waiters) for waiters in SCHEDULER["queues"][lane].values()),
+                "granted": SCHEDULER["granted"][lane],
+                "wait_p50": _quantile(waits, 0.5),
+                "wait_p90": _quantile(waits, 0.9),
+            }
+    return stats
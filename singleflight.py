@@ -0,0 +1,81 @@
+import threading
+from concurrent.futures import CancelledError, Future
+from contextlib import contextmanager
+
+from tracing import span
+
+INFLIGHT = {}
+FLIGHT_STATS = {"calls": 0, "leaders": 0, "shared": 0}
+FLIGHT_LOCK = threading.Lock()
+FLIGHT_POLL_SECONDS = 0.25
+
+_local = threading.local()
+
+
+@contextmanager
+def singleflight_bypass():
+    previous = getattr(_local, "bypass", False)
+    _local.bypass = True
+    try:
+        yield
+    finally:
+        _local.bypass = previous
+
+
+def bypassing(call):
+    def run():
+        with singleflight_bypass():
+            return call()
+
+    return run
+
+
+def _follow(flight, cancel):
+    while True:
+        try:
+            return flight.result(timeout=FLIGHT_POLL_SECONDS if cancel is not None else None)
+        except TimeoutError:
+            if cancel.is_set():
+                raise CancelledError("Generatie geannuleerd.")
+
+
+def singleflight(key, call, cancel=None):
+    if getattr(_local, "bypass", False):
+        return call()
+    while True:
+        with FLIGHT_LOCK:
+            FLIGHT_STATS["calls"] += 1
+            flight = INFLIGHT.get(key)
+            leader = flight is None
+            if leader:
+                flight = Future()
+                INFLIGHT[key] = flight
+                FLIGHT_STATS["leaders"] += 1
+            else:
+                FLIGHT_STATS["shared"] += 1
+        if leader:
+            break
+        try:
+            with span("singleflight:wait", key=key[:12]):
+                return _follow(flight, cancel)
+        except CancelledError:
+            if cancel is not None and cancel.is_set():
+                raise
+    try:
+        result = call()
+    except BaseException as exc:
+        flight.set_exception(exc)
+        raise
+    else:
+        flight.set_result(result)
+        return result
+    finally:
+        with FLIGHT_LOCK:
+            INFLIGHT.pop(key, None)
+
+
+def flight_stats():
+    with FLIGHT_LOCK:
+        stats = dict(FLIGHT_STATS)
+        stats["inflight"] = len(INFLIGHT)
+    return stats
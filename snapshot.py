@@ -0,0 +1,83 @@
+import gzip
+import io
+import json
+from datetime import datetime
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_EXTENSION = "plsnap"
+SNAPSHOT_FIELDS = (
+    "topic",
+    "author",
+    "short_title",
+    "subject_scan",
+    "subject_scan_selected",
+    "subject_scan_approved",
+    "storyline",
+    "storyline_approved",
+    "index_data",
+    "sources_by_number",
+    "front_matter",
+)
+
+
+def _line(record):
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+def dump_snapshot(state):
+    patterns = state.get("patterns") or {}
+    numbers = sorted(patterns)
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb", mtime=0) as f:
+        f.write(
+            _line(
+                {
+                    "kind": "header",
+                    "version": SNAPSHOT_VERSION,
+                    "created": datetime.now().isoformat(timespec="seconds"),
+                    "patterns": numbers,
+                }
+            )
+        )
+        f.write(_line({"kind": "state", **{field: state.get(field) for field in SNAPSHOT_FIELDS}}))
+        for number in numbers:
+            f.write(_line({"kind": "pattern", "number": number, "pattern": patterns[number]}))
+    return buffer.getvalue()
+
+
+def iter_snapshot(data):
+    with gzip.GzipFile(fileobj=io.BytesIO(data), mode="rb") as f:
+        for raw in f:
+            if raw.strip():
+                yield json.loads(raw)
+
+
+def read_snapshot_header(data):
+    try:
+        header = next(iter_snapshot(data))
+    except (OSError, EOFError, StopIteration, ValueError) as exc:
+        raise RuntimeError(f"Snapshot kan niet worden gelezen: {exc}") from exc
+    if header.get("kind") != "header":
+        raise RuntimeError("Snapshot mist een header.")
+    if header.get("version") != SNAPSHOT_VERSION:
+        raise RuntimeError(f"Snapshot-versie {header.get('version')} wordt niet ondersteund.")
+    return header
+
+
+def load_snapshot(data):
+    read_snapshot_header(data)
+    state = {}
+    patterns = {}
+    try:
+        for record in iter_snapshot(data):
+            if record["kind"] == "state":
+                state = {field: record.get(field) for field in SNAPSHOT_FIELDS}
+            elif record["kind"] == "pattern":
+                patterns[record["number"]] = record["pattern"]
+    except (OSError, EOFError, KeyError, ValueError) as exc:
+        raise RuntimeError(f"Snapshot kan niet worden gelezen: {exc}") from exc
+    state["sources_by_number"] = {
+        int(number): sources for number, sources in (state.get("sources_by_number") or {}).items()
+    }
+    state["patterns"] = patterns
+    return state
@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+SPOOL_ROOT = os.path.join(tempfile.gettempdir(), "pattern_language_spool")
+SPOOL_DIR = os.path.join(SPOOL_ROOT, f"spool-{os.getpid()}")
+SPOOL_SESSION_QUOTA_BYTES = 64 * 1024 * 1024
+SPOOL_TOTAL_BYTES = 2 * 1024 * 1024 * 1024
+
+ENTRIES = OrderedDict()
+SPOOL_LOCK = threading.Lock()
+_prepared = False
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def _prepare():
+    global _prepared
+    if _prepared:
+        return
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    for name in os.listdir(SPOOL_ROOT):
+        if not name.startswith("spool-") or name == os.path.basename(SPOOL_DIR):
+            continue
+        try:
+            pid = int(name.split("-", 1)[1])
+        except ValueError:
+            continue
+        if not _pid_alive(pid):
+            shutil.rmtree(os.path.join(SPOOL_ROOT, name), ignore_errors=True)
+    _prepared = True
+
+
+def _evict(path):
+    ENTRIES.pop(path, None)
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _enforce_limits(session_id, keep_path):
+    session_paths = [path for path, entry in ENTRIES.items() if entry["session"] == session_id]
+    session_total = sum(ENTRIES[path]["size"] for path in session_paths)
+    for path in session_paths:
+        if session_total <= SPOOL_SESSION_QUOTA_BYTES:
+            break
+        if path == keep_path:
+            continue
+        session_total -= ENTRIES[path]["size"]
+        _evict(path)
+    total = sum(entry["size"] for entry in ENTRIES.values())
+    for path in list(ENTRIES):
+        if total <= SPOOL_TOTAL_BYTES:
+            break
+        if path == keep_path:
+            continue
+        total -= ENTRIES[path]["size"]
+        _evict(path)
+
+
+def spool_put(session_id, name, data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    with SPOOL_LOCK:
+        _prepare()
+        session_dir = os.path.join(SPOOL_DIR, session_id)
+        os.makedirs(session_dir, exist_ok=True)
+        path = os.path.join(session_dir, name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        ENTRIES.pop(path, None)
+        ENTRIES[path] = {"session": session_id, "size": len(data)}
+        _enforce_limits(session_id, path)
+    return {"path": path, "name": name, "size": len(data)}
+
+
+def spool_exists(handle):
+    if not handle:
+        return False
+    with SPOOL_LOCK:
+        return handle["path"] in ENTRIES and os.path.exists(handle["path"])
+
+
+def spool_open(handle):
+    with SPOOL_LOCK:
+        if handle["path"] not in ENTRIES:
+            raise FileNotFoundError(handle["name"])
+        ENTRIES.move_to_end(handle["path"])
+    return open(handle["path"], "rb")
+
+
+def spool_read(handle):
+    with spool_open(handle) as f:
+        return f.read()
+
+
+def spool_read_text(handle):
+    return spool_read(handle).decode("utf-8")
+
+
+def spool_drop_session(session_id):
+    with SPOOL_LOCK:
+        for path in [path for path, entry in ENTRIES.items() if entry["session"] == session_id]:
+            _evict(path)
+
+
+def spool_usage():
+    with SPOOL_LOCK:
+        sessions = {entry["session"] for entry in ENTRIES.values()}
+        return {
+            "files": len(ENTRIES),
+            "sessions": len(sessions),
+            "bytes": sum(entry["size"] for entry in ENTRIES.values()),
+        }
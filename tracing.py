@@ -0,0 +1,147 @@
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+TRACE_DIR = os.path.join(tempfile.gettempdir(), "pattern_language_traces")
+TRACE_MAX_FILES = 20
+
+_local = threading.local()
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+def attach_trace(trace):
+    _local.trace = trace
+
+
+def start_trace(name):
+    trace = {
+        "name": name,
+        "origin": time.perf_counter(),
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "events": [],
+        "threads": {},
+        "lock": threading.Lock(),
+    }
+    attach_trace(trace)
+    return trace
+
+
+def stop_trace():
+    trace = current_trace()
+    attach_trace(None)
+    return trace
+
+
+def _record(trace, name, begin, end, args):
+    thread = threading.current_thread()
+    with trace["lock"]:
+        trace["threads"].setdefault(thread.ident, thread.name)
+        trace["events"].append(
+            {
+                "name": name,
+                "ts": (begin - trace["origin"]) * 1e6,
+                "dur": (end - begin) * 1e6,
+                "tid": thread.ident,
+                "args": args,
+            }
+        )
+
+
+@contextmanager
+def span(name, **args):
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        yield
+        return
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(trace, name, begin, time.perf_counter(), args)
+
+
+def traced(func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        trace = getattr(_local, "trace", None)
+        if trace is None:
+            return func(*args, **kwargs)
+        begin = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _record(trace, func.__name__, begin, time.perf_counter(), {})
+
+    return wrapper
+
+
+def chrome_trace(trace):
+    pid = os.getpid()
+    events = [
+        {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+        for tid, name in trace["threads"].items()
+    ]
+    events.extend(
+        {
+            "name": event["name"],
+            "ph": "X",
+            "pid": pid,
+            "tid": event["tid"],
+            "ts": round(event["ts"], 1),
+            "dur": round(event["dur"], 1),
+            "args": {key: str(value) for key, value in event["args"].items()},
+        }
+        for event in trace["events"]
+    )
+    return json.dumps(
+        {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"trace": trace["name"], "started": trace["started"]}},
+        ensure_ascii=False,
+    )
+
+
+def write_chrome_trace(trace):
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    path = os.path.join(
+        TRACE_DIR, f"{trace['name']}-{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}-{os.getpid()}.json"
+    )
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(chrome_trace(trace))
+    traces = sorted(
+        (os.path.join(TRACE_DIR, name) for name in os.listdir(TRACE_DIR) if name.endswith(".json")),
+        key=os.path.getmtime,
+    )
+    for old_path in traces[:-TRACE_MAX_FILES]:
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass
+    return path
+
+
+def timeline_rows(trace):
+    rows = []
+    open_spans = {}
+    lanes = {tid: i for i, tid in enumerate(trace["threads"])}
+    for event in sorted(trace["events"], key=lambda e: (e["ts"], -e["dur"])):
+        stack = open_spans.setdefault(event["tid"], [])
+        while stack and stack[-1] <= event["ts"]:
+            stack.pop()
+        rows.append(
+            {
+                "span": event["name"],
+                "lane": f"thread {lanes.get(event['tid'], 0)} · niveau {len(stack)}",
+                "start_ms": round(event["ts"] / 1000, 2),
+                "end_ms": round((event["ts"] + event["dur"]) / 1000, 2),
+                "duur_ms": round(event["dur"] / 1000, 2),
+            }
+        )
+        stack.append(event["ts"] + event["dur"])
+    return rows